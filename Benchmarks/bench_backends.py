@@ -0,0 +1,248 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+"""Measures every backend against Testing/fake_ircd.py over loopback: how many
+messages a second it takes in, the p50 and p99 time from the server sending
+a line to it being dispatched, and the CPU and peak RSS that cost.  Each
+backend runs in a process of its own, under each interpreter given, so their
+numbers don't bleed into each other.
+
+    python Benchmarks/bench_backends.py [--messages N] [--rate N]
+        [--python INTERPRETER ...] [--save FILE] [--baseline FILE]
+
+With --baseline, any backend whose throughput fell (or p99 latency grew) by
+more than --tolerance against the saved run is reported, and the exit status
+is 1.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Testing.fake_ircd import FakeIRCd
+
+
+## Backends to measure.  New ones only need a driver in DRIVERS
+BACKENDS = ("sockselect", "asyncore", "asyncio")
+
+## Exit status of a child that couldn't import its backend
+UNAVAILABLE = 3
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def drive_polling(module, port, bench, timeout, on_privmsg, done):
+    """Runs a backend with a poll method until done says to stop"""
+    member = module.IRC_member("bench")
+    member.dispatcher.register("PRIVMSG", on_privmsg)
+    if member.join_server("127.0.0.1", port):
+        raise RuntimeError("Couldn't connect to the fake ircd")
+    member.send_server_message("127.0.0.1", bench)
+    deadline = time.time() + timeout
+    while not done() and time.time() < deadline:
+        member.poll(.1)
+    member.leave_server("127.0.0.1")
+    
+    
+def drive_asyncio(module, port, bench, timeout, on_privmsg, done):
+    import asyncio
+    loop = asyncio.get_event_loop()
+    finished = asyncio.Event()
+    
+    def handler(hostname, message):
+        on_privmsg(hostname, message)
+        if done():
+            finished.set()
+        return True
+        
+    member = module.IRC_member("bench")
+    member.dispatcher.register("PRIVMSG", handler)
+    if loop.run_until_complete(member.join_server("127.0.0.1", port)):
+        raise RuntimeError("Couldn't connect to the fake ircd")
+    loop.run_until_complete(member.send_server_message("127.0.0.1", bench))
+    try:
+        loop.run_until_complete(asyncio.wait_for(finished.wait(), timeout))
+    except asyncio.TimeoutError:
+        pass
+    loop.run_until_complete(member.close())
+    
+    
+# This is a mapping of backend to (module, driver)
+DRIVERS = {
+    "sockselect": ("IRC_sockselect", drive_polling),
+    "asyncore": ("IRC_sockasyncore", drive_polling),
+    "asyncio": ("IRC_asyncio", drive_asyncio),
+}
+
+
+def child(backend, port, messages, rate, timeout):
+    """Measures one backend in this process and prints the result as JSON"""
+    import resource
+    
+    module_name, driver = DRIVERS[backend]
+    try:
+        module = __import__(module_name)
+    except (ImportError, SyntaxError):
+        sys.exit(UNAVAILABLE)
+        
+    latencies = []
+    
+    def on_privmsg(hostname, message):
+        received = time.time()
+        sent = message.params[-1].rpartition(" ")[2]
+        latencies.append(received - float(sent))
+        return True
+        
+    def done():
+        return len(latencies) >= messages
+        
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.time()
+    driver(module, port, "BENCH {} {}".format(messages, rate), timeout,
+           on_privmsg, done)
+    elapsed = (latencies and time.time() - start) or float("nan")
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    
+    latencies.sort()
+    print(json.dumps({
+        "python": sys.version.split()[0],
+        "received": len(latencies),
+        "rate": len(latencies) / elapsed,
+        "p50": percentile(latencies, .5),
+        "p99": percentile(latencies, .99),
+        "cpu": (after.ru_utime - before.ru_utime + 
+                after.ru_stime - before.ru_stime),
+        ## ru_maxrss is in kilobytes on Linux
+        "rss": after.ru_maxrss / 1024.0,
+    }))
+    
+    
+def measure(python, backend, port, messages, rate, timeout):
+    """Runs backend under python.  Returns its result, or None if it isn't
+    available there
+    """
+    process = subprocess.Popen([python, os.path.abspath(__file__), 
+                                "--child", backend, "--port", str(port),
+                                "--messages", str(messages),
+                                "--rate", str(rate),
+                                "--timeout", str(timeout)],
+                               stdout=subprocess.PIPE, cwd=ROOT)
+    out, _ = process.communicate()
+    if process.returncode == UNAVAILABLE:
+        return None
+    if process.returncode:
+        raise RuntimeError("{} under {} exited with {}".format(
+            backend, python, process.returncode))
+    return json.loads(out.decode("utf-8").strip().splitlines()[-1])
+    
+    
+def regressions(results, baseline, tolerance):
+    """Names the results that are worse than baseline by more than
+    tolerance (a fraction)
+    """
+    worse = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        if result["rate"] < old["rate"] * (1 - tolerance):
+            worse.append("{}: {:.0f} messages/s, was {:.0f}".format(
+                key, result["rate"], old["rate"]))
+        if result["p99"] > old["p99"] * (1 + tolerance):
+            worse.append("{}: p99 {:.2f} ms, was {:.2f}".format(
+                key, result["p99"] * 1e3, old["p99"] * 1e3))
+    return worse
+    
+    
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--rate", type=float, default=0,
+                        help="lines a second the server sends (0 is flat out)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--python", action="append", dest="pythons",
+                        help="interpreter to run the backends under "
+                             "(repeatable, defaults to this one)")
+    parser.add_argument("--backend", action="append", dest="backends",
+                        choices=BACKENDS)
+    parser.add_argument("--save", metavar="FILE")
+    parser.add_argument("--baseline", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=.1)
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        child(args.child, args.port, args.messages, args.rate, args.timeout)
+        return 0
+        
+    ircd = FakeIRCd()
+    ircd.start()
+    results = {}
+    print("{:>11} {:>8} {:>10} {:>12} {:>9} {:>9} {:>8} {:>8}".format(
+        "backend", "python", "received", "messages/s", "p50 (ms)", 
+        "p99 (ms)", "cpu (s)", "rss (MB)"))
+    try:
+        for python in args.pythons or [sys.executable]:
+            for backend in args.backends or BACKENDS:
+                result = measure(python, backend, ircd.port, args.messages,
+                                 args.rate, args.timeout)
+                if result is None:
+                    print("{:>11} {:>8}   unavailable under {}".format(
+                        backend, "-", python))
+                    continue
+                results["{} {}".format(backend, result["python"])] = result
+                print("{:>11} {:>8} {:>10} {:>12.0f} {:>9.2f} {:>9.2f} "
+                      "{:>8.2f} {:>8.1f}".format(
+                          backend, result["python"], result["received"],
+                          result["rate"], result["p50"] * 1e3,
+                          result["p99"] * 1e3, result["cpu"], result["rss"]))
+    finally:
+        ircd.stop()
+        
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            worse = regressions(results, json.load(f), args.tolerance)
+        for line in worse:
+            print("REGRESSION " + line)
+        return 1 if worse else 0
+    return 0
+    
+    
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+"""Runs IRC_client.py's whole window headlessly while threads standing in
+for busy servers put messages on an IRC_bridge.EventQueue, and measures
+each frame, including the events drained in it:
+
+    KIVY_GL_BACKEND=mock python Benchmarks/bench_bridge.py [servers] [lines/s each] [seconds]
+
+Each thread parses its lines as the network thread would.  Frames are
+started every 16.7 ms, as at 60 fps, and a frame taking longer than that
+is slow.
+"""
+
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kivy.config import Config
+Config.set("graphics", "maxfps", "0")
+
+from kivy.base import EventLoop
+from kivy.core.window import Window
+from kivy.lang import Builder
+
+from IRC_bridge import EventQueue
+from IRC_client import FRAME_BUDGET, IRC_Widget
+from IRC_message import parse
+
+
+FPS = 60
+CHANNELS = 5
+LINE = ":nick{0}!user@host PRIVMSG #chan{1} :message number {0} with a " \
+       "few words in it"
+
+
+def server(hostname, rate, seconds, events):
+    """Puts rate messages a second on events, in ticks of 10 ms"""
+    put = events.put
+    per_tick = max(1, rate // 100)
+    sent = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        for _ in range(per_tick):
+            message = parse(LINE.format(sent, sent % CHANNELS))
+            put(("message", hostname, message.params[0], message))
+            sent += 1
+        time.sleep(.01)
+
+
+def main(servers, rate, seconds):
+    Builder.load_file(os.path.join(ROOT, "irc_client.kv"))
+    EventLoop.ensure_window()
+    Window.size = (1024, 768)
+    widget = IRC_Widget(size=Window.size)
+    Window.add_widget(widget)
+    EventLoop.idle()
+    
+    events = EventQueue()
+    handled = [0]
+    
+    def handle(event):
+        handled[0] += 1
+        widget.handle_event(event)
+    
+    threads = [threading.Thread(target=server, 
+                                args=("server{}".format(i), rate, seconds, 
+                                      events))
+               for i in range(servers)]
+    for thread in threads:
+        thread.start()
+        
+    times = []
+    backlog = 0
+    while any(thread.is_alive() for thread in threads):
+        start = time.time()
+        events.drain(handle, FRAME_BUDGET)
+        EventLoop.idle()
+        took = time.time() - start
+        times.append(took)
+        backlog = max(backlog, len(events))
+        time.sleep(max(0, 1.0 / FPS - took))
+        
+    times.sort()
+    print("{:>8} {:>8} {:>10} {:>10} {:>10} {:>8} {:>9} {:>8}".format(
+        "servers", "lines/s", "p50 (ms)", "p99 (ms)", "max (ms)", "slow", 
+        "backlog", "dropped"))
+    print("{:>8} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>8} {:>9} {:>8}".format(
+        servers, rate, times[len(times) // 2] * 1e3, 
+        times[int(len(times) * .99)] * 1e3, times[-1] * 1e3,
+        sum(1 for frame in times if frame > 1.0 / FPS), backlog, 
+        events.dropped))
+    print("{} of {} events shown in {} frames".format(
+        handled[0], handled[0] + len(events), len(times)))
+    
+    
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 5)
@@ -0,0 +1,114 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+"""Pushes lines into a Channel tab of IRC_client.py at a steady rate and
+measures how long each frame takes, next to keeping the same scrollback as
+the text of a single Label.  Runs without a display:
+
+    KIVY_GL_BACKEND=mock python Benchmarks/bench_chat_pane.py [lines/s] [seconds]
+
+(or under xvfb-run).  Frames aren't capped, so the times are the work done
+per frame; at 60 fps there are 16.7 ms to spend.
+"""
+
+from collections import deque
+import os
+import sys
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kivy.config import Config
+Config.set("graphics", "maxfps", "0")
+
+from kivy.base import EventLoop
+from kivy.core.window import Window
+from kivy.lang import Builder
+from kivy.uix.label import Label
+
+from IRC_client import Channel, Chat_Window
+
+
+FPS = 60
+SCROLLBACK = 1000
+LINE = ":nick{} PRIVMSG #chan :message number {} with a few words in it"
+
+
+def frames(rate, seconds, add_line):
+    """Frame times (in seconds) over seconds of rate lines a second"""
+    per_frame = rate // FPS
+    times = []
+    sent = 0
+    for _ in range(seconds * FPS):
+        for _ in range(per_frame):
+            add_line(LINE.format(sent % 50, sent))
+            sent += 1
+        start = time.time()
+        EventLoop.idle()
+        times.append(time.time() - start)
+    return times
+
+
+def report(name, times):
+    times = sorted(times)
+    print("{:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>8}".format(
+        name, times[len(times) // 2] * 1e3, 
+        times[int(len(times) * .99)] * 1e3, times[-1] * 1e3,
+        sum(1 for frame in times if frame > 1.0 / FPS)))
+
+
+def main(rate, seconds):
+    Builder.load_file(os.path.join(ROOT, "irc_client.kv"))
+    EventLoop.ensure_window()
+    Window.size = (1024, 768)
+    
+    print("{:>8} {:>10} {:>10} {:>10} {:>8}".format(
+        "pane", "p50 (ms)", "p99 (ms)", "max (ms)", "slow"))
+    
+    chat_window = Chat_Window(size=Window.size)
+    Window.add_widget(chat_window)
+    channel = chat_window.channel("bench", "#bench")
+    report("recycle", frames(rate, seconds, channel.add_line))
+    Window.remove_widget(chat_window)
+    
+    label = Label(text="", size=Window.size, text_size=(Window.width, None))
+    Window.add_widget(label)
+    
+    lines = deque(maxlen=SCROLLBACK)
+    
+    def append(line):
+        ## The same scrollback as the pane, or this would never finish
+        lines.append(line)
+        label.text = "\n".join(lines)
+    report("label", frames(rate, seconds, append))
+    Window.remove_widget(label)
+    
+    
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -0,0 +1,112 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+"""Measures how long one tick of IRC_sockselect's event loop takes as the
+number of connections grows, next to the old select + dummy.Pool tick.
+
+    python Benchmarks/bench_event_loop.py [connections ...]
+"""
+
+from functools import partial
+from multiprocessing import dummy
+import os
+import select
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import IRC_sockselect as IRC
+
+
+ACTIVE = 10
+TICKS = 200
+LINE = ":nick!user@host PRIVMSG #chan :hello there\r\n"
+
+
+def connect(member, count):
+    """Registers count socketpairs with member, returning the far ends"""
+    peers = []
+    for i in range(count):
+        ours, theirs = socket.socketpair()
+        ours.settimeout(2)
+        hostname = "server{}".format(i)
+        member.servers[hostname] = ours
+        member.serv_to_chan[hostname] = []
+        member._watch(hostname, ours)
+        peers.append(theirs)
+    return peers
+
+
+def legacy_tick(member, buff_size=4096):
+    """The receive_all_messages tick from before the selector was added"""
+    ready, _, _ = select.select(list(member.servers.values()), [], [], 5)
+    for i in range(len(ready)):
+        for host, sock in member.servers.items():
+            if sock == ready[i]:
+                ready[i] = host
+    pool = dummy.Pool()
+    pool.map(partial(member.read_ready, bsize=buff_size), ready)
+    pool.close()
+
+
+def measure(tick, member, peers):
+    timings = []
+    active = peers[:ACTIVE]
+    for _ in range(TICKS):
+        for peer in active:
+            peer.send(LINE)
+        start = time.time()
+        tick(member)
+        timings.append(time.time() - start)
+        member.replies = {}
+    timings.sort()
+    return (sum(timings) / len(timings),
+            timings[len(timings) // 2],
+            timings[int(len(timings) * .99)])
+
+
+def main(sizes):
+    print("{:>12} {:>8} {:>12} {:>12} {:>12}".format(
+        "connections", "loop", "mean (us)", "p50 (us)", "p99 (us)"))
+    for size in sizes:
+        for name, tick in (("selector", lambda m: m.poll(5)),
+                           ("legacy", legacy_tick)):
+            member = IRC.IRC_member("bench")
+            peers = connect(member, size)
+            mean, p50, p99 = measure(tick, member, peers)
+            print("{:>12} {:>8} {:>12.1f} {:>12.1f} {:>12.1f}".format(
+                size, name, mean * 1e6, p50 * 1e6, p99 * 1e6))
+            for hostname, sock in list(member.servers.items()):
+                member._unwatch(hostname)
+                sock.close()
+            member.servers = {}
+            for peer in peers:
+                peer.close()
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1, 10, 100, 250])
@@ -0,0 +1,100 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+"""Measures what a log call costs the thread making it: eager str.format
+next to lazy %-style arguments and an isEnabledFor guard when the level is
+off, and a FileHandler next to IRC_logging's queue when it is on.
+
+    python Benchmarks/bench_logging.py [calls]
+"""
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import IRC_logging
+
+
+MESSAGE = "PRIVMSG #channel :hello there everyone"
+
+
+def eager(log):
+    log.info("Failed to send message {}".format(MESSAGE))
+
+
+def lazy(log):
+    log.info("Failed to send message %s", MESSAGE)
+
+
+def guarded(log):
+    if log.isEnabledFor(logging.INFO):
+        log.info("Failed to send message %s", MESSAGE)
+
+
+def measure(label, call, log, calls):
+    start = time.time()
+    for _ in range(calls):
+        call(log)
+    elapsed = time.time() - start
+    print("{:<28} {:>10.2f}".format(label, elapsed / calls * 1e6))
+
+
+def main(calls):
+    directory = tempfile.mkdtemp()
+    try:
+        print("{:<28} {:>10}".format("", "us/call"))
+        log = logging.getLogger("bench_logging")
+        log.propagate = False
+        
+        log.setLevel(logging.WARNING)
+        log.addHandler(logging.NullHandler())
+        for label, call in (("disabled, eager format", eager),
+                            ("disabled, lazy args", lazy),
+                            ("disabled, isEnabledFor", guarded)):
+            measure(label, call, log, calls)
+            
+        log.handlers = []
+        log.setLevel(logging.INFO)
+        handler = logging.FileHandler(os.path.join(directory, "direct.log"))
+        log.addHandler(handler)
+        measure("enabled, FileHandler", lazy, log, calls // 10)
+        log.removeHandler(handler)
+        handler.close()
+        
+        IRC_logging.configure(os.path.join(directory, "queued.log"),
+                              logger="bench_logging")
+        measure("enabled, QueueHandler", lazy, log, calls // 10)
+        IRC_logging.shutdown()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else 200000)
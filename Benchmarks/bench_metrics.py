@@ -0,0 +1,96 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+"""Measures what IRC_metrics costs IRC_sockselect's receive path: the same
+stream of lines is read with no Metrics attached, with one attached, and
+with the sampling profiler running as well.
+
+    python Benchmarks/bench_metrics.py [lines]
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import IRC_sockselect as IRC
+from IRC_metrics import Metrics
+
+
+LINE = b":nick!user@host PRIVMSG #chan :hello there, how is everyone\r\n"
+ROUNDS = 5
+
+
+def measure(lines, metrics=None, profile=False):
+    """Seconds to take in lines PRIVMSGs, best of ROUNDS"""
+    best = None
+    for _ in range(ROUNDS):
+        member = IRC.IRC_member("bench", scrollback=100)
+        if metrics is not None:
+            metrics.attach(member)
+            if profile:
+                metrics.profile(interval=.01)
+        ours, theirs = socket.socketpair()
+        member.servers["server"] = ours
+        member.serv_to_chan["server"] = set()
+        member._watch("server", ours)
+        
+        data = LINE * lines
+        writer = threading.Thread(target=theirs.sendall, args=(data,))
+        writer.start()
+        start = time.time()
+        while ("server" not in member.replies or 
+               member.replies["server"].next_seq < lines):
+            member.read_ready("server", 65536)
+        elapsed = time.time() - start
+        writer.join()
+        
+        if metrics is not None:
+            metrics.profile(False)
+            metrics.detach(member)
+        member._unwatch("server")
+        ours.close()
+        theirs.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+    
+    
+def main(lines):
+    baseline = measure(lines)
+    print("{:>24} {:>10} {:>10}".format("", "lines/s", "overhead"))
+    for name, metrics, profile in (("no metrics", None, False),
+                                   ("metrics", Metrics(), False),
+                                   ("metrics + profiler", Metrics(), True)):
+        elapsed = baseline if metrics is None else measure(lines, metrics,
+                                                           profile)
+        print("{:>24} {:>10.0f} {:>9.1f}%".format(
+            name, lines / elapsed, (elapsed / baseline - 1) * 100))
+        
+        
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
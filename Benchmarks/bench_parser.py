@@ -0,0 +1,81 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+
+"""Measures how many lines per second IRC_message can parse, and parse and
+dispatch, on a single core.  The target is 1,000,000 short lines/s.
+Lines are bytes, as IRC_framing hands them over.
+
+    python Benchmarks/bench_parser.py [lines]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import IRC_message as IRC
+
+
+TARGET = 1000000
+SAMPLE = [
+    "PING :irc.server.net",
+    ":nick!ident@host.example PRIVMSG #channel :hello there everyone",
+    ":other!ident@host.example JOIN #channel",
+    ":irc.server.net 353 me = #channel :a b c d e f g",
+    ":nick!ident@host.example PART #channel :bye",
+    "@time=2014-01-01T00:00:00.000Z :nick!i@h PRIVMSG #channel :tagged",
+    ":irc.server.net 001 me :Welcome to the network",
+    ":nick!ident@host.example QUIT :Ping timeout",
+]
+
+
+def run(label, func, lines):
+    start = time.time()
+    for line in lines:
+        func(line)
+    elapsed = time.time() - start
+    rate = len(lines) / elapsed
+    print("{:>20} {:>12.0f} lines/s {:>7.1%} of target".format(
+        label, rate, rate / TARGET))
+
+
+def main(count):
+    ## As LineFramer hands them over
+    lines = [line.encode("utf-8") for line in 
+             (SAMPLE * (count // len(SAMPLE) + 1))[:count]]
+    parse = IRC.parse
+    dispatcher = IRC.Dispatcher({"PING": lambda host, message: True,
+                                 "PRIVMSG": lambda host, message: None})
+    dispatch = dispatcher.dispatch
+
+    run("split (baseline)", bytes.split, lines)
+    run("parse", parse, lines)
+    run("parse + dispatch", lambda line: dispatch("host", parse(line)), lines)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
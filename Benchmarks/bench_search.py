@@ -0,0 +1,121 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+"""Builds an IRC_search.SearchIndex over a synthetic corpus and measures how
+fast messages are indexed, how big the posting lists get and how long
+queries take, both to the first result and to the last.
+
+    python Benchmarks/bench_search.py [messages]
+"""
+
+from bisect import bisect_left
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from IRC_search import SearchIndex
+
+
+VOCABULARY = 20000
+NICKS = 2000
+CHANNELS = 200
+WORDS_PER_MESSAGE = 8
+
+
+def corpus(messages, seed=1):
+    """Messages with Zipf-ish word frequencies, one a second"""
+    rng = random.Random(seed)
+    ## Word n is picked about 1/n as often as the first
+    words = ["w{}".format(n) for n in range(VOCABULARY)]
+    weights = [1.0 / (n + 1) for n in range(VOCABULARY)]
+    total = sum(weights)
+    cumulative = []
+    running = 0.0
+    for weight in weights:
+        running += weight / total
+        cumulative.append(running)
+    pick = lambda: words[min(bisect_left(cumulative, rng.random()), 
+                             VOCABULARY - 1)]
+    for i in range(messages):
+        yield ("#chan{}".format(rng.randrange(CHANNELS)),
+               "nick{}".format(rng.randrange(NICKS)),
+               " ".join(pick() for _ in range(WORDS_PER_MESSAGE)),
+               1000000.0 + i)
+
+
+def timed(query):
+    start = time.time()
+    results = iter(query())
+    first = next(results, None)
+    latency = time.time() - start
+    total = (0 if first is None else 1) + sum(1 for _ in results)
+    return latency, time.time() - start, total
+
+
+def main(messages):
+    index = SearchIndex()
+    documents = list(corpus(messages))
+    
+    start = time.time()
+    for chan_name, nick, text, timestamp in documents:
+        index.add_text("net", chan_name, nick, text, 0, timestamp)
+    elapsed = time.time() - start
+    print("indexed {} messages in {:.1f}s ({:.0f} messages/s)".format(
+        messages, elapsed, messages / elapsed))
+    
+    postings = sum(len(posting.data) for table in 
+                   (index.words, index.nicks, index.channels)
+                   for posting in table.values())
+    entries = sum(len(posting) for table in 
+                  (index.words, index.nicks, index.channels)
+                  for posting in table.values())
+    print("posting lists: {:.1f} MB for {} entries ({:.2f} bytes each)".format(
+        postings / 1e6, entries, float(postings) / entries))
+    
+    middle = 1000000.0 + messages // 2
+    queries = [
+        ("common word", lambda: index.ids("w0")),
+        ("rare word", lambda: index.ids("w19000")),
+        ("two words", lambda: index.ids("w5 w50")),
+        ("nick", lambda: index.ids(nick="nick7")),
+        ("word in channel", lambda: index.ids("w3", 
+                                              channel=("net", "#chan7"))),
+        ("nick, last hour", lambda: index.ids(nick="nick7", 
+                                              start=middle, 
+                                              end=middle + 3600)),
+    ]
+    print("{:<18} {:>12} {:>12} {:>10}".format("query", "first (ms)", 
+                                               "all (ms)", "results"))
+    for label, query in queries:
+        first, total, results = timed(query)
+        print("{:<18} {:>12.3f} {:>12.1f} {:>10}".format(
+            label, first * 1e3, total * 1e3, results))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else 2000000)
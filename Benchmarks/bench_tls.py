@@ -0,0 +1,125 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+
+"""Times full TLS handshakes against ones resuming the last session, with a
+loopback Testing/fake_ircd.py speaking TLS, stepping each handshake the
+way IRC_sockselect's event loop does:
+
+    python Benchmarks/bench_tls.py [handshakes]
+
+Resumption needs Python 3.6 or later; older ones only time full handshakes.
+"""
+
+import os
+import select
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from IRC_tls import RESUMPTION, TLS, WANT_READ
+from Testing.fake_ircd import CERTFILE, FakeIRCd, tls_context
+
+
+HOSTNAME = "localhost"
+
+
+def handshake(tls, port):
+    """Connects and shakes hands, returning the socket and the seconds the
+    handshake took
+    """
+    sock = socket.create_connection((HOSTNAME, port))
+    start = time.time()
+    sock = tls.wrap(sock, HOSTNAME, port)
+    sock.setblocking(False)
+    while True:
+        want = tls.handshake(sock, HOSTNAME, port)
+        if not want:
+            break
+        if want == WANT_READ:
+            select.select([sock], [], [], 5)
+        else:
+            select.select([], [sock], [], 5)
+    return sock, time.time() - start
+
+
+def register(tls, sock, port):
+    """Logs in and waits for the welcome, by when a TLS 1.3 server has sent
+    the session tickets to save
+    """
+    sock.settimeout(5)
+    sock.sendall(b"NICK bench\r\nUSER bench 0 * :bench\r\n")
+    data = b""
+    while b" 001 " not in data:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    tls.save(sock, HOSTNAME, port)
+    sock.sendall(b"QUIT\r\n")
+    sock.close()
+
+
+def measure(tls, port, count, resume):
+    timings = []
+    for _ in range(count):
+        if not resume:
+            tls.forget(HOSTNAME, port)
+        sock, elapsed = handshake(tls, port)
+        timings.append(elapsed)
+        register(tls, sock, port)
+    timings.sort()
+    return (sum(timings) / len(timings),
+            timings[len(timings) // 2],
+            timings[int(len(timings) * .99)])
+
+
+def main(count):
+    ircd = FakeIRCd(tls=tls_context())
+    ircd.start()
+    try:
+        print("{:>10} {:>12} {:>12} {:>12} {:>10}".format(
+            "handshake", "mean (ms)", "p50 (ms)", "p99 (ms)", "resumed"))
+        kinds = [("full", False)]
+        if RESUMPTION:
+            kinds.append(("resumed", True))
+        for name, resume in kinds:
+            tls = TLS(cafile=CERTFILE)
+            ## Primes the cache, and is left out of the timings
+            register(tls, handshake(tls, ircd.port)[0], ircd.port)
+            tls.resumed = 0
+            mean, p50, p99 = measure(tls, ircd.port, count, resume)
+            print("{:>10} {:>12.2f} {:>12.2f} {:>12.2f} {:>10}".format(
+                name, mean * 1e3, p50 * 1e3, p99 * 1e3, tls.resumed))
+        if not RESUMPTION:
+            print("This ssl can't resume sessions (it needs Python 3.6)")
+    finally:
+        ircd.stop()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,411 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import asyncio
+import logging
+import socket
+import ssl
+
+from IRC_message import Dispatcher, LINE, PONG, USER, decode, parse
+from IRC_scrollback import Scrollback
+from IRC_subscribe import Subscriptions
+
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+class IRC_member(object):
+    """Class to represnt an individual using IRC, storing (non-sensitive) 
+    information.  Every method that touches the network is a coroutine, so
+    one event loop can hold any number of connections
+    """
+    
+    def __init__(self, nick, **kwargs):
+        """Constructor for IRC_member.  Stores nickname, realname and ident
+        as well as info about servers and channels
+        """
+        
+        self.nick = nick
+        self.realname = nick
+        self.ident = nick
+        self.scrollback = 1000
+        
+        ## An IRC_tls.TLS to connect through, or None for plaintext.  Its
+        ## context is used, but asyncio has no way to hand a connection a
+        ## session to resume, so every handshake is a full one
+        self.tls = None
+        
+        for key, value in kwargs.items():
+            self.__dict__[key] = value
+            
+        # This is a mapping of server name to the StreamWriter being used
+        self.servers = {}
+        
+        # This is a mapping of server name to the task reading from it
+        self.readers = {}
+        
+        # These are the same as in IRC_sockselect.IRC_member
+        self.serv_to_chan = {}
+        self.serv_to_data = {}
+        
+        # Every parsed line is routed through this by its command
+        self.dispatcher = Dispatcher({"PING": self._on_ping})
+        
+        # The same as in IRC_sockselect.IRC_member
+        self.subscriptions = Subscriptions()
+        
+        # These are the same as in IRC_sockselect.IRC_member
+        self.replies = {}
+        self.cursors = {}
+        
+        ## See replied
+        self._replied = None
+        self._replied_loop = None
+        
+    @property
+    def replied(self):
+        """An asyncio.Event set whenever a reply is stored.  Up to Python
+        3.9 an Event belongs to the loop that was current when it was made,
+        so it is made on first use from inside the loop (and again for a
+        new loop) rather than along with the member
+        """
+        loop = asyncio.get_event_loop()
+        if self._replied is None or self._replied_loop is not loop:
+            self._replied = asyncio.Event()
+            self._replied_loop = loop
+        return self._replied
+        
+    async def send_server_message(self, hostname, message): 
+        """Sends a message to a server"""
+        if hostname not in self.servers:
+            log.warning("No such server %s", hostname)
+            log.warning("Failed to send message %s", message)
+            return 1
+        
+        writer = self.servers[hostname]
+        try:
+            writer.write(LINE.format(message.rstrip()))
+            await writer.drain()
+        except OSError as e:
+            log.exception(e)
+            log.warning("Failed to send message %s", message)
+            return 2
+        else:
+            return 0
+        
+    async def send_channel_message(self, hostname, chan_name, message):
+        """Sends a message to a channel"""
+        if hostname not in self.servers:
+            log.warning("Not connected to server %s", hostname)
+            log.warning("Failed to send message %s", message)
+            return 1
+
+        elif chan_name not in self.serv_to_chan[hostname]:
+            log.warning("Not in channel %s", chan_name)
+            log.warning("Failed to send message %s", message)
+            return 2
+
+        elif await self.send_server_message(
+                hostname, "PRIVMSG {} :{}".format(chan_name, message.rstrip())):
+            return 3
+            
+        else:
+            return 0
+    
+    async def send_privmsg(self, hostname, username, message):
+        """Sends a private message to a user"""
+        if hostname not in self.servers:
+            log.warning("No such server %s", hostname)
+            log.warning("Failed to send message %s", message)
+            return 1
+        
+        elif await self.send_server_message(
+                hostname, "PRIVMSG {} :{}".format(username, message.rstrip())):
+            return 3
+            
+        else:
+            return 0
+            
+    async def ping_pong(self, writer, data):
+        """Pongs the server"""
+        try:
+            writer.write(PONG.format(data))
+            await writer.drain()
+        except OSError as e:
+            log.exception(e)
+            log.warning("Couldn't pong the server")
+            return 1
+        else:
+            return 0        
+        
+    async def join_server(self, hostname, port=6667, **kwargs):
+        """Joins a server.  The name is resolved on the loop's executor, so
+        other connections carry on while it is looked up
+        """
+        if hostname in self.servers:
+            log.warning("Already connected to %s", hostname)
+            return 0
+        
+        data = {}
+        for key, value in kwargs.items():
+            if key in self.__dict__:
+                data[key] = value
+            else:
+                log.info("key-value pair %s: %s unusued", key, value)
+        if data:
+            self.serv_to_data[hostname] = data
+            
+        nick = data.get("nick", self.nick)
+        ident = data.get("ident", self.ident)
+        realname = data.get("realname", self.realname)
+        tls = data.get("tls", self.tls)
+        
+        try:
+            if tls is not None:
+                reader, writer = await asyncio.open_connection(
+                    hostname, port, ssl=tls.context, server_hostname=hostname)
+            else:
+                reader, writer = await asyncio.open_connection(hostname, port)
+        
+        except socket.gaierror as e: ## couldn't resolve hostname
+            log.exception(e)
+            self.serv_to_data.pop(hostname, None)
+            return 1
+            
+        except (OSError, ssl.CertificateError) as e: ## ssl.SSLError is one
+            log.exception(e)
+            self.serv_to_data.pop(hostname, None)
+            return 2
+            
+        self.servers[hostname] = writer
+        self.serv_to_chan[hostname] = []
+        self.readers[hostname] = asyncio.ensure_future(
+            self._read_loop(hostname, reader, writer))
+        
+        if await self.send_server_message(hostname, "NICK {}".format(nick)):
+            return 2
+        try:
+            ## Written as it is, as the realname would keep the space
+            ## send_server_message puts on the end
+            writer.write(USER.format(ident, realname))
+            await writer.drain()
+        except OSError as e:
+            log.exception(e)
+            return 2
+            
+        log.info("Connected to %s on %s", hostname, port)
+        return 0
+        
+    async def leave_server(self, hostname):
+        """Leaves a server"""
+        if hostname not in self.servers:
+            log.warning("Not connected to %s", hostname)
+            return 0
+            
+        await self.send_server_message(hostname, "QUIT")
+        writer = self.servers.pop(hostname)
+        self.readers.pop(hostname).cancel()
+        self.serv_to_chan.pop(hostname, None)
+        self.serv_to_data.pop(hostname, None)
+        try:
+            writer.close()
+        except OSError as e:
+            log.exception(e)
+            log.warning("Failed to leave server %s", hostname)
+            return 1
+        else:
+            log.info("Left server %s", hostname)
+            return 0
+            
+    async def close(self):
+        """Leaves every server"""
+        for hostname in list(self.servers):
+            await self.leave_server(hostname)
+            
+    async def join_channel(self, hostname, chan_name):
+        """Joins a channel"""
+        if chan_name in self.serv_to_chan[hostname]:
+            log.warning("Already connected to %s on %s", hostname, chan_name)
+            return 0
+            
+        if not chan_name.startswith("#"):
+            log.warning("Channel names should look like #%s", chan_name)
+            return 2
+            
+        if await self.send_server_message(hostname, 
+                                          "JOIN {}".format(chan_name)):
+            log.warning("Failed to connect to %s", chan_name)
+            return 1
+            
+        self.serv_to_chan[hostname].append(chan_name)
+        log.info("Connected to %s", chan_name)
+        return 0
+                
+    async def leave_channel(self, hostname, chan_name):
+        """Leaves a channel"""
+        if hostname not in self.servers:
+            log.warning("No such server %s", hostname)
+            return 1
+        
+        elif chan_name not in self.serv_to_chan[hostname]:
+            log.warning("No such channel %s", chan_name)
+            return 0
+            
+        elif await self.send_server_message(hostname, 
+                                            "PART {}".format(chan_name)):
+            log.warning("Failed to leave %s", chan_name)
+            return 2
+            
+        else:
+            self.serv_to_chan[hostname].remove(chan_name)
+            log.info("Left channel %s", chan_name)
+            return 0
+            
+    def subscribe(self, callback, server=None, channel=None, command=None,
+                  nick=None):
+        """The same as IRC_sockselect.IRC_member.subscribe"""
+        return self.subscriptions.add(callback, server, channel, command, 
+                                      nick)
+        
+    def unsubscribe(self, subscription):
+        self.subscriptions.remove(subscription)
+        
+    def messages(self, server=None, channel=None, command=None, nick=None):
+        """An async iterator over the (hostname, Message) pairs matching the
+        filters, which are the same as subscribe's:
+
+            async for hostname, message in member.messages(command="PRIVMSG"):
+                ...
+        """
+        return MessageStream(self, server, channel, command, nick)
+        
+    async def receive_all_messages(self, timeout=5):
+        """Waits up to timeout seconds for any server to say something, then
+        displays everything that has been received"""
+        try:
+            await asyncio.wait_for(self.replied.wait(), timeout)
+        except asyncio.TimeoutError:
+            return 0
+            
+        self.replied.clear()
+        for server, scrollback in self.replies.items():
+            reply, self.cursors[server] = scrollback.since(
+                self.cursors.get(server, 0))
+            if reply:
+                print("{} :\n\n".format(server))
+                for message in reply:
+                    print(" {}".format(message))
+        return 0
+        
+    async def _read_loop(self, hostname, reader, writer):
+        """Reads, parses and dispatches lines from a server until it closes
+        the connection, then forgets the server
+        """
+        dispatch = self.dispatcher.dispatch
+        replied = self.replied
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError as e: ## Longer than the reader's limit
+                    log.exception(e)
+                    continue
+                except OSError as e:
+                    log.exception(e)
+                    break
+                
+                if not line:
+                    log.warning("Connection to %s was closed", hostname)
+                    break
+                
+                line = line.rstrip()
+                subs = ()
+                if self.subscriptions:
+                    subs = self.subscriptions.match(hostname, line, 
+                                                    self.dispatcher.table)
+                    if subs is None:
+                        continue
+                message = parse(line)
+                if message is None:
+                    continue
+                consumed = dispatch(hostname, message)
+                if subs:
+                    consumed = (self.subscriptions.deliver(
+                        subs, hostname, message) or consumed)
+                elif self.subscriptions:
+                    continue
+                if not consumed:
+                    if hostname not in self.replies:
+                        self.replies[hostname] = Scrollback(self.scrollback)
+                    self.replies[hostname].append(decode(line))
+                    replied.set()
+        finally:
+            ## Unless leave_server got there first, or the server has since
+            ## been joined again on another connection
+            if self.servers.get(hostname) is writer:
+                del self.servers[hostname]
+                self.readers.pop(hostname, None)
+                self.serv_to_chan.pop(hostname, None)
+                self.serv_to_data.pop(hostname, None)
+                writer.close()
+                
+    def _on_ping(self, hostname, message):
+        ## A bare PING still gets its PONG
+        token = message.params[-1] if message.params else ""
+        asyncio.ensure_future(self.ping_pong(self.servers[hostname],
+                                             ":" + token))
+        return True
+                
+                
+class MessageStream(object):
+    """A subscription that queues what it matches for an async for.  Every
+    message it matches is consumed
+    """
+    
+    def __init__(self, member, server=None, channel=None, command=None, 
+                 nick=None):
+        self.member = member
+        self.queue = asyncio.Queue()
+        self.subscription = member.subscribe(self._put, server, channel,
+                                             command, nick)
+        
+    def _put(self, hostname, message):
+        self.queue.put_nowait((hostname, message))
+        return True
+        
+    def close(self):
+        """Unsubscribes.  Iteration ends once what is queued is taken"""
+        self.member.unsubscribe(self.subscription)
+        self.queue.put_nowait(None)
+        
+    def __aiter__(self):
+        return self
+        
+    async def __anext__(self):
+        item = await self.queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
@@ -0,0 +1,248 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+from collections import deque
+import logging
+import threading
+import time
+
+from IRC_message import RPL_ENDOFNAMES, RPL_NAMREPLY
+from IRC_metrics import clock
+
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+## Which channel prefixes to expect until a server's CHANTYPES says
+DEFAULT_CHANTYPES = "#&"
+
+## Lines the bridge has no use for.  PINGs are answered by the member
+IGNORED = frozenset(("PING", "PONG", RPL_NAMREPLY))
+
+
+class EventQueue(object):
+    """Events on their way from the network thread to the GUI thread.  put
+    and drain only use a deque's append and popleft, which are atomic, so
+    neither thread ever waits on the other.  Only "message" events count
+    towards maxsize: once the GUI is that far behind, new messages are
+    dropped (and counted) rather than the events the user lists are built
+    from
+    """
+
+    def __init__(self, maxsize=10000, clock=clock):
+        self.queue = deque()
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.clock = clock
+
+    def __len__(self):
+        return len(self.queue)
+
+    def put(self, event):
+        """Queues event, returning False if it was dropped"""
+        if event[0] == "message" and len(self.queue) >= self.maxsize:
+            self.dropped += 1
+            return False
+        self.queue.append(event)
+        return True
+
+    def drain(self, handler, budget=.004):
+        """Calls handler with queued events, oldest first, until the queue is
+        empty or budget seconds have gone.  At least one event is handled
+        each call, so a slow handler still gets through them.  Returns how
+        many were handled
+        """
+        queue = self.queue
+        clock = self.clock
+        deadline = clock() + budget
+        handled = 0
+        while queue:
+            handler(queue.popleft())
+            handled += 1
+            if clock() >= deadline:
+                break
+        return handled
+
+
+class Bridge(object):
+    """Runs an IRC_sockselect.IRC_member's event loop on a thread of its own
+    and turns what the servers send into events for a GUI, which drains
+    them once a frame.  The GUI asks the member to do things through call,
+    so only the bridge's thread ever touches the member.  Events are
+    (kind, hostname, target, data) tuples:
+
+        ("message", host, target, Message)  target is the channel, the nick
+                                            of a private message or None
+        ("join", host, channel, nick)
+        ("part", host, channel, nick)       also sent for KICKs
+        ("quit", host, None, nick)
+        ("nick", host, old_nick, new_nick)
+        ("names", host, channel, names)     everyone in channel, with their
+                                            prefixes, once NAMES is done
+        ("connected", host, None, None)
+        ("closed", host, None, None)
+        ("error", None, None, exception)    the network thread hit it, and
+                                            carries on
+    """
+
+    def __init__(self, member, maxsize=10000, timeout=.05):
+        """Constructor for Bridge.  timeout is the longest the network
+        thread waits before running the GUI's calls
+        """
+        self.member = member
+        self.timeout = timeout
+        self.events = EventQueue(maxsize)
+        self.running = False
+        self.thread = None
+        
+        ## (function, args, kwargs) for the network thread to call
+        self.calls = deque()
+        
+        ## The servers the GUI has been told about
+        self.servers = set()
+        
+        ## Every line comes through here, so none are kept in the member's
+        ## own scrollback as well
+        self.subscription = member.subscribe(self._on_message)
+
+    def start(self):
+        """Starts the network thread"""
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="IRC_bridge")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        """The network thread.  This doesn't set the member's running, so
+        calls like join_channels poll for themselves rather than waiting on
+        another thread
+        """
+        member = self.member
+        while self.running:
+            try:
+                member.poll(self.timeout)
+            except Exception as e:
+                log.exception(e)
+                log.warning("Failed to get messages")
+                self.events.put(("error", None, None, e))
+                ## Rather than spin if it keeps failing
+                time.sleep(self.timeout)
+            self._run_calls()
+            self._check_servers()
+
+    def stop(self, timeout=5):
+        """Stops the network thread after its current tick"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def close(self):
+        """Stops the network thread and leaves every server"""
+        self.stop()
+        self._run_calls()
+        for hostname in list(self.member.servers):
+            self.member.leave_server(hostname)
+        self.member.unsubscribe(self.subscription)
+
+    def call(self, function, *args, **kwargs):
+        """Has the network thread call function(*args, **kwargs) on its next
+        tick.  Returns at once; what function returns is thrown away and
+        what it raises is logged
+        """
+        self.calls.append((function, args, kwargs))
+
+    def drain(self, handler, budget=.004):
+        """Hands queued events to handler for up to budget seconds.  Called
+        from the GUI thread once a frame
+        """
+        return self.events.drain(handler, budget)
+
+    def _run_calls(self):
+        calls = self.calls
+        while calls:
+            function, args, kwargs = calls.popleft()
+            try:
+                function(*args, **kwargs)
+            except Exception as e:
+                log.exception(e)
+
+    def _check_servers(self):
+        servers = set(self.member.servers)
+        if servers == self.servers:
+            return
+        for hostname in servers - self.servers:
+            self.events.put(("connected", hostname, None, None))
+        for hostname in self.servers - servers:
+            self.events.put(("closed", hostname, None, None))
+        self.servers = servers
+
+    def _on_message(self, hostname, message):
+        command = message.command
+        if command in IGNORED:
+            return True
+        params = message.params
+        put = self.events.put
+        if command == "JOIN" and message.prefix and params:
+            for chan_name in params[0].split(","):
+                put(("join", hostname, chan_name, message.nick))
+        elif command == "PART" and message.prefix and params:
+            for chan_name in params[0].split(","):
+                put(("part", hostname, chan_name, message.nick))
+        elif command == "KICK" and len(params) > 1:
+            put(("part", hostname, params[0], params[1]))
+        elif command == "QUIT" and message.prefix:
+            put(("quit", hostname, None, message.nick))
+        elif command == "NICK" and message.prefix and params:
+            put(("nick", hostname, message.nick, params[0]))
+        elif command == RPL_ENDOFNAMES and len(params) > 1:
+            put(("names", hostname, params[1], 
+                 self._names(hostname, params[1])))
+        else:
+            put(("message", hostname, self._target(hostname, message), 
+                 message))
+        return True
+
+    def _target(self, hostname, message):
+        """The channel or nick a message belongs with, or None for the
+        server itself
+        """
+        chantypes = self.member.serv_to_isupport.get(hostname, {}).get(
+            "CHANTYPES") or DEFAULT_CHANTYPES
+        if message.params and message.params[0][:1] in chantypes:
+            return message.params[0]
+        if message.command in ("PRIVMSG", "NOTICE") and message.prefix and \
+           "!" in message.prefix:
+            return message.nick
+        return None
+
+    def _names(self, hostname, chan_name):
+        state = self.member.serv_to_state.get(hostname)
+        channel = state and state.channel(chan_name)
+        if channel is None:
+            return []
+        users = state.users
+        return [modes + users[key].nick 
+                for key, modes in channel.members.items() if key in users]
@@ -0,0 +1,249 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import logging
+
+from IRC_message import RPL_WELCOME, format_time, parse_time
+from IRC_state import casefold
+
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+## The capabilities asked for whenever a server offers them.  Most servers
+## still call chathistory draft/chathistory
+WANTED = ("batch", "cap-notify", "chathistory", "draft/chathistory", 
+          "message-tags", "server-time")
+
+## How many messages to ask for when catching up, unless the server's
+## CHATHISTORY token says it sends fewer
+HISTORY_LIMIT = 100
+
+
+class Capabilities(object):
+    """Negotiates IRCv3 capabilities with every server an
+    IRC_sockselect.IRC_member joins: CAP LS 302 goes out ahead of NICK and
+    USER, whatever is offered out of wanted is asked for with CAP REQ, and
+    CAP END lets registration finish.  Servers that don't know CAP just
+    register us as usual.
+
+    With chathistory, it also remembers the latest message seen in each
+    channel, and asks for only what came after it (CHATHISTORY AFTER)
+    whenever we join that channel again, as after a reconnect.  That goes
+    by the message's msgid when the server tags messages with one.
+    Otherwise it asks from the message's server-time on, since lines
+    stamped in the same millisecond would be lost asking after it, and
+    drops the lines it has already seen
+    """
+
+    def __init__(self, member, wanted=WANTED, catch_up=True):
+        self.member = member
+        self.wanted = frozenset(wanted)
+        self.catch_up = catch_up
+        
+        # This is a mapping of server name to the capabilities it offers
+        # and their values, once it has listed them all
+        # {
+        #  "some_server": {"batch": "", "sasl": "PLAIN,EXTERNAL"}
+        # }
+        self.offered = {}
+        
+        # This is a mapping of server name to the capabilities it has
+        # agreed to
+        self.enabled = {}
+        
+        # This is a mapping of server name to the capabilities of a CAP LS
+        # reply that is still coming, a line at a time
+        self.listing = {}
+        
+        # This is a mapping of server name to whether we are still between
+        # CAP LS and CAP END
+        self.negotiating = {}
+        
+        # This is a mapping of server name to the server-time of the latest
+        # message seen in each channel, by folded name.  It outlives the
+        # connection, for catching up after a reconnect
+        # {
+        #  "some_server": {"#chan": "2011-10-19T16:40:51.620Z"}
+        # }
+        self.last_time = {}
+        
+        # This is a mapping of server name to the msgid of the latest
+        # message seen in each channel, by folded name, if it had one
+        self.last_id = {}
+        
+        # This is a mapping of server name to what was seen in each channel
+        # at its last_time, by folded name: the msgid of each message, or
+        # its prefix and text if it had none
+        # {
+        #  "some_server": {"#chan": {("nick!user@host", "hi")}}
+        # }
+        self.last_seen = {}
+        
+        member.caps = self
+        member.dispatcher.register("CAP", self._on_cap)
+        member.dispatcher.register(RPL_WELCOME, self._on_welcome)
+        if catch_up:
+            for command in ("PRIVMSG", "NOTICE"):
+                member.dispatcher.register(command, self._on_message)
+            member.dispatcher.register("JOIN", self._on_join)
+            
+    def start(self, hostname):
+        """Opens negotiation with a server we have just connected to"""
+        self.offered.pop(hostname, None)
+        self.enabled[hostname] = set()
+        self.listing[hostname] = {}
+        self.negotiating[hostname] = True
+        self.member.send_server_message(hostname, "CAP LS 302")
+        
+    def has(self, hostname, capability):
+        return capability in self.enabled.get(hostname, ())
+        
+    def history(self, hostname, chan_name, limit=None):
+        """Asks a server for what was said in a channel since the latest
+        message we saw there (or for the latest limit messages, if we saw
+        none).  Returns 1 if the server doesn't do chathistory
+        """
+        if not (self.has(hostname, "chathistory") or 
+                self.has(hostname, "draft/chathistory")):
+            return 1
+        if limit is None:
+            limit = self._limit(hostname)
+        key = casefold(chan_name)
+        since = self.last_time.get(hostname, {}).get(key)
+        msgid = self.last_id.get(hostname, {}).get(key)
+        if msgid is not None:
+            line = "CHATHISTORY AFTER {} msgid={} {}".format(
+                chan_name, msgid, limit)
+        elif since is not None:
+            ## AFTER leaves out the timestamp itself, so ask from a
+            ## millisecond earlier and let _on_message drop what we had
+            line = "CHATHISTORY AFTER {} timestamp={} {}".format(
+                chan_name, format_time(parse_time(since) - .001), limit)
+        else:
+            line = "CHATHISTORY LATEST {} * {}".format(chan_name, limit)
+        return self.member.send_server_message(hostname, line)
+        
+    def _limit(self, hostname):
+        ## A CHATHISTORY token of 0 (or none) means no limit of its own
+        token = self.member.serv_to_isupport.get(hostname, {}).get(
+            "CHATHISTORY")
+        if token and token.isdigit() and int(token):
+            return min(int(token), HISTORY_LIMIT)
+        return HISTORY_LIMIT
+        
+    def _request(self, hostname, capabilities):
+        wanted = sorted(self.wanted.intersection(capabilities))
+        if wanted:
+            self.member.send_server_message(hostname, "CAP REQ :{}".format(
+                " ".join(wanted)))
+        return wanted
+        
+    def _end(self, hostname):
+        if self.negotiating.pop(hostname, False):
+            self.member.send_server_message(hostname, "CAP END")
+            
+    def _on_cap(self, hostname, message):
+        ## CAP <nick> <subcommand> [*] :<capabilities>
+        if len(message.params) < 3:
+            return True
+        subcommand = message.params[1].upper()
+        capabilities = message.params[-1].split()
+        if subcommand == "LS":
+            listing = self.listing.setdefault(hostname, {})
+            for capability in capabilities:
+                name, _, value = capability.partition("=")
+                listing[name] = value
+            if len(message.params) > 3 and message.params[2] == "*":
+                return True ## more to come
+            self.offered[hostname] = self.listing.pop(hostname)
+            if not self._request(hostname, self.offered[hostname]):
+                self._end(hostname)
+        elif subcommand == "ACK":
+            enabled = self.enabled.setdefault(hostname, set())
+            for capability in capabilities:
+                if capability.startswith("-"):
+                    enabled.discard(capability[1:])
+                else:
+                    enabled.add(capability)
+            log.info("Enabled %s on %s", " ".join(capabilities), hostname)
+            self._end(hostname)
+        elif subcommand == "NAK":
+            log.warning("%s refused %s", hostname, " ".join(capabilities))
+            self._end(hostname)
+        elif subcommand == "NEW":
+            offered = self.offered.setdefault(hostname, {})
+            for capability in capabilities:
+                name, _, value = capability.partition("=")
+                offered[name] = value
+            self._request(hostname, [capability.partition("=")[0] 
+                                     for capability in capabilities])
+        elif subcommand == "DEL":
+            for capability in capabilities:
+                self.offered.get(hostname, {}).pop(capability, None)
+                self.enabled.get(hostname, set()).discard(capability)
+        return True
+        
+    def _on_welcome(self, hostname, message):
+        ## Registered, so the server has finished with CAP (or ignored it)
+        self.negotiating.pop(hostname, None)
+        self.listing.pop(hostname, None)
+        
+    def _on_message(self, hostname, message):
+        raw_tags = message.raw_tags
+        if not raw_tags or "time=" not in raw_tags or not message.params:
+            return
+        stamp = message.tags.get("time")
+        if not stamp:
+            return
+        last_time = self.last_time.setdefault(hostname, {})
+        key = casefold(message.params[0])
+        msgid = message.tags.get("msgid")
+        said = msgid or (message.prefix, message.params[-1])
+        ## server-times are all the same width, so they sort as strings
+        if stamp > last_time.get(key, ""):
+            last_time[key] = stamp
+            self.last_seen.setdefault(hostname, {})[key] = set([said])
+            if msgid:
+                self.last_id.setdefault(hostname, {})[key] = msgid
+            else:
+                self.last_id.get(hostname, {}).pop(key, None)
+            return
+        if stamp == last_time[key]:
+            seen = self.last_seen.setdefault(hostname, {}).setdefault(
+                key, set())
+            if said in seen:
+                return True ## caught up on it already
+            seen.add(said)
+            if msgid:
+                self.last_id.setdefault(hostname, {})[key] = msgid
+            
+    def _on_join(self, hostname, message):
+        if message.nick != self.member._data(hostname, "nick") or \
+           not message.params:
+            return
+        for chan_name in message.params[0].split(","):
+            if casefold(chan_name) in self.last_time.get(hostname, {}):
+                self.history(hostname, chan_name)
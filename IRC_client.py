@@ -1,39 +1,272 @@
+from collections import deque
+
 import kivy
-kivy.require('1.8.0')
+kivy.require('1.11.0')
 
 from kivy.app import App
+from kivy.clock import Clock
+from kivy.metrics import dp
+from kivy.properties import NumericProperty
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.dropdown import DropDown
 from kivy.uix.label import Label
+from kivy.uix.recycleview import RecycleView
 from kivy.uix.tabbedpanel import TabbedPanel, TabbedPanelItem
 from kivy.uix.widget import Widget
 
+from IRC_state import casefold
+
+
+## How long each frame spends on events from the network, out of the 16.7
+## ms a frame has at 60 fps
+FRAME_BUDGET = .004
+
+
+class IRC_Widget(Widget):
+    """The whole window.  handle_event takes the events of an
+    IRC_bridge.Bridge and passes each on to the tabs, user list and menus
+    it changes
+    """
+    
+    def handle_event(self, event):
+        kind, hostname, target, data = event
+        chat = self.ids.chat
+        if kind == "message":
+            chat.channel(hostname, target).add_line(format_message(data))
+        elif kind == "join":
+            channel = chat.channel(hostname, target)
+            channel.add_user(data)
+            channel.add_line("* {} joined".format(data))
+        elif kind == "part":
+            channel = chat.find(hostname, target)
+            if channel is not None:
+                channel.remove_user(data)
+                channel.add_line("* {} left".format(data))
+        elif kind == "quit":
+            for channel in chat.channels_on(hostname):
+                if channel.remove_user(data):
+                    channel.add_line("* {} quit".format(data))
+        elif kind == "nick":
+            for channel in chat.channels_on(hostname):
+                if channel.remove_user(target):
+                    channel.add_user(data)
+                    channel.add_line("* {} is now {}".format(target, data))
+        elif kind == "names":
+            chat.channel(hostname, target).set_users(data)
+        elif kind == "connected":
+            chat.channel(hostname)
+            self.ids.menu.file_menu.add_server(hostname)
+        elif kind == "closed":
+            for channel in chat.channels_on(hostname):
+                channel.add_line("* Disconnected from {}".format(hostname))
+            self.ids.menu.file_menu.remove_server(hostname)
+        elif kind == "error":
+            if isinstance(chat.current_tab, Channel):
+                chat.current_tab.add_line("* Error: {}".format(data))
+        
+        
+def format_message(message):
+    """How a Message reads in a chat pane"""
+    if message.command == "PRIVMSG" and message.params:
+        return "<{}> {}".format(message.nick, message.params[-1])
+    if message.command == "NOTICE" and message.params:
+        return "-{}- {}".format(message.nick, message.params[-1])
+    return str(message)
+
+
+class Chat_Window(TabbedPanel):
+    """The tabs, one for each server and for each channel or private
+    conversation on it.  Tabs are made the first time something is shown
+    in them
+    """
+    
+    def __init__(self, **kwargs):
+        super(Chat_Window, self).__init__(**kwargs)
+        
+        # This is a mapping of (server name, folded channel or nick) to its
+        # tab.  The server's own tab has None for the channel
+        # {
+        #  ("some_server", None): Channel(text="some_server"),
+        #  ("some_server", "#chan"): Channel(text="#Chan")
+        # }
+        self.channels = {}
+        
+    def find(self, hostname, name=None):
+        return self.channels.get((hostname, name and casefold(name)))
+        
+    def channel(self, hostname, name=None):
+        """The tab for a channel (or the server, if name is None), made if
+        there isn't one yet
+        """
+        key = (hostname, name and casefold(name))
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = Channel(text=name or hostname,
+                                                   hostname=hostname)
+            self.add_widget(channel)
+            if not isinstance(self.current_tab, Channel):
+                self.switch_to(channel)
+        return channel
+        
+    def channels_on(self, hostname):
+        return [channel for (host, name), channel in self.channels.items()
+                if host == hostname and name is not None]
 
-class IRC_Widget(Widget): pass
+class Chat_Line(Label): pass
 
-class Chat_Window(TabbedPanel): pass
+class Chat_Pane(RecycleView):
+    """The lines of a Channel, one fixed-height row each.  Only the rows in
+    view have widgets, which are recycled as it scrolls, so a long
+    scrollback costs no rendering
+    """
 
-class Channel(TabbedPanelItem): pass
+class Channel(TabbedPanelItem):
+    """A tab of chat.  Lines can come in faster than frames; they are held
+    until the next frame and then shown in one update.  About the latest
+    scrollback lines are kept
+    """
+    
+    scrollback = NumericProperty(1000)
+    
+    ## Bumped whenever users changes, for the User_List to follow
+    users_changed = NumericProperty(0)
+    
+    def __init__(self, hostname=None, **kwargs):
+        super(Channel, self).__init__(**kwargs)
+        self.hostname = hostname
+        
+        ## Lines waiting for the next frame.  Bounded, so a stalled frame
+        ## can't pile them up
+        self.pending = deque(maxlen=self.scrollback)
+        self.refresh_trigger = Clock.create_trigger(self.refresh)
+        
+        # This is a mapping of folded nick to the nick as shown, with its
+        # prefix
+        # {
+        #  "somenick": "@SomeNick"
+        # }
+        self.users = {}
+        
+    def on_scrollback(self, instance, value):
+        self.pending = deque(self.pending, maxlen=value)
+        
+    def add_line(self, line):
+        self.pending.append(line)
+        self.refresh_trigger()
+        
+    def add_lines(self, lines):
+        self.pending.extend(lines)
+        self.refresh_trigger()
+        
+    def refresh(self, *args):
+        """Moves the waiting lines into the pane, following them down if
+        the pane was scrolled to the bottom
+        """
+        ## A tab out of sight keeps its last scrollback lines waiting, and
+        ## its pane is laid out once when it is shown
+        if not self.pending or self.state != "down":
+            return
+        pane = self.ids.pane
+        layout = pane.layout_manager
+        at_bottom = (pane.scroll_y <= 0 or layout is None or 
+                     layout.height <= pane.height)
+        data = pane.data
+        data.extend([{"text": line} for line in self.pending])
+        self.pending.clear()
+        
+        ## Every row moves when old ones are dropped, so they are dropped a
+        ## quarter of the scrollback at a time rather than every frame
+        excess = len(data) - self.scrollback
+        if excess > self.scrollback // 4:
+            del data[:excess]
+        if at_bottom:
+            pane.scroll_y = 0
+            
+    def on_state(self, instance, value):
+        if value == "down":
+            self.refresh_trigger()
+            
+    def add_user(self, name):
+        self.users[casefold(name.lstrip("~&@%+"))] = name
+        self.users_changed += 1
+        
+    def remove_user(self, nick):
+        """Returns whether nick was here"""
+        if self.users.pop(casefold(nick), None) is None:
+            return False
+        self.users_changed += 1
+        return True
+        
+    def set_users(self, names):
+        self.users = dict((casefold(name.lstrip("~&@%+")), name) 
+                          for name in names)
+        self.users_changed += 1
 
-class User_List(Label): pass
+class User_List(RecycleView):
+    """Who is in the tab being shown.  However many times its users change
+    in a frame, the list is sorted and shown once
+    """
+    
+    def __init__(self, **kwargs):
+        super(User_List, self).__init__(**kwargs)
+        self.channel = None
+        self.refresh_trigger = Clock.create_trigger(self.refresh)
+        
+    def show(self, channel):
+        ## The panel's own default tab has no users
+        if not isinstance(channel, Channel):
+            channel = None
+        if self.channel is not None:
+            self.channel.unbind(users_changed=self.refresh_trigger)
+        self.channel = channel
+        if channel is not None:
+            channel.bind(users_changed=self.refresh_trigger)
+        self.refresh_trigger()
+        
+    def refresh(self, *args):
+        users = self.channel.users if self.channel is not None else {}
+        self.data = [{"text": users[key]} for key in sorted(users)]
 
 class Text_Entry(BoxLayout): pass
 
-class Menu_Bar(BoxLayout): pass
+class Menu_Bar(BoxLayout):
+    
+    def __init__(self, **kwargs):
+        super(Menu_Bar, self).__init__(**kwargs)
+        self.file_menu = File_but()
+        
+    def on_kv_post(self, base_widget):
+        for menu in (self.file_menu, Set_but(), Help_but()):
+            menu.main_button.size_hint = (.1, 1)
+            self.ids.menus.add_widget(menu.main_button)
 
 class File_but(DropDown): 
     
     def __init__(self, **kwargs):
-        super(DropDown, self).__init__(**kwargs)
+        super(File_but, self).__init__(**kwargs)
         self.main_button = Button(text="File", size_hint=(1, .1))
         self.main_button.bind(on_release=self.open)
         self.bind(on_select=lambda instance, x: setattr(self.main_button, 'text', x))
+        
+        # This is a mapping of server name to its entry in the menu
+        self.servers = {}
+        
+    def add_server(self, hostname):
+        if hostname not in self.servers:
+            self.servers[hostname] = Button(text=hostname, size_hint_y=None,
+                                            height=dp(30))
+            self.add_widget(self.servers[hostname])
+            
+    def remove_server(self, hostname):
+        button = self.servers.pop(hostname, None)
+        if button is not None:
+            self.remove_widget(button)
 
 class Set_but(DropDown): 
 
     def __init__(self, **kwargs):
-        super(DropDown, self).__init__(**kwargs)
+        super(Set_but, self).__init__(**kwargs)
         self.main_button = Button(text="Settings", size_hint=(1, .1))
         self.main_button.bind(on_release=self.open)
         self.bind(on_select=lambda instance, x: setattr(self.main_button, 'text', x))
@@ -41,15 +274,43 @@ class Set_but(DropDown):
 class Help_but(DropDown): 
 
     def __init__(self, **kwargs):
-        super(DropDown, self).__init__(**kwargs)
+        super(Help_but, self).__init__(**kwargs)
         self.main_button = Button(text="Help", size_hint=(1, .1))
         self.main_button.bind(on_release=self.open)
         self.bind(on_select=lambda instance, x: setattr(self.main_button, 'text', x))
 
 class IRC_ClientApp(App): 
+    """The client.  Given an IRC_bridge.Bridge, runs its member on the
+    bridge's thread and shows what it receives
+    """
+    
+    def __init__(self, bridge=None, **kwargs):
+        super(IRC_ClientApp, self).__init__(**kwargs)
+        self.bridge = bridge
     
     def build(self):
-        return IRC_Widget()
+        widget = IRC_Widget()
+        if self.bridge is not None:
+            self.bridge.start()
+            Clock.schedule_interval(self.drain, 0)
+        return widget
+        
+    def drain(self, dt):
+        self.bridge.drain(self.root.handle_event, FRAME_BUDGET)
+        
+    def on_stop(self):
+        if self.bridge is not None:
+            self.bridge.close()
                 
 if __name__ == "__main__":
-    IRC_ClientApp().run()
\ No newline at end of file
+    import sys
+    
+    from IRC_bridge import Bridge
+    import IRC_sockselect
+    
+    member = IRC_sockselect.IRC_member(sys.argv[1] if len(sys.argv) > 1 else
+                                       "PyIRC")
+    bridge = Bridge(member)
+    for hostname in sys.argv[2:]:
+        bridge.call(member.join_server, hostname)
+    IRC_ClientApp(bridge).run()
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+
+class LineFramer(object):
+    """Splits the byte stream from one server into complete lines.  Anything
+    after the last line ending is kept and finished by the next read
+    """
+
+    def __init__(self, size=4096):
+        """Constructor for LineFramer.  size is the initial buffer capacity,
+        which grows if a single line outgrows it
+        """
+
+        self.buffer = bytearray(size)
+
+        # Bytes in buffer[start:end] have been read but not handed out yet
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def recv_into(self, sock, bsize=4096):
+        """Reads up to bsize bytes from sock directly into the buffer.
+        Returns the number of bytes read, which is 0 once the server has
+        closed the connection
+        """
+        self._reserve(bsize)
+        view = memoryview(self.buffer)
+        try:
+            nbytes = sock.recv_into(view[self.end:self.end + bsize], bsize)
+        finally:
+            del view
+        self.end += nbytes
+        return nbytes
+
+    def feed(self, data):
+        """Adds bytes that have already been read from the server"""
+        nbytes = len(data)
+        self._reserve(nbytes)
+        self.buffer[self.end:self.end + nbytes] = data
+        self.end += nbytes
+
+    def lines(self):
+        """Yields every complete line in the buffer without its line ending"""
+        buff = self.buffer
+        while True:
+            newline = buff.find(b"\n", self.start, self.end)
+            if newline < 0:
+                break
+            end = newline
+            if end > self.start and buff[end - 1] == 13:
+                end -= 1
+            line = memoryview(buff)[self.start:end].tobytes()
+            self.start = newline + 1
+            yield line
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def _reserve(self, nbytes):
+        """Makes room for nbytes more at the end of the buffer, moving the
+        unread partial line to the front first
+        """
+        if self.end + nbytes <= len(self.buffer):
+            return
+        pending = self.end - self.start
+        if self.start:
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+        if pending + nbytes > len(self.buffer):
+            grow = max(len(self.buffer), pending + nbytes - len(self.buffer))
+            self.buffer.extend(bytearray(grow))
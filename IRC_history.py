@@ -0,0 +1,319 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+"""An append-only store of what was said in each channel, for scrollback
+that outlives the process.  Every server gets a directory and every channel
+two files in it: the log, a run of records each made of a fixed-size header
+(timestamp and length) followed by the line, and a sparse index holding
+(latest timestamp so far, timestamp, offset) for a record every index_every
+bytes and for every record that arrived out of order.  Reads map the log
+with mmap and binary search the index, so a time range is found without
+scanning the log or parsing anything outside the range.
+"""
+
+try:
+    from urllib.parse import quote, unquote
+except ImportError:
+    from urllib import quote, unquote
+finally:
+    import mmap
+    import os
+    import struct
+    import time
+
+    from IRC_state import casefold
+
+
+## Commands that get archived, under the channel (or nick) they went to
+ARCHIVED = ("PRIVMSG", "NOTICE", "JOIN", "PART", "KICK", "TOPIC")
+
+
+class ChannelLog(object):
+    """The log and sparse index of one channel"""
+
+    HEADER = struct.Struct("<dI")
+    INDEX = struct.Struct("<ddQ")
+
+    def __init__(self, path, index_every=65536):
+        """Constructor for ChannelLog.  path is the log's filename; the
+        index is kept next to it with ".idx" added
+        """
+        self.path = path
+        self.index_path = path + ".idx"
+        self.index_every = index_every
+        
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._recover()
+        self.view = None
+        self.log = open(self.path, "ab")
+        self.index = open(self.index_path, "ab")
+
+    def append(self, line, timestamp=None):
+        """Adds a line, returning the offset of its record.  A line keeps
+        its own timestamp even when it is earlier than the last (replayed
+        history); such a line is always indexed, so reads still find it
+        """
+        if not isinstance(line, bytes):
+            line = line.encode("utf-8")
+        if timestamp is None:
+            timestamp = time.time()
+        late = timestamp < self.last
+        self.last = max(timestamp, self.last)
+        if (late or self.size == 0 or 
+                self.size - self.indexed >= self.index_every):
+            self.index.write(self.INDEX.pack(self.last, timestamp, self.size))
+            self.indexed = self.size
+        offset = self.size
+        self.log.write(self.HEADER.pack(timestamp, len(line)))
+        self.log.write(line)
+        self.size += self.HEADER.size + len(line)
+        return offset
+
+    def flush(self):
+        self.log.flush()
+        self.index.flush()
+
+    def close(self):
+        self.log.close()
+        self.index.close()
+        if self.view is not None:
+            self.view.close()
+            self.view = None
+
+    def record(self, offset):
+        """The (timestamp, line) whose record starts at offset"""
+        self._map(offset + self.HEADER.size)
+        timestamp, length = self.HEADER.unpack_from(self.view, offset)
+        offset += self.HEADER.size
+        self._map(offset + length)
+        return timestamp, self.view[offset:offset + length]
+
+    def _map(self, end):
+        """Makes sure the view used by record reaches end, remapping only
+        when it doesn't, since records are mostly looked up in the part of
+        the log that was already there
+        """
+        if self.view is not None and len(self.view) >= end:
+            return
+        self.flush()
+        if self.view is not None:
+            self.view.close()
+        with open(self.path, "rb") as f:
+            self.view = mmap.mmap(f.fileno(), self.size, 
+                                  access=mmap.ACCESS_READ)
+
+    def read(self, start=None, end=None):
+        """Yields (timestamp, line) for every line from start up to and
+        including end, in the order they were logged
+        """
+        for _, timestamp, line in self.records(start, end):
+            yield timestamp, line
+
+    def records(self, start=None, end=None):
+        """Like read, but yields (offset, timestamp, line)"""
+        self.flush()
+        if not self.size:
+            return
+        offset = self._find(start) if start is not None else 0
+        with open(self.path, "rb") as f:
+            view = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ)
+        try:
+            header = self.HEADER
+            latest = 0.0
+            while offset < self.size:
+                timestamp, length = header.unpack_from(view, offset)
+                latest = max(latest, timestamp)
+                if end is not None and latest > end:
+                    break
+                offset += header.size
+                if start is None or timestamp >= start:
+                    yield (offset - header.size, timestamp, 
+                           view[offset:offset + length])
+                offset += length
+            else:
+                return
+            
+            ## Past end only lines logged late can still be in range, and
+            ## every one of those has an index entry of its own
+            for _, timestamp, offset in self._entries(offset):
+                if (start is None or timestamp >= start) and timestamp <= end:
+                    length = header.unpack_from(view, offset)[1]
+                    yield (offset, timestamp, 
+                           view[offset + header.size:
+                                offset + header.size + length])
+        finally:
+            view.close()
+
+    def _entries(self, offset):
+        """The index entries for records from offset on"""
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        for i in range(0, len(data) - self.INDEX.size + 1, self.INDEX.size):
+            entry = self.INDEX.unpack_from(data, i)
+            if entry[2] >= offset:
+                yield entry
+
+    def _find(self, timestamp):
+        """Offset of the last indexed record by which every line logged was
+        stamped before timestamp, which is where a read from timestamp starts
+        scanning
+        """
+        entries = os.path.getsize(self.index_path) // self.INDEX.size
+        if not entries:
+            return 0
+        with open(self.index_path, "rb") as f:
+            view = mmap.mmap(f.fileno(), entries * self.INDEX.size, 
+                             access=mmap.ACCESS_READ)
+        try:
+            low, high = 0, entries
+            while low < high:
+                middle = (low + high) // 2
+                if self.INDEX.unpack_from(
+                        view, middle * self.INDEX.size)[0] < timestamp:
+                    low = middle + 1
+                else:
+                    high = middle
+            if not low:
+                return 0
+            return self.INDEX.unpack_from(view, (low - 1) * self.INDEX.size)[2]
+        finally:
+            view.close()
+
+    def _recover(self):
+        """Finds where the log ends, cutting off a record that was only half
+        written (and any index entries past it) if the process died mid-way
+        """
+        self.size = self.indexed = 0
+        self.last = 0.0
+        if not os.path.exists(self.path):
+            for path in (self.path, self.index_path):
+                open(path, "wb").close()
+            return
+        
+        ## Starts from the last indexed record rather than the top
+        entries = []
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        for i in range(0, len(data) - self.INDEX.size + 1, self.INDEX.size):
+            entries.append(self.INDEX.unpack_from(data, i))
+        size = os.path.getsize(self.path)
+        while entries and entries[-1][2] >= size:
+            entries.pop()
+        offset = entries[-1][2] if entries else 0
+        self.last = entries[-1][0] if entries else 0.0
+        
+        header = self.HEADER
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while offset + header.size <= size:
+                timestamp, length = header.unpack(f.read(header.size))
+                if offset + header.size + length > size:
+                    break
+                f.seek(length, os.SEEK_CUR)
+                offset += header.size + length
+                self.last = max(self.last, timestamp)
+        
+        if offset != size:
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+            while entries and entries[-1][2] >= offset:
+                entries.pop()
+        with open(self.index_path, "r+b") as f:
+            f.truncate(len(entries) * self.INDEX.size)
+        self.size = offset
+        self.indexed = entries[-1][2] if entries else 0
+
+
+class Archive(object):
+    """Every ChannelLog under one directory, by server and channel"""
+
+    def __init__(self, root="History", index_every=65536):
+        self.root = root
+        self.index_every = index_every
+        
+        # Set by IRC_search.SearchIndex to be handed everything archived
+        self.index = None
+        
+        # This is a mapping of (server name, folded channel name) to the
+        # open ChannelLog
+        self.logs = {}
+
+    def channel_log(self, hostname, chan_name):
+        key = hostname, casefold(chan_name)
+        if key not in self.logs:
+            self.logs[key] = ChannelLog(
+                os.path.join(self.root, quote(hostname, safe=""), 
+                             quote(key[1], safe="")),
+                self.index_every)
+        return self.logs[key]
+
+    def channels(self):
+        """Yields (server name, folded channel name) for every log on disk"""
+        if not os.path.isdir(self.root):
+            return
+        for server in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, server)
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if not name.endswith(".idx"):
+                    yield unquote(server), unquote(name)
+
+    def append(self, hostname, chan_name, line, timestamp=None):
+        return self.channel_log(hostname, chan_name).append(line, timestamp)
+
+    def read(self, hostname, chan_name, start=None, end=None):
+        return self.channel_log(hostname, chan_name).read(start, end)
+
+    def flush(self):
+        for log in self.logs.values():
+            log.flush()
+
+    def close(self):
+        for log in self.logs.values():
+            log.close()
+        self.logs = {}
+
+    def attach(self, member):
+        """Archives the chat a member receives, by registering with its
+        dispatcher
+        """
+        for command in ARCHIVED:
+            member.dispatcher.register(command, self._on_message)
+
+    def _on_message(self, hostname, message):
+        if not message.params:
+            return
+        target = message.params[0].split(",", 1)[0]
+        if not target or target[0] not in "#&+!":
+            ## Private messages are filed under whoever sent them
+            target = message.nick or target
+        ## Replayed history (CHATHISTORY) is filed under when it was said
+        timestamp = message.time or time.time()
+        offset = self.append(hostname, target, str(message), timestamp)
+        if self.index is not None:
+            self.index.add(hostname, target, message, offset, timestamp)
@@ -0,0 +1,150 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import logging
+import time
+
+from IRC_message import RPL_WELCOME
+from IRC_metrics import Histogram
+
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+## Upper bounds (in seconds) of the lag histogram's buckets, doubling from
+## a millisecond to a bit over a minute.  Anything slower goes in the last
+LAG_BUCKETS = tuple(.001 * 2 ** n for n in range(17))
+
+## What our keepalive PING tokens start with, ahead of the time they were
+## sent
+TOKEN = "lag-"
+
+
+class Keepalive(object):
+    """Sends every server an IRC_sockselect.IRC_member is connected to our
+    own PING every interval seconds, with the time it was sent as the
+    token.  The PONG tells us the round trip lag, which goes into a
+    Histogram per server.  A server whose lag passes threshold seconds
+    (it hasn't answered in that long) is dropped.  Timers live on the
+    member's Scheduler
+    """
+
+    def __init__(self, member, interval=60.0, threshold=30.0, 
+                 scheduler=None, clock=time.time):
+        """Constructor for Keepalive.  Starts on the servers member is
+        already connected to, and on others once they welcome us
+        """
+        self.member = member
+        self.interval = interval
+        self.threshold = threshold
+        self.scheduler = scheduler if scheduler is not None else \
+                         member.scheduler
+        self.clock = clock
+        
+        # This is a mapping of server name to the Histogram of its lag
+        self.lag = {}
+        
+        # This is a mapping of server name to the lag of its latest PONG
+        self.last_lag = {}
+        
+        # This is a mapping of server name to when our unanswered PING was
+        # sent
+        self.pinged = {}
+        
+        # This is a mapping of server name to the Timer for its next PING,
+        # or for giving up on the one it hasn't answered
+        self.timers = {}
+        
+        member.keepalive = self
+        member.dispatcher.register(RPL_WELCOME, self._on_welcome)
+        member.dispatcher.register("PONG", self._on_pong)
+        for hostname in member.servers:
+            self.watch(hostname)
+            
+    def watch(self, hostname):
+        """Starts (or restarts) pinging a server"""
+        self.forget(hostname)
+        self.timers[hostname] = self.scheduler.call_later(
+            self.interval, self._ping, hostname)
+            
+    def forget(self, hostname):
+        """Stops pinging a server, because the link is gone"""
+        timer = self.timers.pop(hostname, None)
+        if timer is not None:
+            timer.cancel()
+        self.pinged.pop(hostname, None)
+        
+    def stats(self, hostname):
+        """Lag figures for a server, in seconds"""
+        histogram = self.lag.get(hostname) or Histogram(LAG_BUCKETS)
+        return {
+            "pings": histogram.count,
+            "last": self.last_lag.get(hostname),
+            "mean": histogram.mean,
+            "min": histogram.min,
+            "p50": histogram.percentile(.5),
+            "p99": histogram.percentile(.99),
+            "max": histogram.max,
+            ## Time waited so far on the PING in flight
+            "pending": (self.clock() - self.pinged[hostname] 
+                        if hostname in self.pinged else None),
+        }
+        
+    def _ping(self, hostname):
+        if hostname not in self.member.servers:
+            self.timers.pop(hostname, None)
+            return
+        now = self.clock()
+        self.pinged[hostname] = now
+        self.timers[hostname] = self.scheduler.call_later(
+            self.threshold, self._timed_out, hostname)
+        self.member.send_server_message(hostname, "PING :{}{!r}".format(
+            TOKEN, now))
+            
+    def _timed_out(self, hostname):
+        self.timers.pop(hostname, None)
+        if self.pinged.pop(hostname, None) is None:
+            return
+        log.warning("No PONG from %s in %ss", hostname, self.threshold)
+        self.member._drop(hostname, "lag over {}s".format(self.threshold))
+        
+    def _on_welcome(self, hostname, message):
+        self.watch(hostname)
+        
+    def _on_pong(self, hostname, message):
+        ## Servers echo the token back with any trailing space we sent
+        token = message.params[-1].strip() if message.params else ""
+        if not token.startswith(TOKEN):
+            return False
+        sent = self.pinged.get(hostname)
+        if sent is None or token != "{}{!r}".format(TOKEN, sent):
+            ## An answer to a PING we already gave up on
+            return True
+        lag = self.clock() - sent
+        self.lag.setdefault(hostname, Histogram(LAG_BUCKETS)).add(lag)
+        self.last_lag[hostname] = lag
+        self.watch(hostname)
+        return True
@@ -0,0 +1,153 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+"""Logging setup for PyIRC.  Nothing is configured on import; a program
+calls configure once, and every record is then handed to a queue that a
+thread of its own writes out, so the thread doing network I/O never waits
+on the log file.
+"""
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    QueueHandler = QueueListener = None
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+finally:
+    import atexit
+    import datetime
+    import logging
+    import os
+    import threading
+
+
+LOG_DIR = "Logs"
+
+## Every listener configure has started, as (logger, handler, listener)
+_configured = []
+
+
+if QueueHandler is None:
+    ## Python 2 doesn't have these, so here are the parts of them we use
+
+    class QueueHandler(logging.Handler):
+        """Puts records on a queue instead of writing them anywhere"""
+
+        def __init__(self, queue):
+            logging.Handler.__init__(self)
+            self.queue = queue
+
+        def prepare(self, record):
+            ## Merges the arguments in now, so the record can't change (and
+            ## doesn't keep anything alive) while it waits in the queue
+            self.format(record)
+            record.msg = record.message
+            record.args = None
+            record.exc_info = None
+            return record
+
+        def emit(self, record):
+            try:
+                self.queue.put_nowait(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+    class QueueListener(object):
+        """Takes records off a queue on a thread of its own and hands them
+        to handlers
+        """
+
+        _sentinel = None
+
+        def __init__(self, queue, *handlers):
+            self.queue = queue
+            self.handlers = handlers
+            self._thread = None
+
+        def start(self):
+            self._thread = threading.Thread(target=self._monitor)
+            self._thread.daemon = True
+            self._thread.start()
+
+        def stop(self):
+            self.queue.put_nowait(self._sentinel)
+            self._thread.join()
+            self._thread = None
+
+        def _monitor(self):
+            while True:
+                record = self.queue.get()
+                if record is self._sentinel:
+                    break
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+
+
+def default_filename():
+    """Logs/YYYY-MM-DD.log, zero padded so the files sort by date"""
+    return os.path.join(LOG_DIR, 
+                        datetime.date.today().strftime("%Y-%m-%d.log"))
+
+
+def configure(filename=None, level=logging.INFO, fmt=logging.BASIC_FORMAT,
+              logger=None):
+    """Sends the records of logger (the root logger by default) at level
+    and above to filename, by way of a QueueHandler.  Returns the
+    QueueListener doing the writing, which is stopped at exit (or by
+    shutdown) once everything queued has been written
+    """
+    if filename is None:
+        filename = default_filename()
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    file_handler = logging.FileHandler(filename)
+    file_handler.setFormatter(logging.Formatter(fmt))
+    records = queue.Queue(-1)
+    handler = QueueHandler(records)
+    listener = QueueListener(records, file_handler)
+
+    logger = logging.getLogger(logger)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    listener.start()
+    if not _configured:
+        atexit.register(shutdown)
+    _configured.append((logger, handler, listener))
+    return listener
+
+
+def shutdown():
+    """Writes out whatever is still queued and undoes configure"""
+    while _configured:
+        logger, handler, listener = _configured.pop()
+        logger.removeHandler(handler)
+        listener.stop()
+        for file_handler in listener.handlers:
+            file_handler.close()
@@ -0,0 +1,514 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import calendar
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+## Numeric replies that get handled somewhere (RFC 1459 section 6)
+RPL_WELCOME = "001"
+RPL_ISUPPORT = "005"
+RPL_NAMREPLY = "353"
+RPL_ENDOFNAMES = "366"
+ERR_NOSUCHCHANNEL = "403"
+ERR_TOOMANYCHANNELS = "405"
+ERR_NICKNAMEINUSE = "433"
+ERR_UNAVAILRESOURCE = "437"
+ERR_CHANNELISFULL = "471"
+ERR_INVITEONLYCHAN = "473"
+ERR_BANNEDFROMCHAN = "474"
+ERR_BADCHANNELKEY = "475"
+ERR_BADCHANMASK = "476"
+ERR_NEEDREGGEDNICK = "477"
+
+## Errors a server answers a JOIN with, naming the channel as the second
+## parameter
+JOIN_ERRORS = (ERR_NOSUCHCHANNEL, ERR_TOOMANYCHANNELS, ERR_UNAVAILRESOURCE,
+               ERR_CHANNELISFULL, ERR_INVITEONLYCHAN, ERR_BANNEDFROMCHAN,
+               ERR_BADCHANNELKEY, ERR_BADCHANMASK, ERR_NEEDREGGEDNICK)
+
+## Batches whose lines are held back and handled together once the batch
+## ends, rather than one by one
+BULK_BATCHES = ("netsplit", "netjoin")
+
+## Longest line a server will relay, counting the prefix it adds and CRLF
+MAX_LINE = 512
+
+## Longest host a server puts in our prefix, for when we don't know ours
+HOSTLEN = 63
+
+## Room a line must leave for text before another target is squeezed in
+MIN_TEXT = 100
+
+_TAG_UNESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+_TEXT = type(u"")
+
+## Whether fields read off the wire need decoding.  Python 2's str is
+## bytes, so there they are used as they are
+_DECODE = bytes is not str
+
+
+def decode(data):
+    """Turns bytes from a server into text.  Most servers send UTF-8, and
+    what isn't is taken as CP1252 (what most older clients send), or
+    failing that latin-1, which anything decodes as.  Python 2 gets its
+    bytes back, as that is its str
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if not _DECODE or not isinstance(data, bytes):
+        return data
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    try:
+        return data.decode("cp1252")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def encode(text):
+    """The bytes to send for text.  Bytes (and memoryviews) are sent as
+    they are, and anything else as its str
+    """
+    if isinstance(text, bytes):
+        return text
+    if isinstance(text, memoryview):
+        return text.tobytes()
+    if not isinstance(text, _TEXT):
+        text = str(text)
+        if isinstance(text, bytes):
+            return text
+    return text.encode("utf-8")
+
+
+class Template(object):
+    """An outgoing line with {} where its arguments go.  The fixed parts
+    are encoded once, so format only encodes the arguments and joins
+    """
+
+    __slots__ = ("parts",)
+
+    def __init__(self, template):
+        self.parts = tuple(encode(part) for part in template.split("{}"))
+
+    def format(self, *args):
+        parts = self.parts
+        out = [parts[0]]
+        for arg, part in zip(args, parts[1:]):
+            out.append(encode(arg))
+            out.append(part)
+        return b"".join(out)
+
+    def __repr__(self):
+        return "Template({!r})".format(b"{}".join(self.parts))
+
+
+## The lines every backend sends.  A raw line gets a space before its CRLF
+## so a trailing parameter ending in ":" can't be cut short
+LINE = Template("{} \r\n")
+NICK = Template("NICK {}\r\n")
+USER = Template("USER {} 0 * :{}\r\n")
+PONG = Template("PONG {}\r\n")
+JOIN = Template("JOIN {}\r\n")
+PART = Template("PART {}\r\n")
+PRIVMSG = Template("PRIVMSG {} :{}\r\n")
+QUIT = b"QUIT\r\n"
+
+
+def unescape_tag(value):
+    """Undoes the IRCv3 message-tags escaping of a tag value"""
+    if "\\" not in value:
+        return value
+    out = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            char = next(chars, "")
+            char = _TAG_UNESCAPES.get(char, char)
+        out.append(char)
+    return "".join(out)
+
+
+def parse_tags(raw_tags):
+    """Turns "a=b;c" into {"a": "b", "c": ""}"""
+    tags = {}
+    for tag in raw_tags.split(";"):
+        key, _, value = tag.partition("=")
+        if key:
+            tags[key] = unescape_tag(value)
+    return tags
+
+
+def parse_time(value):
+    """Turns an IRCv3 server-time ("2011-10-19T16:40:51.620Z") into seconds
+    since the epoch.  Returns None if value isn't one
+    """
+    try:
+        seconds = calendar.timegm(time.strptime(value[:19], 
+                                                "%Y-%m-%dT%H:%M:%S"))
+    except ValueError:
+        return None
+    fraction = value[19:].rstrip("Z")
+    if fraction[:1] == "." and fraction[1:].isdigit():
+        seconds += float(fraction)
+    return seconds
+
+
+def format_time(seconds):
+    """The server-time for seconds since the epoch, to the millisecond"""
+    seconds, millis = divmod(int(round(seconds * 1000)), 1000)
+    return "{}.{:03d}Z".format(
+        time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)), millis)
+
+
+def parse_isupport(params):
+    """Turns the parameters of an RPL_ISUPPORT reply into a dict of the
+    tokens it sets.  Negated tokens ("-KEY") map to None
+    """
+    tokens = {}
+    for token in params[1:-1]:
+        if token.startswith("-"):
+            tokens[token[1:].upper()] = None
+        else:
+            key, _, value = token.partition("=")
+            tokens[key.upper()] = value
+    return tokens
+
+
+def max_targets(isupport, command, default=1):
+    """How many comma-separated targets the server takes for command, going
+    by its TARGMAX (or older MAXTARGETS) token.  None means no limit, and
+    default is used when the server hasn't said
+    """
+    targmax = isupport.get("TARGMAX")
+    if targmax:
+        for pair in targmax.split(","):
+            name, _, limit = pair.partition(":")
+            if name.upper() == command:
+                return int(limit) if limit else None
+    elif isupport.get("MAXTARGETS") and command in ("PRIVMSG", "NOTICE"):
+        return int(isupport["MAXTARGETS"])
+    return default
+
+
+def split_text(text, limit):
+    """Splits UTF-8 encoded text into chunks of at most limit bytes.  Breaks
+    at a space if there is one in the back half of a chunk, and otherwise
+    never inside a multi-byte character
+    """
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind(b" ", 0, limit + 1)
+        if cut > limit // 2:
+            chunks.append(text[:cut])
+            text = text[cut + 1:]
+            continue
+        cut = limit
+        while cut and ord(text[cut:cut + 1]) & 0xC0 == 0x80:
+            cut -= 1
+        chunks.append(text[:cut or limit])
+        text = text[cut or limit:]
+    chunks.append(text)
+    return chunks
+
+
+def format_lines(command, targets, text, prefix_length=0, targmax=1):
+    """Builds the CRLF terminated lines that send text to every target.
+    Targets are comma-joined up to targmax per line, and text is split so
+    every line stays within MAX_LINE once the server has put prefix_length
+    bytes of prefix in front of it.  Each line of a multi-line text is
+    sent as a message of its own
+    """
+    text = encode(text)
+    targets = [encode(target) for target in targets]
+    paragraphs = text.rstrip().splitlines() or [b""]
+    room = MAX_LINE - prefix_length - len(command) - 5
+
+    groups = [[]]
+    length = 0
+    for target in targets:
+        group = groups[-1]
+        added = len(target) + 1 if group else len(target)
+        if group and (len(group) == targmax or 
+                      length + added > room - MIN_TEXT):
+            groups.append([target])
+            length = len(target)
+        else:
+            group.append(target)
+            length += added
+
+    lines = []
+    for group in groups:
+        if not group:
+            continue
+        head = encode(command) + b" " + b",".join(group) + b" :"
+        limit = MAX_LINE - prefix_length - len(head) - 2
+        for paragraph in paragraphs:
+            for chunk in split_text(paragraph, limit):
+                lines.append(head + chunk + b"\r\n")
+    return lines
+
+
+def format_list_lines(command, names, keys=None, targmax=None):
+    """Packs names into as few "COMMAND a,b,c key1,key2" lines as fit in
+    MAX_LINE and the server's targmax.  keys maps a name to its key, and
+    names with keys are put first so the keys line up with them
+    """
+    keys = keys or {}
+    names = sorted(names, key=lambda name: not keys.get(name))
+
+    groups = []
+    group, group_keys = [], []
+    length = len(command) + 3
+    for name in names:
+        key = keys.get(name)
+        added = len(name) + 1
+        if key:
+            added += len(key) + 1
+        if group and (len(group) == targmax or length + added > MAX_LINE):
+            groups.append((group, group_keys))
+            group, group_keys = [], []
+            length = len(command) + 3
+        group.append(name)
+        if key:
+            group_keys.append(key)
+        length += added
+    if group:
+        groups.append((group, group_keys))
+
+    lines = []
+    for group, group_keys in groups:
+        line = "{} {}".format(command, ",".join(group))
+        if group_keys:
+            line += " " + ",".join(group_keys)
+        line += "\r\n"
+        lines.append(line if isinstance(line, bytes) else line.encode("utf-8"))
+    return lines
+
+
+class Message(object):
+    """A single line from a server, split into its tags, prefix, command and
+    parameters.  parse leaves the prefix, parameters and tags as the bytes
+    they arrived as, and each is decoded the first time it is read
+    """
+
+    __slots__ = ("command", "_prefix", "_params", "_raw_tags", "_tags")
+
+    def __init__(self, command, params=None, prefix=None, tags=None,
+                 raw_tags=None):
+        self.command = command
+        self._params = params if params is not None else []
+        self._prefix = prefix
+        self._raw_tags = raw_tags
+        self._tags = tags
+
+    @property
+    def prefix(self):
+        prefix = self._prefix
+        if _DECODE and prefix.__class__ is bytes:
+            prefix = self._prefix = decode(prefix)
+        return prefix
+
+    @prefix.setter
+    def prefix(self, value):
+        self._prefix = value
+
+    @property
+    def params(self):
+        params = self._params
+        if _DECODE and params and params[0].__class__ is bytes:
+            params = self._params = [decode(param) for param in params]
+        return params
+
+    @params.setter
+    def params(self, value):
+        self._params = value
+
+    @property
+    def raw_tags(self):
+        """The tags as they came, before being split up"""
+        raw_tags = self._raw_tags
+        if _DECODE and raw_tags.__class__ is bytes:
+            raw_tags = self._raw_tags = decode(raw_tags)
+        return raw_tags
+
+    @raw_tags.setter
+    def raw_tags(self, value):
+        self._raw_tags = value
+
+    @property
+    def tags(self):
+        """The IRCv3 tags of the message, only parsed when first asked for"""
+        if self._tags is None:
+            self._tags = parse_tags(self.raw_tags) if self.raw_tags else {}
+        return self._tags
+
+    @property
+    def time(self):
+        """When the server says the message was sent (its server-time tag),
+        in seconds since the epoch, or None if it didn't say
+        """
+        if not self.raw_tags or "time=" not in self.raw_tags:
+            return None
+        value = self.tags.get("time")
+        return parse_time(value) if value else None
+
+    @property
+    def nick(self):
+        """The nickname (or server name) the message came from"""
+        if self.prefix is None:
+            return None
+        return self.prefix.split("!", 1)[0].split("@", 1)[0]
+
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+        return (self.command == other.command and
+                self.params == other.params and
+                self.prefix == other.prefix and
+                self.tags == other.tags)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self):
+        return "Message({!r}, {!r}, prefix={!r}, tags={!r})".format(
+            self.command, self.params, self.prefix, self.tags)
+
+    def __str__(self):
+        parts = []
+        if self._raw_tags or self._tags:
+            parts.append("@" + (self.raw_tags or ";".join(
+                "{}={}".format(key, value) if value else key
+                for key, value in sorted(self._tags.items()))))
+        if self.prefix is not None:
+            parts.append(":" + self.prefix)
+        parts.append(self.command)
+        if self.params:
+            last = self.params[-1]
+            parts.extend(self.params[:-1])
+            if not last or " " in last or last.startswith(":"):
+                last = ":" + last
+            parts.append(last)
+        return " ".join(parts)
+
+
+def parse(line, _new=object.__new__):
+    """Parses a line (without its line ending) into a Message.  The line is
+    split as bytes, and only the command is decoded straight away.  Text
+    is encoded first.  Returns None for blank lines
+    """
+    if line.__class__ is not bytes:
+        line = encode(line)
+    raw_tags = prefix = None
+    first = line[:1]
+    if first == b"@":
+        raw_tags, _, line = line[1:].partition(b" ")
+        first = line[:1]
+    if first == b":":
+        prefix, _, line = line[1:].partition(b" ")
+
+    trailing = line.find(b" :")
+    if trailing < 0:
+        params = line.split()
+    else:
+        params = line[:trailing].split()
+        params.append(line[trailing + 2:])
+    if not params:
+        return None
+
+    ## Skips Message.__init__, which is most of the cost of a short line
+    message = _new(Message)
+    command = params.pop(0).upper()
+    ## Commands are ASCII, which latin-1 decodes fastest and can't fail on
+    message.command = command.decode("latin-1") if _DECODE else command
+    message._params = params
+    message._prefix = prefix
+    message._raw_tags = raw_tags
+    message._tags = None
+    return message
+
+
+class Dispatcher(object):
+    """Routes Messages to handlers through a dict keyed on the command (or
+    numeric) of the message
+    """
+
+    def __init__(self, handlers=None):
+        """Constructor for Dispatcher.  handlers maps a command to a
+        handler or a list of handlers
+        """
+
+        # This is a mapping of command to the handlers it is routed to
+        # {
+        #  "PING": (handler1,),
+        #  "001": (handler2, handler3)
+        # }
+        self.table = {}
+
+        for command, handler in (handlers or {}).items():
+            if callable(handler):
+                handler = [handler]
+            for handler_ in handler:
+                self.register(command, handler_)
+
+    def register(self, command, handler):
+        """Adds a handler for a command.  Handlers are called with the server
+        name and the Message, and return True if they consumed the message
+        """
+        command = command.upper()
+        self.table[command] = self.table.get(command, ()) + (handler,)
+
+    def unregister(self, command, handler):
+        command = command.upper()
+        handlers = tuple(h for h in self.table.get(command, ())
+                         if h != handler)
+        if handlers:
+            self.table[command] = handlers
+        else:
+            self.table.pop(command, None)
+
+    def dispatch(self, hostname, message):
+        """Calls every handler for the message's command.  Returns True if
+        any of them consumed the message.  A handler that raises is logged
+        and the rest are still called, so one odd line can't take the
+        connection down
+        """
+        consumed = False
+        for handler in self.table.get(message.command, ()):
+            try:
+                if handler(hostname, message):
+                    consumed = True
+            except Exception as e:
+                log.exception(e)
+        return consumed
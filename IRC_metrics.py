@@ -0,0 +1,326 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+from bisect import bisect_left
+import logging
+import sys
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+## The most precise clock there is, for timing parsing and dispatch
+clock = getattr(time, "perf_counter", time.time)
+
+## Upper bounds (in seconds) of a timing Histogram's buckets, doubling from
+## a microsecond to a bit over a minute.  Anything slower goes in the last
+TIME_BUCKETS = tuple(1e-6 * 2 ** n for n in range(27))
+
+
+class Histogram(object):
+    """Counts values into fixed buckets, so keeping it costs the same no
+    matter how many values go in.  Percentiles come out as the upper bound
+    of the bucket they fall in
+    """
+
+    __slots__ = ("bounds", "counts", "count", "total", "min", "max")
+
+    def __init__(self, bounds=TIME_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """The bucket bound at or below which fraction of the values fall,
+        or None if there are no values
+        """
+        if not self.count:
+            return None
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max)
+        return self.max
+
+    def buckets(self):
+        """(upper bound, count) for every bucket, the last bound being
+        infinite
+        """
+        return list(zip(self.bounds + (float("inf"),), self.counts))
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class SamplingProfiler(threading.Thread):
+    """Looks at what one thread is doing every interval seconds and counts
+    the stacks it sees, folded into "module:function;module:function"
+    strings (the format flame graph tools take).  The thread being
+    profiled does no extra work at all
+    """
+
+    def __init__(self, thread_id=None, interval=.005, depth=64):
+        if interval <= 0:
+            raise ValueError("interval must be more than 0")
+        super(SamplingProfiler, self).__init__()
+        self.daemon = True
+        self.thread_id = (thread_id if thread_id is not None else 
+                          threading.current_thread().ident)
+        self.interval = interval
+        self.depth = depth
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.samples = 0
+        
+        # This is a mapping of folded stack to how many samples saw it
+        self.stacks = {}
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            names = []
+            while frame is not None and len(names) < self.depth:
+                code = frame.f_code
+                names.append("{}:{}".format(
+                    frame.f_globals.get("__name__", "?"), code.co_name))
+                frame = frame.f_back
+            del frame
+            stack = ";".join(reversed(names))
+            with self.lock:
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(1)
+
+    def folded(self):
+        """One "stack count" line per stack seen, most common first"""
+        with self.lock:
+            stacks = sorted(self.stacks.items(), key=lambda item: -item[1])
+        return ["{} {}".format(stack, count) for stack, count in stacks]
+
+
+class Metrics(object):
+    """Counters and Histograms for an IRC_sockselect.IRC_member, kept only
+    once attached to one.  Bytes and lines in are counted on every read;
+    parse and dispatch times are taken for one read in sample_every so the
+    per-line cost stays off the hot path.  What is sent is counted as it
+    goes out, and queue depths come from the member's SendQueues when a
+    snapshot is taken
+    """
+
+    def __init__(self, sample_every=16, prefix="pyirc"):
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1")
+        self.sample_every = sample_every
+        self.prefix = prefix
+        self.members = []
+        self.reads = 0
+        self.profiler = None
+        
+        # These are mappings of metric name to a mapping of server name
+        # (None for the member as a whole) to its value
+        # {
+        #  "bytes_in_total": {"some_server": 4096},
+        #  "poll_wait_seconds": {None: Histogram(...)}
+        # }
+        self.counters = {}
+        self.histograms = {}
+
+    def attach(self, member):
+        """Starts collecting from member"""
+        member.metrics = self
+        self.members.append(member)
+        
+    def detach(self, member):
+        member.metrics = None
+        self.members.remove(member)
+
+    def count(self, name, hostname=None, amount=1):
+        values = self.counters.get(name)
+        if values is None:
+            values = self.counters[name] = {}
+        values[hostname] = values.get(hostname, 0) + amount
+
+    def histogram(self, name, hostname=None):
+        values = self.histograms.get(name)
+        if values is None:
+            values = self.histograms[name] = {}
+        histogram = values.get(hostname)
+        if histogram is None:
+            histogram = values[hostname] = Histogram()
+        return histogram
+
+    def observe(self, name, hostname, value):
+        self.histogram(name, hostname).add(value)
+
+    def received(self, hostname, nbytes, nlines):
+        self.count("bytes_in_total", hostname, nbytes)
+        self.count("lines_in_total", hostname, nlines)
+
+    def sent(self, hostname, nbytes, nlines):
+        ## Counted here rather than read off the SendQueue, which goes
+        ## with the link and would take its counts with it
+        self.count("bytes_out_total", hostname, nbytes)
+        self.count("lines_out_total", hostname, nlines)
+
+    def sample(self):
+        """Whether to time this read's lines"""
+        self.reads += 1
+        return not self.reads % self.sample_every
+
+    def timed(self, hostname, parse, dispatch):
+        """parse and dispatch wrapped to record how long each call takes"""
+        parse_times = self.histogram("parse_seconds", hostname).add
+        dispatch_times = self.histogram("dispatch_seconds", hostname).add
+        
+        def timed_parse(line):
+            start = clock()
+            message = parse(line)
+            parse_times(clock() - start)
+            return message
+            
+        def timed_dispatch(hostname, message):
+            start = clock()
+            consumed = dispatch(hostname, message)
+            dispatch_times(clock() - start)
+            return consumed
+            
+        return timed_parse, timed_dispatch
+
+    def acquire(self, lock, hostname=None):
+        """Acquires lock, recording how long that took"""
+        start = clock()
+        lock.acquire()
+        self.observe("lock_wait_seconds", hostname, clock() - start)
+
+    def profile(self, enabled=True, interval=.005, thread_id=None):
+        """Starts (or stops) sampling the stack of the thread calling this
+        (or thread_id).  Returns the SamplingProfiler, whose folded()
+        stacks stay available after it is stopped
+        """
+        profiler = self.profiler
+        if profiler is not None and (not enabled or not profiler.is_alive()):
+            profiler.stop()
+        if enabled and (profiler is None or not profiler.is_alive()):
+            profiler = self.profiler = SamplingProfiler(thread_id, interval)
+            profiler.start()
+        return profiler
+
+    def snapshot(self):
+        """Every metric as plain dicts: counters and gauges map server name
+        to a number, histograms map it to a dict of figures
+        """
+        gauges = {"send_queue_lines": {}, "send_queue_bytes": {}}
+        counters = dict((name, dict(values)) 
+                        for name, values in self.counters.items())
+        for member in self.members:
+            for hostname, queue in list(member.send_queues.items()):
+                stats = queue.stats()
+                gauges["send_queue_lines"][hostname] = stats["queued_lines"]
+                gauges["send_queue_bytes"][hostname] = stats["queued_bytes"]
+        histograms = {}
+        for name, values in self.histograms.items():
+            histograms[name] = dict(
+                (hostname, {"count": histogram.count, 
+                            "sum": histogram.total,
+                            "mean": histogram.mean,
+                            "p50": histogram.percentile(.5),
+                            "p99": histogram.percentile(.99),
+                            "max": histogram.max})
+                for hostname, histogram in values.items())
+        return {"counters": counters, "gauges": gauges, 
+                "histograms": histograms}
+
+    def prometheus(self):
+        """Every metric in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for kind, metrics in (("counter", snapshot["counters"]), 
+                              ("gauge", snapshot["gauges"])):
+            for name in sorted(metrics):
+                full_name = "{}_{}".format(self.prefix, name)
+                lines.append("# TYPE {} {}".format(full_name, kind))
+                for hostname, value in sorted(metrics[name].items(), 
+                                              key=_by_server):
+                    lines.append("{}{} {}".format(full_name, 
+                                                  _labels(hostname), value))
+        for name in sorted(self.histograms):
+            full_name = "{}_{}".format(self.prefix, name)
+            lines.append("# TYPE {} histogram".format(full_name))
+            for hostname, histogram in sorted(self.histograms[name].items(),
+                                              key=_by_server):
+                seen = 0
+                for bound, count in histogram.buckets():
+                    seen += count
+                    lines.append("{}_bucket{} {}".format(
+                        full_name, _labels(hostname, le=_number(bound)), 
+                        seen))
+                lines.append("{}_sum{} {!r}".format(
+                    full_name, _labels(hostname), histogram.total))
+                lines.append("{}_count{} {}".format(
+                    full_name, _labels(hostname), histogram.count))
+        return "\n".join(lines) + "\n"
+        
+        
+def _by_server(item):
+    return item[0] or ""
+    
+    
+def _number(value):
+    return "+Inf" if value == float("inf") else repr(value)
+    
+    
+def _labels(hostname, **extra):
+    labels = []
+    if hostname is not None:
+        labels.append(("server", hostname))
+    labels.extend(sorted(extra.items()))
+    if not labels:
+        return ""
+    return "{{{}}}".format(",".join(
+        '{}="{}"'.format(key, value.replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels))
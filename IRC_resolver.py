@@ -0,0 +1,202 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+try:
+    import selectors
+except ImportError:
+    import selectors2 as selectors
+finally:
+    from multiprocessing.pool import ThreadPool
+    import errno
+    import os
+    import socket
+    import threading
+    import time
+
+
+class Resolver(object):
+    """Looks up servers with getaddrinfo, for IPv4 and IPv6 alike, and
+    keeps the answers for ttl seconds.  Failed lookups are remembered for
+    negative_ttl seconds.  Lookups and connects for many servers run on a
+    pool of worker threads
+    """
+
+    def __init__(self, ttl=300, negative_ttl=30, workers=8, 
+                 getaddrinfo=socket.getaddrinfo, clock=time.time):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.workers = workers
+        self.getaddrinfo = getaddrinfo
+        self.clock = clock
+
+        # This is a mapping of (hostname, port) to (expiry time, answer)
+        # where the answer is either the getaddrinfo list or the gaierror
+        # that it raised
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def resolve(self, hostname, port):
+        """Returns getaddrinfo's answer for a TCP connection to hostname,
+        from the cache if it is fresh.  Raises socket.gaierror if the name
+        doesn't resolve
+        """
+        key = hostname, port
+        now = self.clock()
+        with self.lock:
+            expires, answer = self.cache.get(key, (0, None))
+        if expires <= now:
+            try:
+                answer = self.getaddrinfo(hostname, port, socket.AF_UNSPEC,
+                                          socket.SOCK_STREAM)
+                expires = now + self.ttl
+            except socket.gaierror as e:
+                answer = e
+                expires = now + self.negative_ttl
+            with self.lock:
+                self.cache[key] = expires, answer
+        if isinstance(answer, socket.gaierror):
+            raise answer
+        return answer
+
+    def resolve_async(self, hostname, port):
+        """Starts resolving on a worker thread, returning an AsyncResult"""
+        return self._pool().apply_async(self.resolve, (hostname, port))
+
+    def forget(self, hostname=None):
+        """Drops cached answers for hostname, or for everything"""
+        with self.lock:
+            for key in list(self.cache):
+                if hostname is None or key[0] == hostname:
+                    del self.cache[key]
+
+    def connect(self, hostname, port, timeout=10, delay=.25):
+        """Connects to hostname the happy eyeballs way (RFC 8305).  A new
+        attempt starts every delay seconds, alternating between IPv6 and
+        IPv4 addresses, and the first to connect wins.  Returns the socket,
+        left in blocking mode
+        """
+        addresses = interleave(self.resolve(hostname, port))
+        selector = selectors.DefaultSelector()
+        attempts = []
+        error = socket.error(errno.ECONNREFUSED,
+                             "No addresses for {}".format(hostname))
+        deadline = self.clock() + timeout
+        next_attempt = 0
+        try:
+            while addresses or attempts:
+                now = self.clock()
+                if now >= deadline:
+                    raise socket.timeout("Timed out connecting to {}".format(
+                        hostname))
+                if addresses and (now >= next_attempt or not attempts):
+                    try:
+                        sock = self._start(addresses.pop(0))
+                    except socket.error as e:
+                        error = e
+                        continue
+                    attempts.append(sock)
+                    selector.register(sock, selectors.EVENT_WRITE)
+                    next_attempt = now + delay
+                    
+                wait = deadline - now
+                if addresses:
+                    wait = min(wait, max(0, next_attempt - now))
+                for key, _ in selector.select(wait):
+                    sock = key.fileobj
+                    selector.unregister(sock)
+                    attempts.remove(sock)
+                    err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if err:
+                        error = socket.error(err, "Connect to {} failed".format(
+                            hostname))
+                        sock.close()
+                        continue
+                    sock.setblocking(True)
+                    return sock
+            raise error
+        finally:
+            for sock in attempts:
+                sock.close()
+            selector.close()
+
+    def connect_async(self, hostname, port, timeout=10):
+        """Starts connecting on a worker thread, returning an AsyncResult"""
+        return self._pool().apply_async(self.connect, 
+                                        (hostname, port, timeout))
+
+    def connect_many(self, servers, timeout=10):
+        """Connects to every (hostname, port) in servers at once.  Returns a
+        mapping of (hostname, port) to the connected socket or the
+        exception connecting raised
+        """
+        pending = [(server, self.connect_async(server[0], server[1], timeout))
+                   for server in servers]
+        results = {}
+        for server, result in pending:
+            try:
+                results[server] = result.get()
+            except (socket.error, socket.gaierror) as e:
+                results[server] = e
+        return results
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def _pool(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPool(self.workers)
+            return self.pool
+
+    def _start(self, address):
+        """Starts a non-blocking connect to one getaddrinfo entry.  Raises
+        socket.error if it fails straight away
+        """
+        family, type_, proto, _, sockaddr = address
+        sock = socket.socket(family, type_, proto)
+        sock.setblocking(False)
+        err = sock.connect_ex(sockaddr)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            sock.close()
+            raise socket.error(err, "Connect to {} failed: {}".format(
+                sockaddr[0], os.strerror(err)))
+        return sock
+
+
+def interleave(addresses):
+    """Orders getaddrinfo's answer IPv6 first, then alternating families"""
+    by_family = {}
+    for address in addresses:
+        by_family.setdefault(address[0], []).append(address)
+    families = sorted(by_family, key=lambda family: family != socket.AF_INET6)
+    ordered = []
+    while any(by_family.values()):
+        for family in families:
+            if by_family[family]:
+                ordered.append(by_family[family].pop(0))
+    return ordered
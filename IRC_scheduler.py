@@ -0,0 +1,108 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import heapq
+import itertools
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+class Timer(object):
+    """A call waiting on a Scheduler's heap.  Cancelled timers stay on the
+    heap and are skipped when they come up
+    """
+
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __repr__(self):
+        return "Timer({!r}, {!r})".format(self.when, self.callback)
+
+
+class Scheduler(object):
+    """Timers for every connection on one heap, run from the event loop
+    rather than a thread each.  The loop sleeps for at most ready_in and
+    then calls run_due
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        
+        # This is a heap of (when, sequence number, Timer).  The sequence
+        # number keeps timers due at the same time in the order they were
+        # made, and keeps Timers from being compared
+        self.heap = []
+        self.sequence = itertools.count()
+
+    def __len__(self):
+        return sum(1 for _, _, timer in self.heap if not timer.cancelled)
+
+    def call_at(self, when, callback, *args):
+        """Calls callback(*args) once the clock reaches when.  Returns the
+        Timer, which can be cancelled
+        """
+        timer = Timer(when, callback, args)
+        heapq.heappush(self.heap, (when, next(self.sequence), timer))
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def ready_in(self):
+        """Seconds until the next timer is due, or None if there are none"""
+        heap = self.heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return max(0.0, heap[0][0] - self.clock())
+
+    def run_due(self):
+        """Runs every timer that is due.  Returns how many ran"""
+        now = self.clock()
+        heap = self.heap
+        ran = 0
+        while heap and heap[0][0] <= now:
+            _, _, timer = heapq.heappop(heap)
+            if timer.cancelled:
+                continue
+            ran += 1
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                log.exception(e)
+        return ran
@@ -0,0 +1,90 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+from collections import deque
+from itertools import islice
+import threading
+
+
+class Scrollback(object):
+    """The last maxlen lines from one server.  Every line gets a sequence
+    number, which keeps counting up as old lines fall off the front, so a
+    reader holding the number it has read up to can ask for just what came
+    after it
+    """
+
+    def __init__(self, maxlen=1000):
+        self.lines = deque(maxlen=maxlen)
+        
+        ## Sequence number the next line will get
+        self.next_seq = 0
+        
+        ## Only this connection's reader and writers ever wait on it
+        self.lock = threading.Lock()
+
+    @property
+    def first_seq(self):
+        """Sequence number of the oldest line still held"""
+        return self.next_seq - len(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.lines))
+
+    def __getitem__(self, index):
+        with self.lock:
+            if isinstance(index, slice):
+                return list(self.lines)[index]
+            return self.lines[index]
+
+    def __repr__(self):
+        return "Scrollback({!r}, next_seq={})".format(list(self), 
+                                                      self.next_seq)
+
+    def append(self, line):
+        with self.lock:
+            self.lines.append(line)
+            self.next_seq += 1
+
+    def extend(self, lines):
+        with self.lock:
+            self.lines.extend(lines)
+            self.next_seq += len(lines)
+
+    def since(self, seq=0):
+        """Returns the lines numbered seq onwards (or from the oldest one
+        still held, if seq has already fallen off) and the sequence number
+        to ask for next time.  Only the new lines are walked over
+        """
+        with self.lock:
+            count = self.next_seq - max(seq, self.first_seq)
+            if count <= 0:
+                return [], self.next_seq
+            lines = list(islice(reversed(self.lines), count))
+            lines.reverse()
+            return lines, self.next_seq
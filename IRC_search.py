@@ -0,0 +1,292 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+"""A full-text index over what IRC_history archives.  Every archived message
+gets an id, counting up from 0 in the order messages arrive, and every word,
+nick and channel has a posting list of the ids it appears in.  Posting
+lists hold the gaps between ids as varints, so a common word costs about a
+byte per message.  Queries intersect the posting lists lazily and yield
+results as they are found.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from itertools import count
+import re
+
+from IRC_message import parse
+from IRC_state import casefold
+
+try:
+    basestring
+except NameError:
+    basestring = str
+try:
+    array("Q")
+    OFFSET_TYPE = "Q"
+except ValueError:
+    OFFSET_TYPE = "L" ## Python 2 has no "Q"; "L" is 64 bits on most systems
+
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+## Commands whose last parameter is text worth searching
+TEXT_COMMANDS = ("PRIVMSG", "NOTICE", "TOPIC", "KICK", "PART")
+
+
+def as_text(text):
+    """text, decoded if it is bytes, so that what is indexed and what is
+    searched for compare alike on Python 2
+    """
+    if isinstance(text, bytes):
+        return text.decode("utf-8", "replace")
+    return text
+
+
+def encode_varint(number, out):
+    """Appends number to the bytearray out, 7 bits a byte, low bits first"""
+    while number > 0x7F:
+        out.append(number & 0x7F | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def decode_varints(data):
+    """Yields every number encoded in data"""
+    number = shift = 0
+    for byte in data:
+        number |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield number
+            number = shift = 0
+
+
+class PostingList(object):
+    """The ids of the messages a token appears in, in increasing order"""
+
+    __slots__ = ("data", "last", "count")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.last = -1
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        message_id = -1
+        for gap in decode_varints(self.data):
+            message_id += gap
+            yield message_id
+
+    def append(self, message_id):
+        if message_id <= self.last:
+            return
+        encode_varint(message_id - self.last, self.data)
+        self.last = message_id
+        self.count += 1
+
+
+def intersect(iterators):
+    """Yields the ids every one of several increasing iterators yields"""
+    iterators = [iter(ids) for ids in iterators]
+    try:
+        current = [next(ids) for ids in iterators]
+        while True:
+            highest = max(current)
+            for i, ids in enumerate(iterators):
+                while current[i] < highest:
+                    current[i] = next(ids)
+            if max(current) == highest:
+                yield current[0]
+                current = [next(ids) for ids in iterators]
+    except StopIteration:
+        return
+
+
+class SearchIndex(object):
+    """Indexes every message an IRC_history.Archive stores, as it stores it,
+    and answers queries by word, nick, channel and time
+    """
+
+    def __init__(self, archive=None):
+        self.archive = archive
+        
+        # These are mappings of folded word, folded nick and channel id to
+        # the PostingList of messages they are in
+        self.words = {}
+        self.nicks = {}
+        self.channels = {}
+        
+        # Channel ids are positions in this list of (server name, folded
+        # channel name), and channel_ids maps back from those to the id
+        self.channel_names = []
+        self.channel_ids = {}
+        
+        # Indexed by message id.  times holds when each message was said,
+        # which a late or replayed one puts behind what came before it.
+        # latest holds the latest time so far, which never goes backwards,
+        # so a time window is a range of ids found by bisecting it, give
+        # or take the late messages
+        self.times = array("d")
+        self.latest = array("d")
+        self.locations = array("I")
+        self.offsets = array(OFFSET_TYPE)
+        
+        # The ids of messages stamped earlier than one before them, in
+        # increasing order
+        self.late = array("I")
+        
+        if archive is not None:
+            archive.index = self
+
+    def __len__(self):
+        return len(self.times)
+
+    @classmethod
+    def build_from(cls, archive):
+        """A SearchIndex of everything archive already holds on disk, oldest
+        first, which then goes on to index what archive stores from now on
+        """
+        index = cls(archive)
+        logs = [cls._records(archive, i, hostname, chan_name)
+                for i, (hostname, chan_name) in enumerate(archive.channels())]
+        for timestamp, _, offset, hostname, chan_name, line in merge(*logs):
+            index.add(hostname, chan_name, parse(line), offset, timestamp)
+        return index
+
+    @staticmethod
+    def _records(archive, i, hostname, chan_name):
+        """The records of one log, as tuples that merge in time order"""
+        for offset, timestamp, line in archive.channel_log(
+                hostname, chan_name).records():
+            yield timestamp, i, offset, hostname, chan_name, line
+
+    def add(self, hostname, chan_name, message, offset=0, timestamp=0.0):
+        """Indexes a Message that was archived at offset in the log of
+        chan_name on hostname.  Returns its id
+        """
+        text = (message.params[-1] 
+                if message.command in TEXT_COMMANDS and message.params 
+                else "")
+        return self.add_text(hostname, chan_name, message.nick, text, offset,
+                             timestamp)
+
+    def add_text(self, hostname, chan_name, nick, text, offset=0, 
+                 timestamp=0.0):
+        message_id = len(self.times)
+        latest = timestamp
+        if self.latest and timestamp < self.latest[-1]:
+            latest = self.latest[-1]
+            self.late.append(message_id)
+        self.times.append(timestamp)
+        self.latest.append(latest)
+        self.offsets.append(offset)
+        
+        channel = (hostname, casefold(chan_name))
+        channel_id = self.channel_ids.get(channel)
+        if channel_id is None:
+            channel_id = self.channel_ids[channel] = len(self.channel_names)
+            self.channel_names.append(channel)
+            self.channels[channel_id] = PostingList()
+        self.locations.append(channel_id)
+        self.channels[channel_id].append(message_id)
+        
+        if nick:
+            self._post(self.nicks, casefold(nick), message_id)
+        if text:
+            for word in WORD.findall(as_text(text).lower()):
+                self._post(self.words, word, message_id)
+        return message_id
+
+    def ids(self, words=(), nick=None, channel=None, start=None, end=None):
+        """Yields the id of every message, in the order they were indexed,
+        that has all of words, came from nick, is in channel (a (server,
+        channel name) pair) and is stamped from start to end
+        """
+        times = self.times
+        first = bisect_left(self.latest, start) if start is not None else 0
+        stop = (bisect_right(self.latest, end) if end is not None 
+                else len(times))
+        ## Late messages past stop can still have been said in the window
+        late = set(message_id for message_id in 
+                   self.late[bisect_left(self.late, stop):]
+                   if (start is None or times[message_id] >= start) and
+                   times[message_id] <= end)
+        last = max(late) + 1 if late else stop
+        
+        lists = []
+        if isinstance(words, (bytes, basestring)):
+            words = WORD.findall(as_text(words).lower())
+        for word in words:
+            lists.append(self.words.get(as_text(word).lower()))
+        if nick is not None:
+            lists.append(self.nicks.get(casefold(nick)))
+        if channel is not None:
+            channel_id = self.channel_ids.get((channel[0], 
+                                               casefold(channel[1])))
+            lists.append(self.channels.get(channel_id))
+        if None in lists:
+            return
+            
+        if lists:
+            ## The rarest token drives the intersection
+            lists.sort(key=len)
+            matches = intersect(lists)
+        else:
+            matches = count(first)
+        for message_id in matches:
+            if message_id >= last:
+                return
+            if message_id < first:
+                continue
+            if message_id >= stop:
+                if message_id in late:
+                    yield message_id
+            elif (start is None or times[message_id] >= start) and \
+                 (end is None or times[message_id] <= end):
+                yield message_id
+
+    def search(self, words=(), nick=None, channel=None, start=None, 
+               end=None):
+        """Like ids, but yields (timestamp, server name, channel, line)
+        read back from the archive
+        """
+        for message_id in self.ids(words, nick, channel, start, end):
+            hostname, chan_name = self.channel_names[
+                self.locations[message_id]]
+            timestamp, line = self.archive.channel_log(
+                hostname, chan_name).record(self.offsets[message_id])
+            yield timestamp, hostname, chan_name, line
+
+    def _post(self, postings, token, message_id):
+        posting = postings.get(token)
+        if posting is None:
+            posting = postings[token] = PostingList()
+        posting.append(message_id)
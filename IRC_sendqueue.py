@@ -0,0 +1,169 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+from collections import deque
+import socket
+import time
+
+from IRC_message import encode
+
+
+class TokenBucket(object):
+    """The flood control of RFC 1459 section 8.10.  Every line pushes a
+    timer penalty seconds further ahead, and lines may only be sent while
+    the timer is less than window seconds ahead of now.  With the defaults
+    that is a burst of 5 lines and then one line every 2 seconds, which is
+    what most ircds enforce
+    """
+
+    def __init__(self, penalty=2.0, window=10.0, byte_penalty=0.0,
+                 clock=time.time):
+        """Constructor for TokenBucket.  byte_penalty adds extra seconds per
+        byte, for servers (like ircu) that charge more for longer lines
+        """
+
+        self.penalty = penalty
+        self.window = window
+        self.byte_penalty = byte_penalty
+        self.clock = clock
+        self.timer = 0.0
+
+    def ready_in(self, now=None):
+        """Seconds until another line may be sent, 0 if one may go now"""
+        if now is None:
+            now = self.clock()
+        return max(0.0, self.timer - now - self.window)
+
+    def allows(self, now):
+        return self.timer - now < self.window
+
+    def consume(self, nbytes, now):
+        self.timer = (max(self.timer, now) + self.penalty +
+                      nbytes * self.byte_penalty)
+
+
+class SendQueue(object):
+    """Lines waiting to be sent to one server.  PONG and QUIT go in a lane
+    that is always emptied before the one everything else waits in, and
+    both lanes are paced by a TokenBucket
+    """
+
+    HIGH_PRIORITY = frozenset([b"PONG", b"QUIT"])
+
+    def __init__(self, bucket=None, clock=time.time):
+        self.bucket = bucket if bucket is not None else TokenBucket(
+            clock=clock)
+        self.clock = clock
+
+        # Entries are (line, time it was queued)
+        self.high = deque()
+        self.normal = deque()
+
+        # Whatever the last send didn't manage to write
+        self.pending = b""
+
+        self.queued_bytes = 0
+        self.sent_lines = 0
+        self.sent_bytes = 0
+        self.total_delay = 0.0
+        self.max_delay = 0.0
+        self.last_delay = 0.0
+
+    def __len__(self):
+        return len(self.high) + len(self.normal)
+
+    def put(self, line, high_priority=None):
+        """Queues a line, which should already end in CRLF.  Text is
+        encoded as it is queued.  Whether it jumps the queue is worked out
+        from its command unless given
+        """
+        if line.__class__ is not bytes:
+            line = encode(line)
+        if high_priority is None:
+            ## A blank line has no command, and just waits its turn
+            command = line.split(None, 1)[:1]
+            high_priority = bool(command) and (command[0].upper() in 
+                                               self.HIGH_PRIORITY)
+        lane = self.high if high_priority else self.normal
+        lane.append((line, self.clock()))
+        self.queued_bytes += len(line)
+
+    def ready_in(self):
+        """Seconds until flush could send something, or None if there is
+        nothing to send
+        """
+        if self.pending:
+            return 0.0
+        if self.high or self.normal:
+            return self.bucket.ready_in()
+        return None
+
+    def flush(self, sock, force=False):
+        """Sends every line the bucket allows (all of them if force is
+        set) in a single send.  Returns the number of bytes still waiting
+        """
+        now = self.clock()
+        batch = [self.pending]
+        bucket = self.bucket
+        while (self.high or self.normal) and (force or bucket.allows(now)):
+            line, queued_at = (self.high or self.normal).popleft()
+            bucket.consume(len(line), now)
+            self.queued_bytes -= len(line)
+            self._record(now - queued_at)
+            batch.append(line)
+            
+        data = b"".join(batch)
+        self.pending = b""
+        if data:
+            try:
+                sent = sock.send(data)
+            except socket.timeout:
+                sent = 0
+            except socket.error:
+                self.pending = data
+                raise
+            self.sent_bytes += sent
+            self.pending = data[sent:]
+        return len(self.pending) + self.queued_bytes
+
+    def stats(self):
+        """Queue depth and delay figures for this connection"""
+        return {
+            "queued_lines": len(self),
+            "queued_bytes": self.queued_bytes + len(self.pending),
+            "sent_lines": self.sent_lines,
+            "sent_bytes": self.sent_bytes,
+            "last_delay": self.last_delay,
+            "max_delay": self.max_delay,
+            "mean_delay": (self.total_delay / self.sent_lines 
+                           if self.sent_lines else 0.0),
+        }
+
+    def _record(self, delay):
+        self.sent_lines += 1
+        self.total_delay += delay
+        self.last_delay = delay
+        if delay > self.max_delay:
+            self.max_delay = delay
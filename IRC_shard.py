@@ -0,0 +1,375 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+from bisect import bisect
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import select
+import struct
+
+import IRC_sockselect
+from IRC_message import Dispatcher, Message
+from IRC_scrollback import Scrollback
+
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+def _point(key):
+    """Where key lands on the ring"""
+    if not isinstance(key, bytes):
+        key = key.encode("utf-8")
+    return struct.unpack("<Q", hashlib.md5(key).digest()[:8])[0]
+
+
+class HashRing(object):
+    """Consistent hashing of keys onto nodes.  Every node is put on the ring
+    replicas times, so adding or removing one only moves the keys it
+    gains or loses, about 1/N of them
+    """
+
+    def __init__(self, nodes=(), replicas=64):
+        self.replicas = replicas
+        
+        # Sorted points on the ring, and the node each one belongs to
+        self.points = []
+        self.owners = []
+        
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for replica in range(self.replicas):
+            point = _point("{}-{}".format(node, replica))
+            index = bisect(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, node)
+
+    def remove(self, node):
+        kept = [(point, owner) for point, owner in zip(self.points, 
+                                                       self.owners)
+                if owner != node]
+        self.points = [point for point, _ in kept]
+        self.owners = [owner for _, owner in kept]
+
+    def node(self, key):
+        """The node key belongs to: the first point clockwise of it"""
+        if not self.points:
+            raise LookupError("No nodes on the ring")
+        index = bisect(self.points, _point(key)) % len(self.points)
+        return self.owners[index]
+
+
+class ShardWorker(IRC_sockselect.IRC_member):
+    """An IRC_sockselect.IRC_member that runs in a worker process.  It takes
+    calls from the coordinator over conn, and sends back every line its own
+    handlers, subscriptions and batch holds let through, with the fields it
+    was parsed into, once per tick, and word of every link it loses
+    """
+
+    def __init__(self, conn, nick, **kwargs):
+        super(ShardWorker, self).__init__(nick, **kwargs)
+        self.conn = conn
+        self.serving = False
+        
+        ## (hostname, line, fields) for every line to pass on at the end of
+        ## the tick, where fields are the arguments to rebuild its Message
+        ## with
+        self.outbox = []
+        
+        ## Calls arrive through the same selector as the servers.  None
+        ## can't be a server name, so it marks the pipe
+        self.selector.register(conn, IRC_sockselect.selectors.EVENT_READ, 
+                               None)
+        
+    def run(self, timeout=1, buff_size=4096):
+        """Serves the coordinator until it says to close or goes away.  This
+        doesn't set running, so calls like join_channels poll for
+        themselves rather than waiting on another thread
+        """
+        self.serving = True
+        while self.serving:
+            self.poll(timeout, buff_size)
+            self._send_outbox()
+        for hostname in list(self.servers):
+            self.leave_server(hostname)
+        self.conn.close()
+        
+    def read_ready(self, hostname, bsize=4096):
+        if hostname is not None:
+            return super(ShardWorker, self).read_ready(hostname, bsize)
+        while self.serving and self.conn.poll():
+            try:
+                request = self.conn.recv()
+            except EOFError:
+                self.serving = False
+                break
+            if request[0] == "close":
+                self.serving = False
+                break
+            call_id, method, args, kwargs = request
+            try:
+                result = getattr(self, method)(*args, **kwargs)
+            except Exception as e:
+                log.exception(e)
+                self.conn.send(("error", call_id, e))
+            else:
+                self.conn.send(("result", call_id, result))
+        return 0
+        
+    def _send_outbox(self):
+        if self.outbox:
+            self.conn.send(("events", self.outbox))
+            self.outbox = []
+        
+    def _store_replies(self, hostname, reply):
+        ## The coordinator keeps the scrollback.  Its Messages are rebuilt
+        ## from what parse made of the line, as they are, still undecoded
+        self.outbox.extend(
+            (hostname, line, (message.command, message._params, 
+                              message._prefix, message._tags, 
+                              message._raw_tags))
+            for line, message in reply)
+        
+    def _drop(self, hostname, reason):
+        super(ShardWorker, self)._drop(hostname, reason)
+        ## What the server said before it went goes first
+        self._send_outbox()
+        self.conn.send(("closed", hostname))
+        
+        
+def _work(conn, nick, kwargs):
+    ShardWorker(conn, nick, **kwargs).run()
+    
+    
+class IRC_member(object):
+    """Spreads an IRC_member's servers over several worker processes, each
+    picked for a server by consistent hashing of its name, so parsing for
+    busy networks isn't serialized on one GIL.  Workers send the lines they
+    didn't consume back over a pipe, already parsed; this coordinator keeps
+    the send and join methods of IRC_sockselect.IRC_member and dispatches
+    what comes back through its own dispatcher and scrollback, without
+    parsing it again
+    """
+    
+    def __init__(self, nick, shards=None, **kwargs):
+        """Constructor for IRC_member.  shards is how many worker processes
+        to start (one per core by default); kwargs are given to each
+        worker's IRC_sockselect.IRC_member
+        """
+        self.nick = nick
+        self.scrollback = kwargs.get("scrollback", 1000)
+        shards = shards or multiprocessing.cpu_count()
+        self.ring = HashRing(range(shards))
+        self.calls = itertools.count()
+        
+        # This is a list of (process, connection) for each worker
+        self.workers = []
+        for _ in range(shards):
+            ours, theirs = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_work, 
+                                              args=(theirs, nick, kwargs))
+            process.daemon = True
+            process.start()
+            theirs.close()
+            self.workers.append((process, ours))
+            
+        # This is a mapping of server name to the worker it is on
+        self.servers = {}
+        
+        # Every message a worker passes on is routed through this by its
+        # command
+        self.dispatcher = Dispatcher()
+        
+        # These are the same as in IRC_sockselect.IRC_member
+        self.replies = {}
+        self.cursors = {}
+        
+    def shard(self, hostname):
+        """The worker a server is (or would be) on"""
+        return self.ring.node(hostname)
+        
+    def join_server(self, hostname, port=6667, **kwargs):
+        """Joins a server on the worker it hashes to"""
+        if hostname in self.servers:
+            log.warning("Already connected to %s", hostname)
+            return 0
+        shard = self.shard(hostname)
+        result = self._call(shard, "join_server", hostname, port, **kwargs)
+        if not result:
+            self.servers[hostname] = shard
+        return result
+        
+    def join_servers(self, hostnames, port=6667, **kwargs):
+        """Joins several servers, every worker connecting to its share of
+        them at once.  Returns a mapping of hostname to return code
+        """
+        by_shard = {}
+        for hostname in hostnames:
+            if hostname not in self.servers:
+                by_shard.setdefault(self.shard(hostname), []).append(hostname)
+        calls = dict((shard, self._request(shard, "join_servers", names, 
+                                           port, **kwargs))
+                     for shard, names in by_shard.items())
+        results = dict.fromkeys((name for name in hostnames 
+                                 if name in self.servers), 0)
+        for shard, call_id in calls.items():
+            answers = self._wait(shard, call_id)
+            for hostname, result in answers.items():
+                if not result:
+                    self.servers[hostname] = shard
+            results.update(answers)
+        return results
+        
+    def leave_server(self, hostname):
+        result = self._forward("leave_server", hostname)
+        if not result:
+            del self.servers[hostname]
+        return result
+        
+    def send_server_message(self, hostname, message):
+        return self._forward("send_server_message", hostname, message)
+        
+    def send_channel_message(self, hostname, chan_name, message):
+        return self._forward("send_channel_message", hostname, chan_name, 
+                             message)
+        
+    def send_privmsg(self, hostname, username, message, force=False):
+        return self._forward("send_privmsg", hostname, username, message, 
+                             force=force)
+        
+    def join_channel(self, hostname, chan_name):
+        return self._forward("join_channel", hostname, chan_name)
+        
+    def leave_channel(self, hostname, chan_name):
+        return self._forward("leave_channel", hostname, chan_name)
+        
+    def join_channels(self, hostname, chan_names, keys=None, timeout=10):
+        return self._forward("join_channels", hostname, chan_names, 
+                             keys=keys, timeout=timeout)
+        
+    def leave_channels(self, hostname, chan_names):
+        return self._forward("leave_channels", hostname, chan_names)
+        
+    def poll(self, timeout=0):
+        """Waits up to timeout seconds for workers to pass messages on, and
+        dispatches them.  Returns the hostnames they came from
+        """
+        conns = dict((conn, shard) 
+                     for shard, (_, conn) in enumerate(self.workers))
+        ready, _, _ = select.select(list(conns), [], [], timeout)
+        hostnames = set()
+        for conn in ready:
+            while conn.poll():
+                received = self._receive(conns[conn])
+                if isinstance(received, set):
+                    hostnames.update(received)
+        return list(hostnames)
+        
+    def receive_all_messages(self, timeout=5):
+        """Waits up to timeout seconds for any server to say something, then
+        displays everything that has been received"""
+        if self.poll(timeout):
+            for server, scrollback in self.replies.items():
+                reply, self.cursors[server] = scrollback.since(
+                    self.cursors.get(server, 0))
+                if reply:
+                    print("{} :\n\n".format(server))
+                    for message in reply:
+                        print(" {}".format(message))
+        return 0
+        
+    def close(self):
+        """Leaves every server and stops the workers"""
+        for process, conn in self.workers:
+            try:
+                conn.send(("close",))
+            except (IOError, OSError):
+                pass
+        for process, conn in self.workers:
+            process.join(5)
+            conn.close()
+        self.workers = []
+        self.servers = {}
+        
+    def _forward(self, method, hostname, *args, **kwargs):
+        """Calls method on the worker holding hostname"""
+        if hostname not in self.servers:
+            log.warning("No such server %s", hostname)
+            return 1
+        return self._call(self.servers[hostname], method, hostname, *args, 
+                          **kwargs)
+        
+    def _call(self, shard, method, *args, **kwargs):
+        return self._wait(shard, self._request(shard, method, *args, 
+                                               **kwargs))
+        
+    def _request(self, shard, method, *args, **kwargs):
+        call_id = next(self.calls)
+        self.workers[shard][1].send((call_id, method, args, kwargs))
+        return call_id
+        
+    def _wait(self, shard, call_id):
+        """Waits for the answer to a call, dispatching any messages that
+        the worker sends first
+        """
+        while True:
+            answer = self._receive(shard)
+            if isinstance(answer, tuple):
+                kind, answered, value = answer
+                if answered != call_id:
+                    continue
+                if kind == "error":
+                    raise value
+                return value
+        
+    def _receive(self, shard):
+        """Takes one thing from a worker.  Messages are dispatched and
+        their hostnames returned, as are the servers it lost; answers to
+        calls are returned whole
+        """
+        kind = self.workers[shard][1].recv()
+        if kind[0] == "closed":
+            log.warning("Lost %s", kind[1])
+            self.servers.pop(kind[1], None)
+            return set([kind[1]])
+        if kind[0] != "events":
+            return kind
+        dispatch = self.dispatcher.dispatch
+        hostnames = set()
+        for hostname, line, fields in kind[1]:
+            hostnames.add(hostname)
+            if not dispatch(hostname, Message(*fields)):
+                if hostname not in self.replies:
+                    self.replies[hostname] = Scrollback(self.scrollback)
+                self.replies[hostname].append(line)
+        return hostnames
+        
+    def __del__(self):
+        if self.workers:
+            self.close()
@@ -23,73 +23,190 @@ You should have received a copy of the MIT License along with this program.
 If not, see <http://opensource.org/licenses/MIT>
 """
 
-try:
-    import cStringIO as IO
-except ImportError:
-    import StringIO as IO
-finally:
-    import asyncore
-    import datetime
-    import logging
-    import socket
-    import threading
-    from multiprocessing import dummy
-
-
-now = datetime.datetime.now()
-logging.basicConfig(filename=''.join(map(str,
-                                         ["Logs/",
-                                          now.year,
-                                          now.month,
-                                          now.day,
-                                          ".log"])), 
-                    level=logging.INFO)  
+from collections import deque
+from functools import partial
+import asyncore
+import logging
+import socket
+
+from IRC_framing import LineFramer
+from IRC_message import Dispatcher, parse
+import IRC_message
+from IRC_scrollback import Scrollback
+from IRC_subscribe import Subscriptions
+from IRC_tls import HANDSHAKE_ERRORS, WANT_WRITE, WOULD_BLOCK
+
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
 
 
 class ServerConnection(asyncore.dispatcher):
+    """A single connection to a server.  Outgoing data is queued as a deque
+    of chunks and incoming data is split into lines, which are handed to
+    on_line one at a time.  Given an IRC_tls.TLS, it shakes hands once
+    connected and nothing queued is sent until that is done
+    """
     
-    def __init__(self, hostname, port, buff_size=1024):
-        super(ServerConnection, self).__init__()
+    def __init__(self, hostname, port, on_line=None, buff_size=4096,
+                 high_water=65536, low_water=16384, map=None, tls=None):
+        """Constructor for ServerConnection.  Once more than high_water
+        bytes are waiting to be sent, push refuses data until the backlog
+        has drained to low_water
+        """
+        asyncore.dispatcher.__init__(self, map=map)
         self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
         self.address = hostname, port
+        self.on_line = on_line
         self.buff_size = buff_size
-        self.closed=False
-        self.connect(self.address)
-        self.settimeout(2)
-        self.write_buffer = ""
-        self.read_buffer = IO.StringIO()
+        self.high_water = high_water
+        self.low_water = low_water
+        self.closed = False
+        self.tls = tls
+        
+        ## What the TLS handshake is waiting on (IRC_tls.WANT_READ or
+        ## WANT_WRITE), or None when there is no handshake going on
+        self.handshaking = None
+        
+        self.write_buffer = deque()
+        self.write_size = 0
+        self.paused = False
+        self.closing = False
+        self.read_buffer = LineFramer(buff_size)
+        
+        try:
+            self.connect(self.address)
+        except socket.error:
+            self.close()
+            raise
+        
+    def push(self, data, force=False):
+        """Queues data to be sent.  Returns False, queueing nothing, while
+        the connection is paused because too much is already waiting, unless
+        force is set
+        """
+        if self.paused and not force:
+            return False
+        self.write_buffer.append(data)
+        self.write_size += len(data)
+        if self.write_size >= self.high_water:
+            self.paused = True
+            log.info("Pausing writes to %s, %s bytes waiting", 
+                     self.address[0], self.write_size)
+        return True
+        
+    def close_when_done(self):
+        """Closes the connection once everything queued has been sent"""
+        self.closing = True
+        if not self.write_buffer:
+            self.handle_close()
 
     def handle_connect(self):
-        logging.log("Connected to {} on {}".format(*self.address))
+        log.info("Connected to %s on %s", *self.address)
+        if self.tls is not None:
+            sock = self.tls.wrap(self.socket, *self.address)
+            sock.setblocking(False)
+            self.set_socket(sock, self._map)
+            ## asyncore goes on to call handle_write, which starts it
+            self.handshaking = WANT_WRITE
+            
+    def handshake(self):
+        """Takes the TLS handshake as far as the socket allows"""
+        try:
+            want = self.tls.handshake(self.socket, *self.address)
+        except HANDSHAKE_ERRORS as e:
+            log.error("TLS handshake with %s failed: %s", self.address[0], e)
+            self.handle_close()
+            return
+        self.handshaking = want or None
+        
+    def recv(self, buffer_size):
+        try:
+            return asyncore.dispatcher.recv(self, buffer_size)
+        except WOULD_BLOCK:
+            return b""
+            
+    def send(self, data):
+        try:
+            return asyncore.dispatcher.send(self, data)
+        except WOULD_BLOCK:
+            return 0
 
     def handle_close(self):
-        self.closed=True
+        self.closed = True
         self.close()
-        logging.log("Left server {}".format(self.address[0]))
+        log.info("Left server %s", self.address[0])
 
     def handle_read(self):
-        self.write_buffer.write((self.buff_size))
+        if self.handshaking is not None:
+            return self.handshake()
+        data = self.recv(self.buff_size)
+        if not data:
+            return
+        ## TLS may have decrypted more than was asked for, which select
+        ## can't see
+        pending = getattr(self.socket, "pending", None)
+        while pending is not None and pending():
+            data += self.recv(pending())
+        self.read_buffer.feed(data)
+        for line in self.read_buffer.lines():
+            if self.on_line is not None:
+                self.on_line(line)
 
     def handle_write(self):
-        sent = self.send(self.write_buffer)
-        self.write_buffer = self.write_buffer[sent:]
+        if self.handshaking is not None:
+            return self.handshake()
+        if not self.write_buffer:
+            return
+            
+        ## Sends as many whole chunks as fit in one buff_size write, so a
+        ## partial send only ever re-slices the chunk it stopped in
+        chunks = []
+        size = 0
+        for chunk in self.write_buffer:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= self.buff_size:
+                break
+        sent = self.send(b"".join(chunks))
+        self.write_size -= sent
+        
+        while sent:
+            chunk = self.write_buffer.popleft()
+            if sent < len(chunk):
+                self.write_buffer.appendleft(chunk[sent:])
+                break
+            sent -= len(chunk)
+            
+        if self.paused and self.write_size <= self.low_water:
+            self.paused = False
+            self.handle_resume()
+        if self.closing and not self.write_buffer:
+            self.handle_close()
+            
+    def handle_resume(self):
+        """Called once a paused connection has drained to low_water"""
+        log.info("Resuming writes to %s", self.address[0])
 
     def writable(self):
-        return len(self.write_buffer) > 0
+        if self.handshaking is not None:
+            return self.handshaking == WANT_WRITE
+        return not self.connected or bool(self.write_buffer)
         
     def handle_accept(self):
         raise AttributeError("Not a server, just a client")
         
     
 class IRC_member(object):
-    MESSAGE = "{} \r\n"
-    PRIVMSG = "PRIVMSG {} :{}\r\n"
-    PONG = "PONG {}\r\n"
-    NICK = "NICK {}\r\n"
-    USER = "USER {} {} bla: {}\r\n"
-    QUIT = "QUIT\r\n"
-    JOIN = "JOIN {}\r\n"
-    PART = "PART {}\r\n"
+    ## Encoded once, and formatted into bytes
+    MESSAGE = IRC_message.LINE
+    PRIVMSG = IRC_message.PRIVMSG
+    PONG = IRC_message.PONG
+    NICK = IRC_message.NICK
+    USER = IRC_message.USER
+    QUIT = IRC_message.QUIT
+    JOIN = IRC_message.JOIN
+    PART = IRC_message.PART
     
     def __init__(self, nick, **kwargs):
         """Constructor for IRC_member.  Stores nickname, realname and ident
@@ -99,6 +216,10 @@ class IRC_member(object):
         self.nick = nick
         self.realname = nick
         self.ident = nick
+        self.scrollback = 1000
+        
+        ## An IRC_tls.TLS to connect through, or None for plaintext
+        self.tls = None
         
         for key, value in kwargs.iteritems():
             self.__dict__[key] = value
@@ -107,78 +228,224 @@ class IRC_member(object):
         self.serv_to_chan = {}
         self.serv_to_data = {}
         
-        self.lock = threading.Lock()
+        # The asyncore socket map for this member's connections, so that
+        # several members don't poll each other's sockets
+        self.map = {}
+        self.dispatcher = Dispatcher({"PING": self._on_ping,
+                                      "001": self._on_welcome})
+        
+        # The same as in IRC_sockselect.IRC_member
+        self.subscriptions = Subscriptions()
+        
+        # This is a mapping of server name to the Scrollback of lines no
+        # handler consumed, and to how far receive_all_messages has shown it
         self.replies = {}
+        self.cursors = {}
         
-    def join_server(self, hostname, port, **kwargs):
+    def send_server_message(self, hostname, message):
+        """Queues a message to a server"""
+        if hostname not in self.servers:
+            log.warning("No such server %s", hostname)
+            log.warning("Failed to send message %s", message)
+            return 1
+            
+        if not self.servers[hostname].push(
+                self.MESSAGE.format(message.rstrip())):
+            log.warning("Too much waiting to be sent to %s", hostname)
+            log.warning("Failed to send message %s", message)
+            return 2
+        return 0
         
-        if hostname in self.servers:
-            logging.warn("Already connected to {}".format(hostname))
+    def send_channel_message(self, hostname, chan_name, message):
+        """Queues a message to a channel"""
+        if hostname not in self.servers:
+            log.warning("Not connected to server %s", hostname)
+            log.warning("Failed to send message %s", message)
+            return 1
+
+        elif chan_name not in self.serv_to_chan[hostname]:
+            log.warning("Not in channel %s", chan_name)
+            log.warning("Failed to send message %s", message)
+            return 2
+
+        elif self.send_server_message(
+                hostname, self.PRIVMSG.format(chan_name, message.rstrip())):
+            return 3
+            
+        else:
+            return 0
+            
+    def send_privmsg(self, hostname, username, message):
+        """Queues a private message to a user"""
+        if hostname not in self.servers:
+            log.warning("No such server %s", hostname)
+            log.warning("Failed to send message %s", message)
+            return 1
+            
+        elif self.send_server_message(
+                hostname, self.PRIVMSG.format(username, message.rstrip())):
+            return 3
+            
+        else:
             return 0
         
-        nick = self.nick
-        ident = self.ident
-        realname = self.realname
-        
-        address = (hostname, port)
-        socket_ = ServerConnection(hostname, port)
-        #self.servers[address] = socket_
-        self.servers[hostname] = socket_
-        self.serv_to_chan[hostname] = []
+    def join_server(self, hostname, port=6667, **kwargs):
+        """Joins a server"""
+        if hostname in self.servers:
+            log.warning("Already connected to %s", hostname)
+            return 0
         
-        ## Checking if the data for this server is different from the defaults
-        if kwargs:
-            self.serv_to_data[hostname] = {}
-            for key, value in kwargs.items():
-                if key in self.__dict__:
-                    self.serv_to_data[hostname][key] = value
-                    locals()[key] = value
-                else:
-                    logging.info("key-value pair {}: {} unusued".format(key, value))
-            if not self.serv_to_data[hostname]:
-                del self.serv_to_data[hostname]
+        data = {}
+        for key, value in kwargs.items():
+            if key in self.__dict__:
+                data[key] = value
+            else:
+                log.info("key-value pair %s: %s unusued", key, value)
         
         try:
-            self.send_server_message(hostname, self.NICK.format(nick))
-            self.send_server_message(hostname, 
-                                     self.USER.format(nick, ident, realname))
+            connection = ServerConnection(hostname, port, map=self.map,
+                                          tls=data.get("tls", self.tls))
                                      
         except socket.gaierror as e:
-            logging.exception(e)
+            log.exception(e)
             return 1
             
         except socket.error as e:
-            logging.exception(e)
+            log.exception(e)
             return 2
             
-        else:
-            logging.info("Connected to {} on {}".format(*address))
+        connection.on_line = partial(self._handle_line, hostname)
+        self.servers[hostname] = connection
+        self.serv_to_chan[hostname] = []
+        if data:
+            self.serv_to_data[hostname] = data
+            
+        nick = data.get("nick", self.nick)
+        self.send_server_message(hostname, self.NICK.format(nick))
+        ## Pushed as it is, as the realname would keep the space
+        ## send_server_message puts on the end
+        connection.push(self.USER.format(data.get("ident", self.ident),
+                                         data.get("realname", self.realname)))
+        log.info("Connecting to %s on %s", hostname, port)
+        return 0
             
     def leave_server(self, hostname):
+        """Leaves a server once everything queued for it has been sent"""
+        if hostname not in self.servers:
+            log.warning("Not connected to %s", hostname)
+            return 0
+            
+        self._save_session(hostname)
+        connection = self.servers.pop(hostname)
+        connection.push(self.QUIT, force=True)
+        connection.close_when_done()
+        self.serv_to_chan.pop(hostname, None)
+        self.serv_to_data.pop(hostname, None)
+        log.info("Left server %s", hostname)
+        return 0
+        
+    def join_channel(self, hostname, chan_name):
+        """Joins a channel"""
+        if chan_name in self.serv_to_chan[hostname]:
+            log.warning("Already connected to %s on %s", hostname, chan_name)
+            return 0
+            
+        if not chan_name.startswith("#"):
+            log.warning("Channel names should look like #%s", chan_name)
+            return 2
+            
+        if self.send_server_message(hostname, self.JOIN.format(chan_name)):
+            log.warning("Failed to connect to %s", chan_name)
+            return 1
+            
+        self.serv_to_chan[hostname].append(chan_name)
+        log.info("Connected to %s", chan_name)
+        return 0
         
+    def leave_channel(self, hostname, chan_name):
+        """Leaves a channel"""
         if hostname not in self.servers:
-            logging.warning("Not connected to {}".format(hostname))
+            log.warning("No such server %s", hostname)
+            return 1
+        
+        elif chan_name not in self.serv_to_chan[hostname]:
+            log.warning("No such channel %s", chan_name)
             return 0
             
-        try:
-            self.send_server_message(hostname, "QUIT\r\n")
-            self.servers[hostname].close()
+        elif self.send_server_message(hostname, self.PART.format(chan_name)):
+            log.warning("Failed to leave %s", chan_name)
+            return 2
+            
+        else:
+            self.serv_to_chan[hostname].remove(chan_name)
+            log.info("Left channel %s", chan_name)
+            return 0
+            
+    def poll(self, timeout=0):
+        """Runs one pass of asyncore over this member's connections"""
+        asyncore.loop(timeout, count=1, map=self.map)
         
+    def receive_all_messages(self, timeout=5):
+        """Waits up to timeout seconds for the servers, then displays any
+        messages that have arrived"""
+        try:
+            self.poll(timeout)
         except socket.error as e:
-            logging.exception(e)
-            logging.warning("Failed to leave server {}".format(hostname))
+            log.exception(e)
+            log.warning("Failed to get messages")
             return 1
             
-        else:
-            try:
-                del self.servers[hostname]
-            finally:
-                try:
-                    del self.serv_to_chan[hostname]
-                finally:
-                    try:
-                        if self.serv_to_data[hostname]: 
-                            del self.serv_to_data[hostname]
-                    finally:
-                        logging.info("Left server {}".format(hostname))
-                        return 0
+        for server, scrollback in self.replies.items():
+            reply, self.cursors[server] = scrollback.since(
+                self.cursors.get(server, 0))
+            if reply:
+                print "{} :\n\n".format(server)
+                for message in reply:
+                    print " {}".format(message)
+        return 0
+        
+    def subscribe(self, callback, server=None, channel=None, command=None,
+                  nick=None):
+        """The same as IRC_sockselect.IRC_member.subscribe"""
+        return self.subscriptions.add(callback, server, channel, command, 
+                                      nick)
+        
+    def unsubscribe(self, subscription):
+        self.subscriptions.remove(subscription)
+        
+    def _handle_line(self, hostname, line):
+        subs = ()
+        if self.subscriptions:
+            subs = self.subscriptions.match(hostname, line, 
+                                            self.dispatcher.table)
+            if subs is None:
+                return
+        message = parse(line)
+        if message is None:
+            return
+        consumed = self.dispatcher.dispatch(hostname, message)
+        if subs:
+            consumed = (self.subscriptions.deliver(subs, hostname, message) or
+                        consumed)
+        elif self.subscriptions:
+            ## Only one of our own handlers wanted it
+            return
+        if not consumed:
+            if hostname not in self.replies:
+                self.replies[hostname] = Scrollback(self.scrollback)
+            self.replies[hostname].append(line.rstrip())
+                
+    def _on_ping(self, hostname, message):
+        ## A bare PING still gets its PONG
+        token = message.params[-1] if message.params else ""
+        self.servers[hostname].push(self.PONG.format(":" + token), force=True)
+        return True
+
+    def _on_welcome(self, hostname, message):
+        ## Any TLS 1.3 session ticket has come in by now
+        self._save_session(hostname)
+
+    def _save_session(self, hostname):
+        connection = self.servers.get(hostname)
+        if connection is not None and connection.tls is not None:
+            connection.tls.save(connection.socket, *connection.address)
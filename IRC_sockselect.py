@@ -23,24 +23,40 @@ You should have received a copy of the MIT License along with this program.
 If not, see <http://opensource.org/licenses/MIT>
 """
 
-from functools import partial
-from multiprocessing import dummy
-import datetime
-import logging
-import select
-import socket 
-import time
-import threading
+try:
+    import selectors
+except ImportError:
+    import selectors2 as selectors
+finally:
+    import logging
+    import socket 
+    import time
+    import threading
+    
+    from IRC_framing import LineFramer
+    from IRC_message import (BULK_BATCHES, Dispatcher, HOSTLEN, JOIN, 
+                             JOIN_ERRORS, LINE, NICK, PART, PONG, QUIT, 
+                             RPL_ISUPPORT, RPL_NAMREPLY, RPL_WELCOME, USER, 
+                             format_lines, format_list_lines, max_targets, 
+                             parse, parse_isupport)
+    from IRC_metrics import clock
+    from IRC_resolver import Resolver
+    from IRC_scheduler import Scheduler
+    from IRC_scrollback import Scrollback
+    from IRC_sendqueue import SendQueue
+    from IRC_state import ServerState
+    from IRC_subscribe import Subscriptions
+    from IRC_tls import HANDSHAKE_ERRORS, TLS_PORT, WANT_READ
+
 
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
 
-now = datetime.datetime.now()
-logging.basicConfig(filename=''.join(map(str,
-                                         ["Logs/",
-                                          now.year,
-                                          now.month,
-                                          now.day,
-                                          ".log"])), 
-                    level=logging.INFO)
+## Seconds a server has to finish a TLS handshake before it is dropped
+HANDSHAKE_TIMEOUT = 10
+
+## Seconds between poll's looks at connects running on the resolver's pool
+CONNECT_POLL = .05
 
 
 class IRC_member(object):
@@ -56,6 +72,10 @@ class IRC_member(object):
         self.nick = nick
         self.realname = nick
         self.ident = nick
+        self.scrollback = 1000
+        
+        ## An IRC_tls.TLS to connect through, or None for plaintext
+        self.tls = None
         
         for key, value in kwargs.iteritems():
             self.__dict__[key] = value
@@ -69,11 +89,20 @@ class IRC_member(object):
         
         # This is a mapping of server name to channel name
         # {
-        #  "some_server": ["#a_channel", "#another-channel"],
-        #  "other_server": ["#lonely-channel"]
+        #  "some_server": set(["#a_channel", "#another-channel"]),
+        #  "other_server": set(["#lonely-channel"])
         # }
         self.serv_to_chan = {}
         
+        # This is a mapping of server name to the channels join_channels is
+        # waiting to hear about, by lowercased name
+        # {
+        #  "some_server": {"#a_channel": ("#A_Channel", results)}
+        # }
+        # where results is the dict join_channels will return
+        self.pending_joins = {}
+        self.join_answered = threading.Condition()
+        
         # This is a mapping of server name to information if it differs
         # {
         #  "some_server": {
@@ -85,69 +114,188 @@ class IRC_member(object):
         # All values not in this are assumed to be self.nick, etc
         self.serv_to_data = {}
         
-        ## Used to get the replies from all sockets
-        self.lock = threading.Lock()
+        # Every server socket is registered here with its server name as the
+        # key's data, so the selector doubles as the fd -> server index
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+        
+        # Looks servers up (caching the answers) and connects to them
+        self.resolver = Resolver()
+        
+        # This is a mapping of server name to (port, AsyncResult, results)
+        # for every connect still running on the resolver's pool.  poll
+        # finishes joining once it is done, filing join_server's return
+        # code in results (the dict join_servers will return) unless that
+        # is None.  Meanwhile what is sent to the server waits in its queue
+        self.connecting = {}
+        self.connect_answered = threading.Condition()
+        
+        # AsyncResults of connects given up on before they finished, whose
+        # sockets poll closes as they come in
+        self.abandoned = []
+        
+        # This is a mapping of server name to the port it was joined on
+        self.serv_to_port = {}
+        
+        # This is a mapping of server name to when we last read from it
+        self.last_seen = {}
+        
+        # Set by IRC_supervisor.Supervisor to be told about dead links
+        self.supervisor = None
+        
+        # Timers for every connection, run from poll
+        self.scheduler = Scheduler()
+        
+        # Set by IRC_keepalive.Keepalive, which pings every server to
+        # measure its lag
+        self.keepalive = None
+        
+        # Set by IRC_metrics.Metrics.attach to collect counters and timings
+        self.metrics = None
+        
+        # Set by IRC_cap.Capabilities, which negotiates IRCv3 capabilities
+        # as each server is joined
+        self.caps = None
+        
+        # This is a mapping of server name to the IRC_tls.TLS whose
+        # handshake with it poll is still stepping through.  Nothing is
+        # sent to it until the handshake is done
+        self.handshakes = {}
+        
+        # This is a mapping of server name to the LineFramer holding whatever
+        # has been read from it but doesn't make up a whole line yet
+        self.framers = {}
+        
+        # This is a mapping of server name to the SendQueue pacing what is
+        # sent to it
+        self.send_queues = {}
+        
+        # This is a mapping of server name to the prefix it puts on our
+        # messages, once we've seen it
+        # {
+        #  "some_server": "Mynick!~ident@some.host"
+        # }
+        self.serv_to_prefix = {}
+        
+        # This is a mapping of server name to the RPL_ISUPPORT tokens it
+        # has sent
+        # {
+        #  "some_server": {"TARGMAX": "PRIVMSG:4,JOIN:", "NICKLEN": "30"}
+        # }
+        self.serv_to_isupport = {}
+        
+        # This is a mapping of server name to the IRC_state.ServerState
+        # tracking who is in the channels we are in
+        self.serv_to_state = {}
+        
+        # This is a mapping of server name to the netsplit and netjoin
+        # batches it has open, by reference tag, with the lines held back
+        # until the batch ends
+        # {
+        #  "some_server": {"yXNAbvnRHTRBv": ("netsplit", [(line, Message)])}
+        # }
+        self.batches = {}
+        
+        # Every parsed line is routed through this by its command
+        handlers = {"PING": self._on_ping,
+                    "BATCH": self._on_batch,
+                    "JOIN": self._on_join,
+                    "PART": self._on_part,
+                    "KICK": self._on_kick,
+                    "QUIT": self._on_quit,
+                    "NICK": self._on_nick,
+                    RPL_WELCOME: self._on_welcome,
+                    RPL_ISUPPORT: self._on_isupport,
+                    RPL_NAMREPLY: self._on_names}
+        for numeric in JOIN_ERRORS:
+            handlers[numeric] = self._on_join_error
+        self.dispatcher = Dispatcher(handlers)
+        
+        # Callbacks for the lines a consumer asked for.  Once there are any,
+        # lines that nothing subscribed to or handles are dropped unparsed
+        self.subscriptions = Subscriptions()
+        
+        # This is a mapping of server name to the Scrollback holding the
+        # lines no handler consumed
+        # {
+        #  "some_server": Scrollback(["NOTICE * :hello", ...])
+        # }
         self.replies = {}
         
+        # This is a mapping of server name to the sequence number that
+        # receive_all_messages has displayed up to
+        self.cursors = {}
+        
     def send_server_message(self, hostname, message): 
         """Sends a message to a server"""
-        if hostname not in self.servers:
-            logging.warning("No such server {}".format(hostname))
-            logging.warning("Failed to send message {}".format(message))
+        if not self._known(hostname):
+            log.warning("No such server %s", hostname)
+            log.warning("Failed to send message %s", message)
             return 1
         
-        sock = self.servers[hostname]
         try:
-            sock.send("{} \r\n".format(message.rstrip()))
+            self._send(hostname, LINE.format(message.rstrip()))
         except socket.error as e:
-            logging.exception(e)
-            logging.warning("Failed to send message {}".format(message))
+            log.exception(e)
+            log.warning("Failed to send message %s", message)
             return 2
         else:
             return 0
         
     def send_channel_message(self, hostname, chan_name, message):
-        """Sends a message to a channel"""
-        if hostname not in self.servers:
-            logging.warning("Not connected to server {}".format(hostname))
-            logging.warning("Failed to send message {}".format(message))
+        """Sends a message to a channel, or to every channel in a list.
+        Long messages are split over as many lines as they need"""
+        if not self._known(hostname):
+            log.warning("Not connected to server %s", hostname)
+            log.warning("Failed to send message %s", message)
             return 1
-
-        elif chan_name not in self.serv_to_chan[hostname]:
-            logging.warning("Not in channel {}".format(chan_name))
-            logging.warning("Failed to send message {}".format(message))
+            
+        chan_names = ([chan_name] if isinstance(chan_name, basestring) 
+                      else list(chan_name))
+        missing = [chan for chan in chan_names 
+                   if chan not in self.serv_to_chan[hostname]]
+        if missing:
+            log.warning("Not in channel %s", ", ".join(missing))
+            log.warning("Failed to send message %s", message)
             return 2
 
         else:
             try:
-                sock = self.servers[hostname]
-                sock.send("PRIVMSG {} :{}\r\n".format(chan_name,
-                                                       message.rstrip()))
+                self._send_lines(hostname, 
+                                 self._privmsg_lines(hostname, chan_names, 
+                                                     message))
             except socket.error as e:
-                logging.exception(e)
-                logging.warning("Failed to send message {}".format(message))
+                log.exception(e)
+                log.warning("Failed to send message %s", message)
                 return 3
             else:
                 return 0
     
-    def send_privmsg(self, hostname, username, message):
-        """Sends a private message to a user"""
-        if hostname not in self.servers:
-            logging.warning("No such server {}".format(hostname))
-            logging.warning("Failed to send message {}".format(message))
+    def send_privmsg(self, hostname, username, message, force=False):
+        """Sends a private message to a user, or to every user in a list.
+        Nicks we share no channel with (services, say) are sent to all the
+        same, with a warning unless force is set
+        """
+        if not self._known(hostname):
+            log.warning("No such server %s", hostname)
+            log.warning("Failed to send message %s", message)
             return 1
             
-        ## TODO: Have a test to check for valid users
-        ## Should return 2
-        ## if username not in ____: ...
-        logging.warn("Needs implementing to check for valid users")
-        
-        sock = self.servers[hostname]
+        usernames = ([username] if isinstance(username, basestring) 
+                     else list(username))
+        if not force:
+            state = self._state(hostname)
+            unknown = [name for name in usernames if not state.has_user(name)]
+            if unknown:
+                log.warning("Sending to %s, who shares no channel with us",
+                            ", ".join(unknown))
+                
         try:
-            sock.send("PRIVMSG {} :{}\r\n".format(username, message.rstrip()))
+            self._send_lines(hostname, 
+                             self._privmsg_lines(hostname, usernames, message))
         except socket.error as e:
-            logging.exception(e)
-            logging.warning("Failed to send message {}".format(message))
+            log.exception(e)
+            log.warning("Failed to send message %s", message)
             return 3
         else:
             return 0
@@ -155,75 +303,97 @@ class IRC_member(object):
     def ping_pong(self, sock, data):
         """Pongs the server"""
         try:
-            sock.send("PONG {}\r\n".format(data))
+            self._send(self.selector.get_key(sock).data, PONG.format(data))
         except socket.error as e:
-            logging.exception(e)
-            logging.warn("Couldn't pong the server")
+            log.exception(e)
+            log.warning("Couldn't pong the server")
             return 1
         else:
             return 0        
         
-    def join_server(self, hostname, port=6667, **kwargs):
-        """Joins a server"""
-        if hostname in self.servers:
-            logging.warn("Already connected to {}".format(hostname))
-            return 0
-        
-        nick = self.nick
-        ident = self.ident
-        realname = self.realname
-        
-        ## Checking if the data for this server is different from the defaults
-        if kwargs:
-            self.serv_to_data[hostname] = {}
-            for key, value in kwargs.items():
-                if key in self.__dict__:
-                    self.serv_to_data[hostname][key] = value
-                    locals()[key] = value
-                else:
-                    logging.info("key-value pair {}: {} unusued".format(key, value))
-            if not self.serv_to_data[hostname]:
-                del self.serv_to_data[hostname]
-        try:
-            ip = socket.gethostbyname(hostname) ## throws gaierror 11004
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((ip, port))
-            self.servers[hostname] = sock
-            self.serv_to_chan[hostname] = []
-            sock.settimeout(2)
-            self.send_server_message(hostname, "NICK {}\r\n".format(nick))
-            self.send_server_message(hostname, 
-                              "USER {} {} bla: {}\r\n".format(nick, 
-                                                              ident, 
-                                                              realname))
-            
-        except socket.gaierror as e: ## couldn't resolve hostname
-            logging.exception(e)
-            return 1
+    def join_server(self, hostname, port=6667, wait=True, **kwargs):
+        """Joins a server.  Looking it up and connecting run on the
+        resolver's pool, and poll finishes the job, so the other servers
+        carry on meanwhile.  Returns 0 once connected, 1 if the name didn't
+        resolve or 2 if connecting failed.  Unless wait, it returns 0
+        straight away, and anything sent before the connect is done waits
+        behind logging in
+        """
+        return self.join_servers([(hostname, port)], port, wait, 
+                                 **kwargs)[hostname]
             
-        except socket.error as e:
-            logging.exception(e)
-            if port != 6667:
-                logging.warning("Consider using port 6667 (the defacto IRC port)")
-            return 2
+    def join_servers(self, hostnames, port=6667, wait=True, **kwargs):
+        """Joins many servers at once, so it takes about as long as joining
+        the slowest one.  hostnames holds names or (name, port) pairs.
+        Returns a mapping of hostname to what join_server would have
+        returned
+        """
+        results = {}
+        for hostname in hostnames:
+            if isinstance(hostname, tuple):
+                hostname, port_ = hostname
+            else:
+                port_ = port
+            if self._known(hostname):
+                log.warning("Already connected to %s", hostname)
+                results[hostname] = 0
+            else:
+                self._store_data(hostname, kwargs)
+                results[hostname] = None
+                self._connect(hostname, port_, results if wait else None)
         
-        else:
-            logging.info("Connected to {} on {}".format(hostname, port))
-            return 0
+        if not wait:
+            return dict.fromkeys(results, 0)
+        with self.connect_answered:
+            while None in results.values():
+                if self.running:
+                    ## Some other thread is running the event loop
+                    self.connect_answered.wait(CONNECT_POLL)
+                else:
+                    self.connect_answered.release()
+                    try:
+                        self.poll(CONNECT_POLL)
+                    finally:
+                        self.connect_answered.acquire()
+        return results
             
     def leave_server(self, hostname):
         """Leaves a server"""
+        if self.supervisor is not None:
+            self.supervisor.forget(hostname)
+        if self.keepalive is not None:
+            self.keepalive.forget(hostname)
+        if hostname in self.connecting:
+            self._clear(hostname)
+            self.serv_to_data.pop(hostname, None)
+            log.info("Stopped connecting to %s", hostname)
+            return 0
         if hostname not in self.servers:
-            logging.warning("Not connected to {}".format(hostname))
+            log.warning("Not connected to %s", hostname)
             return 0
             
         try:
-            self.send_server_message(hostname, "QUIT\r\n")
+            queue = self.send_queues.pop(hostname)
+            if self.handshakes.pop(hostname, None) is None:
+                ## QUIT jumps the queue, and whatever is still waiting gets
+                ## one last chance to go out regardless of flood control
+                queue.put(QUIT)
+                self._flush_queue(hostname, queue, force=True)
+                self._save_session(hostname)
+            self._unwatch(hostname)
+            self.framers.pop(hostname, None)
+            self.serv_to_prefix.pop(hostname, None)
+            self.serv_to_isupport.pop(hostname, None)
+            self.serv_to_state.pop(hostname, None)
+            self.batches.pop(hostname, None)
+            self.pending_joins.pop(hostname, None)
+            self.serv_to_port.pop(hostname, None)
+            self.last_seen.pop(hostname, None)
             self.servers[hostname].close()
         
         except socket.error as e:
-            logging.exception(e)
-            logging.warning("Failed to leave server {}".format(hostname))
+            log.exception(e)
+            log.warning("Failed to leave server %s", hostname)
             return 1
             
         else:
@@ -237,84 +407,271 @@ class IRC_member(object):
                         if self.serv_to_data[hostname]: 
                             del self.serv_to_data[hostname]
                     finally:
-                        logging.info("Left server {}".format(hostname))
+                        log.info("Left server %s", hostname)
                         return 0
             
     def join_channel(self, hostname, chan_name):
-        """Joins a channel"""
+        """Joins a channel without waiting for the server to answer.  The
+        channel counts as joined straight away, until the server refuses
+        """
         if chan_name in self.serv_to_chan[hostname]:
-            logging.warning("Already connected to {} on {}".format(hostname, chan_name))
+            log.warning("Already connected to %s on %s", hostname, chan_name)
             return 0
             
         if chan_name.startswith("#"):
             try:
-                self.send_server_message(hostname, 
-                                         "JOIN {}\r\n".format(chan_name))
+                self._send(hostname, JOIN.format(chan_name))
             except socket.error as e:
-                logging.exception(e)
-                logging.warning("Failed to connect to {}".format(chan_name))
+                log.exception(e)
+                log.warning("Failed to connect to %s", chan_name)
                 return 1
             else:
-                self.serv_to_chan[hostname].append(chan_name)
-                logging.info("Connected to {}".format(chan_name))
+                ## Nobody waits on the answer, but an error numeric still
+                ## takes the channel back out through _join_answer
+                self.pending_joins.setdefault(hostname, {})[
+                    chan_name.lower()] = chan_name, {}
+                self.serv_to_chan[hostname].add(chan_name)
+                log.info("Connected to %s", chan_name)
                 return 0
         else:
-            logging.warning("Channel names should look like #{}".format(chan_name))
+            log.warning("Channel names should look like #%s", chan_name)
             return 2
                 
     def leave_channel(self, hostname, chan_name):
         """Leaves a channel"""
-        if hostname not in self.servers:
-            logging.warning("No such server {}".format(hostname))
+        if not self._known(hostname):
+            log.warning("No such server %s", hostname)
             return 1
         
         elif chan_name not in self.serv_to_chan[hostname]:
-            logging.warning("No such channel {}".format(chan_name))
+            log.warning("No such channel %s", chan_name)
             return 0
             
         else:
             try:
-                self.send_server_message(hostname, 
-                                         "PART {}\r\n".format(chan_name))
+                self._send(hostname, PART.format(chan_name))
             except socket.error as e:
-                logging.exception(e)
-                logging.warning("Failed to leave {}".format(chan_name))
+                log.exception(e)
+                log.warning("Failed to leave %s", chan_name)
                 return 2
             else:
-                self.serv_to_chan[hostname].remove(chan_name)
-                logging.info("Left channel {}".format(chan_name))
+                self.serv_to_chan[hostname].discard(chan_name)
+                log.info("Left channel %s", chan_name)
                 return 0
                 
-    def receive_all_messages(self, buff_size=4096):
+    def join_channels(self, hostname, chan_names, keys=None, timeout=10):
+        """Joins several channels using as few JOINs as the server allows,
+        then waits up to timeout seconds for the server to answer for each.
+        keys maps a channel name to its key.  Returns a mapping of channel
+        name to 0 if it was joined, 1 if the JOIN couldn't be sent, 2 for a
+        bad channel name, the error numeric if the server refused, or None
+        if the server hasn't answered
+        """
+        results = {}
+        wanted = []
+        for chan_name in chan_names:
+            if not chan_name.startswith("#"):
+                log.warning("Channel names should look like #%s", chan_name)
+                results[chan_name] = 2
+            elif chan_name in self.serv_to_chan.get(hostname, ()):
+                results[chan_name] = 0
+            else:
+                results[chan_name] = None
+                wanted.append(chan_name)
+        if not wanted:
+            return results
+        if not self._known(hostname):
+            log.warning("No such server %s", hostname)
+            results.update((chan_name, 1) for chan_name in wanted)
+            return results
+            
+        pending = self.pending_joins.setdefault(hostname, {})
+        for chan_name in wanted:
+            pending[chan_name.lower()] = chan_name, results
+        lines = format_list_lines(
+            "JOIN", wanted, keys,
+            max_targets(self.serv_to_isupport.get(hostname, {}), "JOIN", None))
+        try:
+            self._send_lines(hostname, lines)
+        except socket.error as e:
+            log.exception(e)
+            log.warning("Failed to join %s", ", ".join(wanted))
+            for chan_name in wanted:
+                pending.pop(chan_name.lower(), None)
+                results[chan_name] = 1
+            return results
+            
+        deadline = time.time() + timeout
+        with self.join_answered:
+            while None in results.values() and time.time() < deadline:
+                if self.running:
+                    ## Some other thread is running the event loop
+                    self.join_answered.wait(deadline - time.time())
+                else:
+                    self.join_answered.release()
+                    try:
+                        self.poll(min(deadline - time.time(), 1))
+                    finally:
+                        self.join_answered.acquire()
+        
+        for chan_name in wanted:
+            if results[chan_name] is None:
+                pending.pop(chan_name.lower(), None)
+        if log.isEnabledFor(logging.INFO):
+            log.info("Joined %s of %s channels on %s", 
+                     sum(1 for code in results.values() if code == 0), 
+                     len(results), hostname)
+        return results
+        
+    def leave_channels(self, hostname, chan_names):
+        """Leaves several channels using as few PARTs as the server allows"""
+        if not self._known(hostname):
+            log.warning("No such server %s", hostname)
+            return 1
+            
+        joined = [chan_name for chan_name in chan_names
+                  if chan_name in self.serv_to_chan[hostname]]
+        if not joined:
+            return 0
+            
+        try:
+            self._send_lines(hostname, format_list_lines(
+                "PART", joined, 
+                targmax=max_targets(self.serv_to_isupport.get(hostname, {}),
+                                    "PART", None)))
+        except socket.error as e:
+            log.exception(e)
+            log.warning("Failed to leave %s", ", ".join(joined))
+            return 2
+        else:
+            self.serv_to_chan[hostname].difference_update(joined)
+            log.info("Left %s channels on %s", len(joined), hostname)
+            return 0
+                
+    def subscribe(self, callback, server=None, channel=None, command=None,
+                  nick=None):
+        """Calls callback(hostname, message) for every message matching all
+        of the filters given.  A callback returning True consumes the
+        message; anything else is kept for receive_all_messages.  Once
+        there are any subscriptions, lines none of them match are dropped
+        before they are parsed or stored.  Returns the subscription, for
+        unsubscribe
+        """
+        return self.subscriptions.add(callback, server, channel, command, 
+                                      nick)
+        
+    def unsubscribe(self, subscription):
+        self.subscriptions.remove(subscription)
+        
+    def receive_all_messages(self, buff_size=4096, timeout=5):
         """Checks all servers connected to for any messages, then displays any
         that may be waiting"""
         
-        ready, _, _ = select.select(self.servers.values(), [], [], 5)
-        
+        try:
+            ready = self.poll(timeout, buff_size)
+        except socket.error as e:
+            log.exception(e)
+            log.warning("Failed to get messages")
+            return 1
+            
         if ready:
-            for i in range(len(ready)):
-                for host, sock in self.servers.iteritems():
-                    if sock == ready[i]:
-                        ready[i] = host
-            try:
-                pool = dummy.Pool()
-                pool.map(partial(self.receive_message,
-                                 bsize=buff_size),
-                         (tuple(ready),))
-                with self.lock:
-                    replies, self.replies = self.replies, {}
-                for server, reply in replies.iteritems():
+            for server, scrollback in self.replies.items():
+                reply, self.cursors[server] = scrollback.since(
+                    self.cursors.get(server, 0))
+                if reply:
                     print "{} :\n\n".format(server)
                     for message in reply:
                         print " {}".format(message)
-                return 0
-            except socket.error as e:
-                logging.exception(e)
-                logging.warning("Failed to get messages")
-                return 1
-                
+        return 0
+        
+    def poll(self, timeout=0, buff_size=4096):
+        """Waits up to timeout seconds for servers to become readable and
+        reads from each of them inline.  Returns the hostnames that were read
+        """
+        due = [queue.ready_in() for hostname, queue in 
+               self.send_queues.items() if hostname not in self.connecting]
+        due.append(self.scheduler.ready_in())
+        if self.connecting or self.abandoned:
+            due.append(CONNECT_POLL)
+        if self.supervisor is not None:
+            due.append(self.supervisor.ready_in())
+        due = [delay for delay in due if delay is not None]
+        if due and (timeout is None or min(due) < timeout):
+            timeout = min(due)
+            
+        metrics = self.metrics
+        if metrics is not None:
+            started = clock()
+            selected = self.selector.select(timeout)
+            woke = clock()
+            metrics.observe("poll_wait_seconds", None, woke - started)
         else:
-            return 0
+            selected = self.selector.select(timeout)
+            
+        ready = []
+        for key, events in selected:
+            if key.data in self.handshakes:
+                self._handshake(key.data)
+                continue
+            if events & selectors.EVENT_WRITE:
+                self._flush(key.data)
+            if events & selectors.EVENT_READ:
+                self.read_ready(key.data, buff_size)
+                ready.append(key.data)
+                
+        if self.connecting or self.abandoned:
+            self._finish_connects()
+        for hostname, queue in self.send_queues.items():
+            if len(queue) and not queue.pending:
+                self._flush(hostname)
+        self.scheduler.run_due()
+        if self.supervisor is not None:
+            self.supervisor.tick()
+        if metrics is not None:
+            metrics.observe("poll_work_seconds", None, clock() - woke)
+        return ready
+        
+    def run(self, timeout=1, buff_size=4096):
+        """Runs the event loop until stop is called"""
+        self.running = True
+        while self.running:
+            self.poll(timeout, buff_size)
+            
+    def stop(self):
+        """Stops the event loop after the current tick"""
+        self.running = False
+        
+    def read_ready(self, hostname, bsize=4096):
+        """Reads once from a server that the selector reported as readable"""
+        sock = self.servers[hostname]
+        framer = self.framers[hostname]
+        try:
+            nbytes = framer.recv_into(sock, bsize)
+        except socket.timeout:
+            return 1
+        except socket.error as e:
+            log.exception(e)
+            log.warning("Failed to read from %s", hostname)
+            self._drop(hostname, e)
+            return 1
+            
+        if not nbytes:
+            log.warning("Connection to %s was closed", hostname)
+            self._drop(hostname, "closed by the server")
+            return 2
+            
+        ## TLS may have decrypted more than was asked for, which select
+        ## can't see
+        pending = getattr(sock, "pending", None)
+        while pending is not None and pending():
+            nbytes += framer.recv_into(sock, pending())
+            
+        self.last_seen[hostname] = time.time()
+        if self.metrics is not None:
+            self._count_read(hostname, framer, nbytes)
+        self._store_replies(hostname, 
+                            self._handle_lines(hostname, framer.lines()))
+        return 0
             
     def receive_message(self, hostname, bsize=4096):
         """Recieves messages from a single server.  Has already checked that 
@@ -323,28 +680,499 @@ class IRC_member(object):
         hostname = hostname[0]
         reply = []
         sock = self.servers[hostname]
+        framer = self.framers[hostname]
         
         while True:
             try:
-                readbuffer = sock.recv(bsize)
-                if not readbuffer: break
-                temp = readbuffer.split("\n")
-                readbuffer = temp.pop()
-    
-                for line in temp:
-                    line = line.rstrip().split()
-                    if (line[0] == "PING"):
-                        self.ping_pong(sock, line[1])
-                    else:
-                        line = " ".join(line)
-                        reply.append(line)
+                nbytes = framer.recv_into(sock, bsize)
+                if not nbytes: break
+                self.last_seen[hostname] = time.time()
+                if self.metrics is not None:
+                    self._count_read(hostname, framer, nbytes)
+                reply += self._handle_lines(hostname, framer.lines())
             except socket.error: break
-        with self.lock:
+        self._store_replies(hostname, reply)
+        
+    def _count_read(self, hostname, framer, nbytes):
+        ## Line endings in what was just read, which is as many lines as it
+        ## finishes without the cost of counting them one by one
+        lines = framer.buffer.count(b"\n", framer.end - nbytes, framer.end)
+        self.metrics.received(hostname, nbytes, lines)
+        
+    def _handle_lines(self, hostname, lines):
+        """Dispatches each line and returns (line, Message) for the ones no
+        handler consumed
+        """
+        reply = []
+        parse_ = parse
+        dispatch = self.dispatcher.dispatch
+        if self.metrics is not None and self.metrics.sample():
+            parse_, dispatch = self.metrics.timed(hostname, parse_, dispatch)
+        subscriptions = self.subscriptions
+        batches = self.batches
+        if not subscriptions:
+            for line in lines:
+                message = parse_(line)
+                if message is None or (batches and message.raw_tags and 
+                                       self._hold(hostname, line, message)):
+                    continue
+                if not dispatch(hostname, message):
+                    reply.append((line.rstrip(), message))
+            return reply
+            
+        match = subscriptions.match
+        deliver = subscriptions.deliver
+        handled = self.dispatcher.table
+        for line in lines:
+            subs = match(hostname, line, handled)
+            if subs is None:
+                continue
+            message = parse_(line)
+            if message is None or (batches and message.raw_tags and 
+                                   self._hold(hostname, line, message)):
+                continue
+            consumed = dispatch(hostname, message)
+            if subs and not (deliver(subs, hostname, message) or consumed):
+                reply.append((line.rstrip(), message))
+        return reply
+        
+    def _hold(self, hostname, line, message):
+        """Holds back a line that belongs to an open netsplit or netjoin
+        batch.  Returns whether it did
+        """
+        batch = self.batches.get(hostname, {}).get(message.tags.get("batch"))
+        if batch is None:
+            return False
+        batch[1].append((line, message))
+        return True
+        
+    def _on_batch(self, hostname, message):
+        if not message.params:
+            return True
+        reference = message.params[0]
+        if reference[:1] == "+" and len(message.params) > 1 and \
+           message.params[1].lower() in BULK_BATCHES:
+            self.batches.setdefault(hostname, {})[reference[1:]] = (
+                message.params[1].lower(), [])
+        elif reference[:1] == "-" and hostname in self.batches:
+            batch = self.batches[hostname].pop(reference[1:], None)
+            if not self.batches[hostname]:
+                del self.batches[hostname]
+            if batch is not None:
+                self._end_batch(hostname, *batch)
+        return True
+        
+    def _end_batch(self, hostname, kind, held):
+        """Handles the lines of a netsplit or netjoin batch together.  A
+        netsplit's QUITs come off the channel state in one pass before the
+        lines are dispatched, so their handlers find nothing left to do.
+        Then the lines go on like any others
+        """
+        if kind == "netsplit":
+            self._state(hostname).quit_many(
+                message.nick for line, message in held 
+                if message.command == "QUIT" and message.prefix is not None)
+        dispatch = self.dispatcher.dispatch
+        subscriptions = self.subscriptions
+        handled = self.dispatcher.table
+        reply = []
+        for line, message in held:
+            consumed = dispatch(hostname, message)
+            if not subscriptions:
+                if not consumed:
+                    reply.append((line.rstrip(), message))
+                continue
+            subs = subscriptions.match(hostname, line, handled)
+            if subs and not (subscriptions.deliver(subs, hostname, message) 
+                             or consumed):
+                reply.append((line.rstrip(), message))
+        self._store_replies(hostname, reply)
+        
+    def _on_welcome(self, hostname, message):
+        ## Most servers end the welcome with our full nick!user@host
+        if message.params:
+            prefix = message.params[-1].rsplit(" ", 1)[-1]
+            if "!" in prefix and "@" in prefix:
+                self.serv_to_prefix[hostname] = prefix
+        ## By now a TLS 1.3 server has sent the tickets to resume with
+        self._save_session(hostname)
+            
+    def _on_isupport(self, hostname, message):
+        tokens = parse_isupport(message.params)
+        self.serv_to_isupport.setdefault(hostname, {}).update(tokens)
+        if "CASEMAPPING" in tokens:
+            self._state(hostname).set_casemapping(tokens["CASEMAPPING"] or 
+                                                  "rfc1459")
+        if "PREFIX" in tokens:
+            self._state(hostname).set_prefixes(tokens["PREFIX"])
+            
+    def _on_names(self, hostname, message):
+        if len(message.params) > 2:
+            self._state(hostname).names(message.params[-2], 
+                                        message.params[-1])
+            
+    def _on_join(self, hostname, message):
+        if message.prefix is None or not message.params:
+            return
+        state = self._state(hostname)
+        for chan_name in message.params[0].split(","):
+            state.joined(message.prefix, chan_name)
+        if message.nick != self._data(hostname, "nick"):
+            return
+        if "@" in message.prefix:
+            self.serv_to_prefix[hostname] = message.prefix
+        for chan_name in message.params[0].split(","):
+            self._join_answer(hostname, chan_name, 0)
+            
+    def _on_join_error(self, hostname, message):
+        if len(message.params) > 1:
+            self._join_answer(hostname, message.params[1], message.command)
+            
+    def _join_answer(self, hostname, chan_name, code):
+        """Records the server's answer to a JOIN, waking join_channels"""
+        entry = self.pending_joins.get(hostname, {}).pop(chan_name.lower(), 
+                                                         None)
+        if entry is None:
+            if code == 0:
+                self.serv_to_chan[hostname].add(chan_name)
+            return
+        chan_name, results = entry
+        if code == 0:
+            self.serv_to_chan[hostname].add(chan_name)
+        else:
+            self.serv_to_chan[hostname].discard(chan_name)
+        if self.metrics is not None:
+            self.metrics.acquire(self.join_answered, hostname)
+        else:
+            self.join_answered.acquire()
+        try:
+            results[chan_name] = code
+            self.join_answered.notify_all()
+        finally:
+            self.join_answered.release()
+            
+    def _on_part(self, hostname, message):
+        if message.prefix is None or not message.params:
+            return
+        state = self._state(hostname)
+        for chan_name in message.params[0].split(","):
+            state.parted(message.nick, chan_name)
+        if message.nick == self._data(hostname, "nick"):
+            self.serv_to_chan[hostname].difference_update(
+                message.params[0].split(","))
+                
+    def _on_kick(self, hostname, message):
+        if len(message.params) < 2:
+            return
+        self._state(hostname).parted(message.params[1], message.params[0])
+        if message.params[1] == self._data(hostname, "nick"):
+            self.serv_to_chan[hostname].discard(message.params[0])
+            
+    def _on_quit(self, hostname, message):
+        if message.prefix is not None:
+            self._state(hostname).quit(message.nick)
+            
+    def _on_nick(self, hostname, message):
+        if message.prefix is None or not message.params:
+            return
+        state = self._state(hostname)
+        if state.key(message.nick) == state.me:
+            self.serv_to_data.setdefault(hostname, {})["nick"] = (
+                message.params[0])
+        state.nick_changed(message.nick, message.params[0])
+        
+    def _on_ping(self, hostname, message):
+        ## A bare PING still gets its PONG
+        token = message.params[-1] if message.params else ""
+        self.ping_pong(self.servers[hostname], ":" + token)
+        return True
+        
+    def _store_replies(self, hostname, reply):
+        if not reply:
+            return
+        if hostname not in self.replies:
+            self.replies[hostname] = Scrollback(self._data(hostname, 
+                                                           "scrollback"))
+        self.replies[hostname].extend([line for line, _ in reply])
+                
+    def send_stats(self, hostname):
+        """Queue depth and delay figures for what is being sent to a server"""
+        return self.send_queues[hostname].stats()
+        
+    def _send(self, hostname, line):
+        """Queues a line for a server and sends whatever flood control
+        allows straight away.  Raises socket.error if sending failed
+        """
+        self.send_queues[hostname].put(line)
+        self._flush(hostname, raise_errors=True)
+        
+    def _send_lines(self, hostname, lines):
+        """Queues several lines at once, so that they go out in as few sends
+        as flood control allows
+        """
+        queue = self.send_queues[hostname]
+        for line in lines:
+            queue.put(line)
+        self._flush(hostname, raise_errors=True)
+        
+    def _privmsg_lines(self, hostname, targets, message):
+        return format_lines("PRIVMSG", targets, message.rstrip(),
+                            self._prefix_length(hostname),
+                            max_targets(self.serv_to_isupport.get(hostname, {}),
+                                        "PRIVMSG"))
+        
+    def _prefix_length(self, hostname):
+        """How many bytes the server adds in front of what we send, counting
+        the colon and the space
+        """
+        if hostname in self.serv_to_prefix:
+            return len(self.serv_to_prefix[hostname]) + 2
+        ## ":nick!~ident@host " with the longest host the server allows
+        return (len(self._data(hostname, "nick")) + 
+                len(self._data(hostname, "ident")) + HOSTLEN + 5)
+        
+    def _store_data(self, hostname, kwargs):
+        """Keeps whatever per-server settings differ from the defaults"""
+        if kwargs:
+            self.serv_to_data[hostname] = {}
+            for key, value in kwargs.items():
+                if key in self.__dict__:
+                    self.serv_to_data[hostname][key] = value
+                else:
+                    log.info("key-value pair %s: %s unusued", key, value)
+            if not self.serv_to_data[hostname]:
+                del self.serv_to_data[hostname]
+                
+    def _connect(self, hostname, port, results=None):
+        """Starts connecting to a server on the resolver's pool, queueing
+        the lines that log in for when it is done
+        """
+        self.connecting[hostname] = (
+            port, self.resolver.connect_async(hostname, port), results)
+        self.serv_to_chan[hostname] = set()
+        self.serv_to_port[hostname] = port
+        self.send_queues.setdefault(hostname, SendQueue())
+        log.info("Connecting to %s on %s", hostname, port)
+        self._login(hostname)
+        
+    def _finish_connects(self):
+        """Registers every server whose connect has come back, or clears it
+        out if connecting failed, and closes the sockets of abandoned ones
+        """
+        for result in self.abandoned[:]:
+            if result.ready():
+                self.abandoned.remove(result)
+                if result.successful():
+                    result.get().close()
+                    
+        for hostname, (port, result, results) in list(
+                self.connecting.items()):
+            if not result.ready():
+                continue
+            del self.connecting[hostname]
+            try:
+                sock = result.get()
+            except socket.error as e: ## socket.gaierror is one
+                code = self._connect_failed(hostname, port, e)
+                self._clear(hostname)
+                if self.supervisor is not None:
+                    self.supervisor.connect_failed(hostname, e)
+            else:
+                code = self._register(hostname, port, sock)
+            if results is not None:
+                with self.connect_answered:
+                    results[hostname] = code
+                    self.connect_answered.notify_all()
+        
+    def _login(self, hostname):
+        if self.caps is not None:
+            self.caps.start(hostname)
+        ## Sent as they are, as the realname would keep the space
+        ## send_server_message puts on the end
+        self._send_lines(hostname, [
+            NICK.format(self._data(hostname, "nick")),
+            USER.format(self._data(hostname, "ident"), 
+                        self._data(hostname, "realname"))])
+        
+    def _register(self, hostname, port, sock):
+        """Starts watching a freshly connected socket and sends what was
+        queued while connecting, logging in first.  Over TLS, it waits for
+        poll to finish the handshake
+        """
+        tls = self._data(hostname, "tls")
+        try:
+            if tls is not None:
+                sock = tls.wrap(sock, hostname, port)
+                sock.setblocking(False)
+                self.handshakes[hostname] = tls
+                self.scheduler.call_later(HANDSHAKE_TIMEOUT, 
+                                          self._handshake_expired, hostname, 
+                                          sock)
+            else:
+                sock.settimeout(2)
+            self.servers[hostname] = sock
+            self.serv_to_chan.setdefault(hostname, set())
+            self.serv_to_port[hostname] = port
+            self.last_seen[hostname] = time.time()
+            self._watch(hostname, sock)
+            if tls is not None and self._handshake(hostname):
+                return 2
+            self._flush(hostname, raise_errors=True)
+        except socket.error as e:
+            return self._connect_failed(hostname, port, e)
+        else:
+            log.info("Connected to %s on %s", hostname, port)
+            return 0
+            
+    def _connect_failed(self, hostname, port, error):
+        """Logs why connecting failed, returning join_server's error code"""
+        log.error("Couldn't connect to %s: %s", hostname, error)
+        if isinstance(error, socket.gaierror): ## couldn't resolve hostname
+            return 1
+        if port not in (6667, TLS_PORT):
+            log.warning("Consider using port 6667 (the defacto IRC port), or "
+                        "%s for TLS", TLS_PORT)
+        return 2
+        
+    def _drop(self, hostname, reason):
+        """Clears out everything about a dead link.  What it takes to rebuild
+        the link (the port and the channels we were in) goes to the
+        supervisor, if there is one
+        """
+        log.warning("Lost %s: %s", hostname, reason)
+        port, channels = self._clear(hostname)
+        if self.keepalive is not None:
+            self.keepalive.forget(hostname)
+        if self.supervisor is not None:
+            self.supervisor.link_lost(hostname, port, channels, reason)
+        
+    def _clear(self, hostname):
+        """Forgets everything about a link but its settings, giving up on
+        connecting to it if that isn't done.  Returns the port it was on and
+        the channels we were in
+        """
+        connect = self.connecting.pop(hostname, None)
+        if connect is not None:
+            self.abandoned.append(connect[1])
+        self._unwatch(hostname)
+        sock = self.servers.pop(hostname, None)
+        if sock is not None:
             try:
-                if reply not in self.replies[hostname]: 
-                    self.replies[hostname] += reply
-            except KeyError:
-                self.replies[hostname] = reply
+                sock.close()
+            except socket.error:
+                pass
+        for state in (self.framers, self.send_queues, self.serv_to_prefix,
+                      self.serv_to_isupport, self.serv_to_state, 
+                      self.last_seen, self.batches, self.handshakes):
+            state.pop(hostname, None)
+        port = self.serv_to_port.pop(hostname, 6667)
+        channels = self.serv_to_chan.pop(hostname, set())
+        
+        ## Nobody is going to answer the JOINs join_channels is waiting on
+        with self.join_answered:
+            for chan_name, results in self.pending_joins.pop(hostname, 
+                                                             {}).values():
+                results[chan_name] = 1
+            self.join_answered.notify_all()
+        return port, channels
+        
+    def _handshake(self, hostname):
+        """Takes a TLS handshake as far as the socket allows.  Once it is
+        done the socket goes back to reads with a timeout, and whatever was
+        queued meanwhile (NICK and USER) goes out
+        """
+        sock = self.servers[hostname]
+        try:
+            want = self.handshakes[hostname].handshake(
+                sock, hostname, self.serv_to_port.get(hostname, TLS_PORT))
+        except HANDSHAKE_ERRORS as e:
+            log.error("TLS handshake with %s failed: %s", hostname, e)
+            self._drop(hostname, e)
+            return 1
+        if want:
+            events = (selectors.EVENT_READ if want == WANT_READ else 
+                      selectors.EVENT_WRITE)
+            self.selector.modify(sock, events, hostname)
+            return 0
+        del self.handshakes[hostname]
+        sock.settimeout(2)
+        self.selector.modify(sock, selectors.EVENT_READ, hostname)
+        self._flush(hostname)
+        return 0
+        
+    def _handshake_expired(self, hostname, sock):
+        if hostname in self.handshakes and self.servers.get(hostname) is sock:
+            self._drop(hostname, "no TLS handshake in {}s".format(
+                HANDSHAKE_TIMEOUT))
+            
+    def _save_session(self, hostname):
+        tls = self._data(hostname, "tls")
+        if tls is not None and hostname in self.servers:
+            tls.save(self.servers[hostname], hostname, 
+                     self.serv_to_port.get(hostname, TLS_PORT))
+        
+    def _state(self, hostname):
+        if hostname not in self.serv_to_state:
+            self.serv_to_state[hostname] = ServerState(
+                self._data(hostname, "nick"), 
+                self.serv_to_isupport.get(hostname, {}).get("CASEMAPPING") or
+                "rfc1459")
+        return self.serv_to_state[hostname]
+        
+    def _known(self, hostname):
+        """Whether we are connected, or connecting, to a server"""
+        return hostname in self.servers or hostname in self.connecting
+        
+    def _data(self, hostname, key):
+        """Looks up nick, ident or realname for a server"""
+        return self.serv_to_data.get(hostname, {}).get(key, 
+                                                       getattr(self, key))
+        
+    def _flush(self, hostname, raise_errors=False):
+        if hostname in self.handshakes or hostname in self.connecting:
+            return
+        queue = self.send_queues[hostname]
+        pending = bool(queue.pending)
+        try:
+            self._flush_queue(hostname, queue)
+        except socket.error as e:
+            if raise_errors:
+                raise
+            log.exception(e)
+            log.warning("Failed to send to %s", hostname)
+            
+        ## Only wait for the socket to be writable while a send is stuck
+        ## partway through a batch
+        if bool(queue.pending) != pending:
+            events = selectors.EVENT_READ
+            if queue.pending:
+                events |= selectors.EVENT_WRITE
+            try:
+                self.selector.modify(self.servers[hostname], events, hostname)
+            except (KeyError, ValueError):
+                pass
+        
+    def _flush_queue(self, hostname, queue, force=False):
+        """queue.flush, counting what went out for the metrics"""
+        if self.metrics is None:
+            return queue.flush(self.servers[hostname], force)
+        lines, nbytes = queue.sent_lines, queue.sent_bytes
+        try:
+            return queue.flush(self.servers[hostname], force)
+        finally:
+            self.metrics.sent(hostname, queue.sent_bytes - nbytes, 
+                              queue.sent_lines - lines)
+        
+    def _watch(self, hostname, sock):
+        self.framers[hostname] = LineFramer()
+        self.send_queues.setdefault(hostname, SendQueue())
+        self.selector.register(sock, selectors.EVENT_READ, hostname)
+        
+    def _unwatch(self, hostname):
+        try:
+            self.selector.unregister(self.servers[hostname])
+        except (KeyError, ValueError):
+            pass
         
     def __del__(self):
         for host, sock in self.servers.items():
@@ -352,6 +1180,9 @@ class IRC_member(object):
         
 
 if __name__ == "__main__":
+    import IRC_logging
+    IRC_logging.configure()
+    
     NICK = "Dannnno" # raw_input("Please enter your nickname ")
     #USER = raw_input("Please enter your user name ")
     #REAL = raw_input("Please enter your 'real' name ")
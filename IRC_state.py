@@ -0,0 +1,275 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+try:
+    from sys import intern
+except ImportError:
+    pass ## Python 2 has intern as a builtin
+try:
+    maketrans = str.maketrans
+except AttributeError:
+    from string import maketrans
+    
+    
+_UPPER = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_LOWER = "abcdefghijklmnopqrstuvwxyz"
+
+## How each CASEMAPPING an RPL_ISUPPORT can name folds names.  rfc1459 (the
+## default) also treats []\~ as the upper case of {}|^
+_FOLDS = {
+    "ascii": (_UPPER, _LOWER),
+    "rfc1459": (_UPPER + "[]\\~", _LOWER + "{}|^"),
+    "strict-rfc1459": (_UPPER + "[]\\", _LOWER + "{}|"),
+}
+CASEMAPPINGS = dict((name, maketrans(upper, lower)) 
+                    for name, (upper, lower) in _FOLDS.items())
+
+## The same as tables of code points, which is what Python 2's unicode
+## translates with
+_TEXT_CASEMAPPINGS = dict((name, dict(zip(map(ord, upper), map(ord, lower))))
+                          for name, (upper, lower) in _FOLDS.items())
+
+## What the prefix characters in a NAMES reply are until the server's
+## PREFIX token says otherwise
+DEFAULT_PREFIXES = "@+"
+
+
+def casefold(name, casemapping="rfc1459"):
+    """Folds a nick or channel name the way the server compares them"""
+    tables = CASEMAPPINGS if isinstance(name, str) else _TEXT_CASEMAPPINGS
+    return name.translate(tables.get(casemapping, tables["ascii"]))
+
+
+def _intern(name):
+    ## Only str can be interned, and Python 2 can be handed unicode
+    return intern(name) if isinstance(name, str) else name
+
+
+def parse_prefix(token):
+    """Turns a PREFIX token like "(ov)@+" into its prefix characters"""
+    return token.partition(")")[2] if token else ""
+
+
+class User(object):
+    """Someone we share at least one channel with"""
+
+    __slots__ = ("nick", "ident", "host", "channels")
+
+    def __init__(self, nick, ident=None, host=None):
+        self.nick = nick
+        self.ident = ident
+        self.host = host
+        self.channels = set()
+
+    def __repr__(self):
+        return "User({!r})".format(self.nick)
+
+
+class Channel(object):
+    """A channel we are in.  members maps the folded nick of everyone in it
+    to their prefix characters ("@", "+", "" and so on)
+    """
+
+    __slots__ = ("name", "members")
+
+    def __init__(self, name):
+        self.name = name
+        self.members = {}
+
+    def __repr__(self):
+        return "Channel({!r}, {} members)".format(self.name, 
+                                                  len(self.members))
+
+
+class ServerState(object):
+    """The channels we are in on one server and who is in them, kept up to
+    date from JOIN, PART, KICK, QUIT, NICK and NAMES.  Everything is keyed
+    by folded, interned names, so a nick in thousands of channels is only
+    stored once and every lookup is a dict lookup
+    """
+
+    def __init__(self, nick, casemapping="rfc1459"):
+        self.casemapping = casemapping
+        self.prefixes = DEFAULT_PREFIXES
+
+        # This is a mapping of folded nick to User
+        self.users = {}
+
+        # This is a mapping of folded channel name to Channel
+        self.channels = {}
+        
+        self.me = self.key(nick)
+
+    def key(self, name):
+        return _intern(casefold(name, self.casemapping))
+
+    def has_user(self, nick):
+        return self.key(nick) in self.users
+
+    def user(self, nick):
+        return self.users.get(self.key(nick))
+
+    def channel(self, chan_name):
+        return self.channels.get(self.key(chan_name))
+
+    def shared_channels(self, nick):
+        """The Channels we share with nick.  This is the set the state
+        itself keeps, so it mustn't be changed
+        """
+        user = self.users.get(self.key(nick))
+        return user.channels if user is not None else frozenset()
+
+    def set_casemapping(self, casemapping):
+        """Switches to the server's CASEMAPPING, refolding what we have"""
+        if casemapping == self.casemapping:
+            return
+        self.casemapping = casemapping
+        users, self.users = self.users, {}
+        keys = {}
+        for old_key, user in users.items():
+            keys[old_key] = self.key(user.nick)
+            self.users[keys[old_key]] = user
+        self.me = keys.get(self.me, self.me)
+        channels, self.channels = self.channels, {}
+        for channel in channels.values():
+            channel.members = dict((keys[key], modes) 
+                                   for key, modes in channel.members.items())
+            self.channels[self.key(channel.name)] = channel
+
+    def set_prefixes(self, token):
+        self.prefixes = parse_prefix(token) or DEFAULT_PREFIXES
+
+    def joined(self, prefix, chan_name):
+        """Someone (maybe us) joined a channel.  prefix is nick!ident@host"""
+        nick, ident, host = split_prefix(prefix)
+        key = self.key(nick)
+        chan_key = self.key(chan_name)
+        channel = self.channels.get(chan_key)
+        if key == self.me:
+            if channel is not None:
+                self._forget_channel(chan_key)
+            channel = self.channels[chan_key] = Channel(chan_name)
+        elif channel is None:
+            return
+        user = self._user(key, nick)
+        if ident is not None:
+            user.ident = _intern(ident)
+            user.host = host and _intern(host)
+        channel.members[key] = ""
+        user.channels.add(channel)
+
+    def parted(self, nick, chan_name):
+        """Someone left a channel, by PART or by being kicked"""
+        key = self.key(nick)
+        chan_key = self.key(chan_name)
+        if key == self.me:
+            self._forget_channel(chan_key)
+            return
+        channel = self.channels.get(chan_key)
+        if channel is not None and channel.members.pop(key, None) is not None:
+            self._leave(key, channel)
+
+    def quit(self, nick):
+        key = self.key(nick)
+        user = self.users.pop(key, None)
+        if user is not None:
+            for channel in user.channels:
+                channel.members.pop(key, None)
+
+    def quit_many(self, nicks):
+        """Everyone in nicks quit at once, as in a netsplit.  Returns how
+        many of them we knew
+        """
+        users = self.users
+        key = self.key
+        gone = 0
+        for nick in nicks:
+            nick_key = key(nick)
+            user = users.pop(nick_key, None)
+            if user is not None:
+                gone += 1
+                for channel in user.channels:
+                    channel.members.pop(nick_key, None)
+        return gone
+
+    def nick_changed(self, old, new):
+        old_key, new_key = self.key(old), self.key(new)
+        if old_key == self.me:
+            self.me = new_key
+        user = self.users.pop(old_key, None)
+        if user is None:
+            return
+        user.nick = new
+        self.users[new_key] = user
+        for channel in user.channels:
+            channel.members[new_key] = channel.members.pop(old_key, "")
+
+    def names(self, chan_name, names):
+        """Adds the people listed in one RPL_NAMREPLY"""
+        channel = self.channels.get(self.key(chan_name))
+        if channel is None:
+            return
+        prefixes = self.prefixes
+        members = channel.members
+        for name in names.split():
+            nick = name.lstrip(prefixes)
+            modes = _intern(name[:len(name) - len(nick)])
+            nick, ident, host = split_prefix(nick)
+            key = self.key(nick)
+            user = self._user(key, nick)
+            if ident is not None:
+                user.ident = _intern(ident)
+                user.host = host and _intern(host)
+            members[key] = modes
+            user.channels.add(channel)
+
+    def _user(self, key, nick):
+        user = self.users.get(key)
+        if user is None:
+            user = self.users[key] = User(_intern(nick))
+        return user
+
+    def _leave(self, key, channel):
+        user = self.users.get(key)
+        if user is None:
+            return
+        user.channels.discard(channel)
+        if not user.channels and key != self.me:
+            del self.users[key]
+
+    def _forget_channel(self, chan_key):
+        channel = self.channels.pop(chan_key, None)
+        if channel is None:
+            return
+        for key in channel.members:
+            self._leave(key, channel)
+        channel.members = {}
+
+
+def split_prefix(prefix):
+    """Splits nick!ident@host, giving None for the parts that are missing"""
+    nick, _, host = prefix.partition("@")
+    nick, _, ident = nick.partition("!")
+    return nick, ident or None, host or None
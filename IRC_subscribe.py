@@ -0,0 +1,148 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+from IRC_message import decode, encode
+from IRC_state import casefold
+
+
+def peek(line):
+    """Splits the nick, command and first parameter off a raw line without
+    parsing the rest of it.  The first parameter is the channel (or nick)
+    a PRIVMSG, NOTICE, JOIN, PART, KICK, MODE or TOPIC is aimed at
+    """
+    nick, command, target = _peek(line)
+    return nick and decode(nick), decode(command), decode(target)
+
+
+def _peek(line):
+    """peek, leaving the fields as bytes"""
+    if line.__class__ is not bytes:
+        line = encode(line)
+    if line[:1] == b"@":
+        line = line.partition(b" ")[2]
+    nick = None
+    if line[:1] == b":":
+        prefix, _, line = line[1:].partition(b" ")
+        nick = prefix.split(b"!", 1)[0].split(b"@", 1)[0]
+    command, _, rest = line.lstrip().partition(b" ")
+    target = rest.split(b" ", 1)[0]
+    if target[:1] == b":":
+        target = target[1:]
+    return nick, command.upper(), target
+
+
+class Subscription(object):
+    """A callback and the server, channel, command and nick it wants.  None
+    matches anything
+    """
+
+    __slots__ = ("callback", "server", "channel", "command", "nick")
+
+    def __init__(self, callback, server=None, channel=None, command=None,
+                 nick=None):
+        self.callback = callback
+        self.server = server
+        self.channel = channel and casefold(channel)
+        self.command = command and command.upper()
+        self.nick = nick and casefold(nick)
+
+    def matches(self, hostname, nick, target):
+        return ((self.server is None or self.server == hostname) and
+                (self.nick is None or
+                 (nick is not None and self.nick == casefold(nick))) and
+                (self.channel is None or self.channel == casefold(target)))
+
+    def __repr__(self):
+        return "Subscription({!r}, server={!r}, channel={!r}, " \
+               "command={!r}, nick={!r})".format(
+                   self.callback, self.server, self.channel, self.command,
+                   self.nick)
+
+
+class Subscriptions(object):
+    """The subscriptions of one member, indexed by command so a line can be
+    checked against them from its command alone.  Once a member has any,
+    lines that neither a subscription nor one of its own handlers wants
+    are dropped before they are parsed
+    """
+
+    def __init__(self):
+
+        # This is a mapping of command (None for any command) to the
+        # Subscriptions for it
+        # {
+        #  "PRIVMSG": (Subscription(...), Subscription(...)),
+        #  None: (Subscription(...),)
+        # }
+        self.table = {}
+
+    def __len__(self):
+        return sum(len(subs) for subs in self.table.values())
+
+    def add(self, callback, server=None, channel=None, command=None,
+            nick=None):
+        """Calls callback with the server name and Message for every line
+        matching all of the filters given.  Returns the Subscription, for
+        remove
+        """
+        sub = Subscription(callback, server, channel, command, nick)
+        self.table[sub.command] = self.table.get(sub.command, ()) + (sub,)
+        return sub
+
+    def remove(self, sub):
+        subs = tuple(other for other in self.table.get(sub.command, ())
+                     if other is not sub)
+        if subs:
+            self.table[sub.command] = subs
+        else:
+            self.table.pop(sub.command, None)
+
+    def match(self, hostname, line, handled=()):
+        """The subscriptions that want a raw line, or None if the line can
+        be dropped because nothing wants it: no subscription matches and
+        its command isn't in handled (the member's own dispatch table)
+        """
+        nick, command, target = _peek(line)
+        command = decode(command)
+        subs = self.table.get(command, ()) + self.table.get(None, ())
+        if subs:
+            ## Only decoded once something might want them
+            nick = nick and decode(nick)
+            target = decode(target)
+            subs = tuple(sub for sub in subs
+                         if sub.matches(hostname, nick, target))
+        if not subs and command not in handled:
+            return None
+        return subs
+
+    def deliver(self, subs, hostname, message):
+        """Calls every subscription in subs with the message.  Returns True
+        if any callback consumed it
+        """
+        consumed = False
+        for sub in subs:
+            if sub.callback(hostname, message):
+                consumed = True
+        return consumed
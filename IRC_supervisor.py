@@ -0,0 +1,218 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+from collections import deque
+import logging
+import random
+import socket
+import time
+
+from IRC_keepalive import Keepalive
+from IRC_message import RPL_WELCOME, format_list_lines, max_targets
+
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+class Backoff(object):
+    """Exponential backoff with full jitter: the wait before retry number n
+    is anywhere from 0 to base * factor ** n seconds, capped at cap.  The
+    jitter keeps a client with many servers (or many clients after a
+    netsplit) from reconnecting in lockstep
+    """
+
+    def __init__(self, base=1.0, cap=300.0, factor=2.0, random=random.random):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.random = random
+
+    def delay(self, attempt):
+        ## The exponent is clamped so a long outage can't overflow the float
+        return self.random() * min(self.cap, 
+                                   self.base * self.factor ** min(attempt, 64))
+
+
+class _Link(object):
+    """A server the supervisor is bringing back"""
+
+    __slots__ = ("port", "channels", "down_since", "attempts", "retry_at",
+                 "state")
+
+    def __init__(self, port, channels, down_since):
+        self.port = port
+        self.channels = set(channels)
+        self.down_since = down_since
+        self.attempts = 0
+        self.retry_at = down_since
+        self.state = Supervisor.DOWN
+
+
+class Supervisor(object):
+    """Watches the links of an IRC_sockselect.IRC_member and brings back the
+    ones that die.  A link is dead once the server closes it, reading from
+    it fails, or the member's IRC_keepalive.Keepalive gives up on a PING
+    (the supervisor adds one if the member has none).  Dead links are
+    reconnected with Backoff between the attempts, and once the server
+    welcomes us back every channel we were in is joined again.  All of it
+    happens from inside the member's poll
+    """
+
+    DOWN = "down"
+    ## Connecting, or waiting for the server to welcome us
+    REGISTERING = "registering"
+    UP = "up"
+
+    def __init__(self, member, backoff=None, ping_interval=120.0, 
+                 ping_timeout=60.0, clock=time.time):
+        """Constructor for Supervisor.  Unless the member already has a
+        Keepalive, one is made that PINGs every ping_interval seconds and
+        gives up on a link that takes longer than ping_timeout to answer.
+        ping_timeout is also how long a reconnect gets, from starting to
+        connect to the server welcoming us
+        """
+
+        self.member = member
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.clock = clock
+
+        # This is a mapping of server name to the _Link being brought back
+        self.links = {}
+
+        # This is a mapping of server name to how many times it has been lost
+        self.disconnects = {}
+
+        # This is a mapping of server name to how long the most recent
+        # recoveries took, from losing the link to being welcomed back
+        # {
+        #  "some_server": deque([1.25, 3.5])
+        # }
+        self.recoveries = {}
+
+        member.supervisor = self
+        member.dispatcher.register(RPL_WELCOME, self._on_welcome)
+        self.keepalive = member.keepalive
+        if self.keepalive is None:
+            self.keepalive = Keepalive(member, ping_interval, ping_timeout)
+
+    def link_lost(self, hostname, port, channels, reason=None):
+        """Called by the member once it has cleared out a dead link"""
+        now = self.clock()
+        link = self.links.get(hostname)
+        if link is None:
+            link = self.links[hostname] = _Link(port, channels, now)
+            self.disconnects[hostname] = self.disconnects.get(hostname, 0) + 1
+        else:
+            ## Died again before it had recovered
+            link.channels.update(channels)
+        self._retry_later(hostname, link, now)
+
+    def connect_failed(self, hostname, reason=None):
+        """Called by the member when a connect it started for us fails"""
+        link = self.links.get(hostname)
+        if link is not None:
+            log.info("Couldn't reconnect to %s: %s", hostname, reason)
+            self._retry_later(hostname, link, self.clock())
+
+    def forget(self, hostname):
+        """Stops looking after a server, because we left it on purpose"""
+        self.links.pop(hostname, None)
+
+    def ready_in(self):
+        """Seconds until tick has something to do, or None if nothing is
+        scheduled
+        """
+        now = self.clock()
+        due = [link.retry_at for link in self.links.values()]
+        if not due:
+            return None
+        return max(0.0, min(due) - now)
+
+    def tick(self):
+        """Starts reconnecting links whose backoff has run out and gives up
+        on links the server never welcomed us back on.  Connects run on the
+        member's resolver pool, and the member reports back from a later
+        poll, so this never waits on one
+        """
+        now = self.clock()
+        retry = [hostname for hostname, link in self.links.items()
+                 if link.state == self.DOWN and link.retry_at <= now]
+        if retry:
+            results = self.member.join_servers(
+                [(hostname, self.links[hostname].port) for hostname in retry],
+                wait=False)
+            for hostname in results:
+                link = self.links[hostname]
+                link.state = self.REGISTERING
+                link.retry_at = now + self.ping_timeout
+
+        for hostname, link in list(self.links.items()):
+            if link.state == self.REGISTERING and link.retry_at <= now:
+                self.member._drop(hostname, "never welcomed us back")
+
+    def stats(self, hostname):
+        """Reconnect figures for a server"""
+        link = self.links.get(hostname)
+        recoveries = self.recoveries.get(hostname, ())
+        return {
+            "state": link.state if link is not None else self.UP,
+            "attempts": link.attempts if link is not None else 0,
+            "disconnects": self.disconnects.get(hostname, 0),
+            "recoveries": len(recoveries),
+            "last_recovery": recoveries[-1] if recoveries else None,
+            "max_recovery": max(recoveries) if recoveries else None,
+            "mean_recovery": (sum(recoveries) / len(recoveries) 
+                              if recoveries else None),
+        }
+
+    def _retry_later(self, hostname, link, now):
+        link.state = self.DOWN
+        delay = self.backoff.delay(link.attempts)
+        link.retry_at = now + delay
+        link.attempts += 1
+        log.info("Reconnecting to %s in %.1fs (attempt %s)", 
+                 hostname, delay, link.attempts)
+
+    def _on_welcome(self, hostname, message):
+        link = self.links.pop(hostname, None)
+        if link is None:
+            return
+        recovered = self.clock() - link.down_since
+        self.recoveries.setdefault(hostname, deque(maxlen=100)).append(
+            recovered)
+        log.info("%s is back after %.2fs", hostname, recovered)
+        if link.channels:
+            try:
+                self.member._send_lines(hostname, format_list_lines(
+                    "JOIN", link.channels, None,
+                    max_targets(self.member.serv_to_isupport.get(hostname, {}),
+                                "JOIN", None)))
+            except socket.error as e:
+                log.exception(e)
+                log.warning("Failed to rejoin channels on %s", hostname)
+
@@ -0,0 +1,149 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+from collections import OrderedDict
+import logging
+import socket
+import ssl
+import threading
+
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+## The port IRC over TLS is usually on (RFC 7194)
+TLS_PORT = 6697
+
+## Whether this ssl can hand a session to a new connection to resume it
+## (Python 3.6 and later).  Without it, every handshake is a full one
+RESUMPTION = hasattr(ssl, "SSLSession")
+
+## What TLS.handshake returns while it is waiting on the socket
+WANT_READ = 1
+WANT_WRITE = 2
+
+## What a non-blocking TLS socket raises when recv or send has to wait
+## for the other side, even once the handshake is done
+WOULD_BLOCK = (ssl.SSLWantReadError, ssl.SSLWantWriteError)
+
+## What TLS.handshake raises when it fails.  ssl.SSLError is a socket.error,
+## but before Python 3.7 a certificate for some other host isn't
+HANDSHAKE_ERRORS = (socket.error, ssl.CertificateError)
+
+
+class SessionCache(object):
+    """The latest TLS session for each (hostname, port), so reconnecting
+    resumes it rather than doing a full handshake.  Holds at most maxsize,
+    dropping the least recently used
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, key):
+        with self.lock:
+            session = self.sessions.pop(key, None)
+            if session is not None:
+                self.sessions[key] = session
+            return session
+
+    def put(self, key, session):
+        with self.lock:
+            self.sessions.pop(key, None)
+            self.sessions[key] = session
+            while len(self.sessions) > self.maxsize:
+                self.sessions.popitem(last=False)
+
+    def forget(self, key):
+        with self.lock:
+            self.sessions.pop(key, None)
+
+
+class TLS(object):
+    """Wraps the sockets a member connects in TLS, resuming the session of
+    the last connection to the same server where it can.  Handshakes are
+    stepped through by the event loop a readable or writable socket at a
+    time, so they never block it
+    """
+
+    def __init__(self, context=None, sessions=None, cafile=None):
+        """Constructor for TLS.  Without a context, servers are checked
+        against the system's certificates (or cafile, if given)
+        """
+        self.context = context if context is not None else \
+                       ssl.create_default_context(cafile=cafile)
+        self.sessions = sessions if sessions is not None else SessionCache()
+        
+        ## Handshakes done, and how many of them resumed a session
+        self.handshakes = 0
+        self.resumed = 0
+
+    def wrap(self, sock, hostname, port):
+        """Wraps a connected socket without shaking hands yet, offering the
+        server the last session we had with it
+        """
+        kwargs = {}
+        session = self.sessions.get((hostname, port)) if RESUMPTION else None
+        if session is not None:
+            kwargs["session"] = session
+        return self.context.wrap_socket(sock, server_hostname=hostname,
+                                        do_handshake_on_connect=False,
+                                        **kwargs)
+
+    def handshake(self, sock, hostname, port):
+        """Takes the handshake as far as the socket allows.  Returns 0 once
+        it is done, or WANT_READ or WANT_WRITE for what to wait for before
+        calling again.  Raises one of HANDSHAKE_ERRORS if it failed
+        """
+        try:
+            sock.do_handshake()
+        except ssl.SSLWantReadError:
+            return WANT_READ
+        except ssl.SSLWantWriteError:
+            return WANT_WRITE
+        self.handshakes += 1
+        if getattr(sock, "session_reused", False):
+            self.resumed += 1
+        else:
+            log.info("Full TLS handshake with %s", hostname)
+        self.save(sock, hostname, port)
+        return 0
+
+    def save(self, sock, hostname, port):
+        """Keeps a connection's session for the next one.  TLS 1.3 servers
+        send their session tickets after the handshake, so this is worth
+        calling again once something has been read
+        """
+        session = getattr(sock, "session", None)
+        if session is not None:
+            self.sessions.put((hostname, port), session)
+
+    def forget(self, hostname, port):
+        self.sessions.forget((hostname, port))
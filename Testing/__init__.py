@@ -22,4 +22,4 @@ THE SOFTWARE.
 You should have received a copy of the MIT License along with this program.
 If not, see <http://opensource.org/licenses/MIT>
 """
-__all__ = ['test_sockasyncore', 'test_sockselect']
+__all__ = ['test_asyncio', 'test_bridge', 'test_cap', 'test_fake_ircd', 'test_framing', 'test_history', 'test_keepalive', 'test_logging', 'test_message', 'test_metrics', 'test_resolver', 'test_scheduler', 'test_scrollback', 'test_search', 'test_sendqueue', 'test_shard', 'test_sockasyncore', 'test_sockselect', 'test_state', 'test_subscribe', 'test_supervisor', 'test_tls']
@@ -0,0 +1,588 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+"""A small single-threaded ircd that only listens on loopback, for tests and
+benchmarks to connect to.  It registers anyone who sends NICK and USER,
+answers PING, keeps channels for JOIN, PART and NAMES, and relays PRIVMSG
+and NOTICE between its clients.  It can replay recorded traffic to its
+clients at a given rate, be told to drop everyone, refuse connections or
+stop talking.  Given caps, it negotiates them with CAP LS/REQ/END, stamps
+what it relays with server-time (and a msgid, for message-tags), answers
+CHATHISTORY from what was said in its channels, and can split clients off
+in a netsplit batch.  Given a TLS
+context, it speaks TLS.  It also runs on its own:
+
+    python Testing/fake_ircd.py [--port 6667] [--replay FILE] [--rate N]
+                                [--caps CAP ...] [--tls [PEM]]
+
+A client sending "BENCH <count> [rate]" is sent count PRIVMSGs to #bench,
+each carrying its sequence number and the time it was sent, which is what
+Benchmarks/bench_backends.py measures backends with.
+"""
+
+from contextlib import closing
+import argparse
+import os
+import select
+import socket
+import ssl
+import threading
+import time
+
+
+LOOPBACK = ("127.0.0.1", "::1", "localhost")
+
+## Lines sent to a client in one go while replaying as fast as possible
+BATCH = 256
+
+## Every capability it knows how to do
+CAPS = ("batch", "draft/chathistory", "message-tags", "server-time")
+
+## Capabilities listed on each line of a CAP LS 302 reply, so that clients
+## get to put a multi-line listing back together
+CAPS_PER_LINE = 2
+
+## A key and self-signed certificate for localhost and 127.0.0.1, which
+## clients trust as their CA file
+CERTFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
+                        "localhost.pem")
+
+
+def server_time(seconds):
+    """seconds since the epoch as a server-time, to the millisecond"""
+    seconds, millis = divmod(int(round(seconds * 1000)), 1000)
+    return "{}.{:03d}Z".format(
+        time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)), millis)
+
+
+class Client(object):
+
+    __slots__ = ("sock", "number", "buffer", "nick", "user", "channels",
+                 "caps", "negotiating", "registered")
+
+    def __init__(self, sock, number):
+        self.sock = sock
+        self.number = number
+        self.buffer = b""
+        self.nick = None
+        self.user = None
+        self.channels = set()
+        self.caps = set()
+        self.negotiating = False
+        self.registered = False
+
+    @property
+    def prefix(self):
+        return "{}!{}@127.0.0.1".format(self.nick, self.user)
+
+
+class Feed(object):
+    """Lines being replayed to a client, rate lines a second (or as fast as
+    the client takes them if rate is 0).  "{time}" in a line is replaced
+    with the time it is sent
+    """
+
+    __slots__ = ("lines", "rate", "started", "sent")
+
+    def __init__(self, lines, rate=0):
+        self.lines = iter(lines)
+        self.rate = rate
+        self.started = time.time()
+        self.sent = 0
+
+    def due(self, now):
+        if not self.rate:
+            return BATCH
+        return int((now - self.started) * self.rate) - self.sent
+
+    def next_due(self):
+        """When the next line is due, or None if it already is"""
+        if not self.rate:
+            return None
+        return self.started + float(self.sent + 1) / self.rate
+
+
+class FakeIRCd(threading.Thread):
+
+    def __init__(self, host="127.0.0.1", port=0, name="fake.ircd", 
+                 replay=None, rate=0, caps=(), tls=None, clock=time.time):
+        """Constructor for FakeIRCd.  Every client that registers is sent
+        the lines in replay (if given) at rate lines a second.  caps are the
+        capabilities (out of CAPS) it offers; without any, it treats CAP as
+        an unknown command.  tls is an ssl.SSLContext (see tls_context) to
+        wrap every connection in.  clock gives the time relayed messages
+        are stamped with
+        """
+        super(FakeIRCd, self).__init__()
+        if host not in LOOPBACK:
+            raise ValueError("FakeIRCd only listens on loopback")
+        self.daemon = True
+        self.host = host
+        self.name_ = name
+        self.replay_lines = replay
+        self.replay_rate = rate
+        self.caps = tuple(caps)
+        self.tls = tls
+        self.clock = clock
+        self.listener = self._listen(port)
+        self.port = self.listener.getsockname()[1]
+        
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        
+        ## Every line a client has sent, as (connection number, line)
+        self.received = []
+        self.connections = 0
+        self.silent = False
+        self.refusing = False
+        self._drop = False
+        
+        # This is a mapping of client socket to Client
+        self.clients = {}
+        
+        # This is a mapping of folded channel name to the Clients in it
+        self.channels = {}
+        
+        # This is a mapping of client socket to the Feed replaying to it
+        self.feeds = {}
+        
+        # This is a mapping of folded channel name to the (time, msgid,
+        # line) of every PRIVMSG and NOTICE sent to it
+        self.history = {}
+        self.msgids = 0
+        
+        ## Calls made from other threads, run on the next turn of the loop
+        self.calls = []
+        self.batches = 0
+        
+    def run(self):
+        while not self.stopped.is_set():
+            with self.lock:
+                if self._drop:
+                    self._drop = False
+                    for client in list(self.clients):
+                        self._close(client)
+                calls, self.calls = self.calls, []
+                for call in calls:
+                    call()
+                if self.refusing and self.listener is not None:
+                    self.listener.close()
+                    self.listener = None
+                elif not self.refusing and self.listener is None:
+                    self.listener = self._listen(self.port)
+                watched = list(self.clients)
+                if self.listener is not None:
+                    watched.append(self.listener)
+            ready, _, _ = select.select(watched, [], [], self._timeout())
+            for sock in ready:
+                if sock is self.listener:
+                    self._accept()
+                elif sock in self.clients:
+                    self._read(sock)
+            self._pump()
+        for client in list(self.clients):
+            self._close(client)
+        if self.listener is not None:
+            self.listener.close()
+            
+    def stop(self):
+        self.stopped.set()
+        self.join(5)
+        
+    def drop_clients(self):
+        """Closes every client connection on the next turn of the loop"""
+        with self.lock:
+            self._drop = True
+            
+    def refuse(self):
+        """Stops listening (on the next turn of the loop), so connecting is
+        refused until accept is called
+        """
+        with self.lock:
+            self.refusing = True
+            
+    def accept(self):
+        with self.lock:
+            self.refusing = False
+            
+    def netsplit(self, nicks, servers="hub.fake split.fake"):
+        """Splits the clients with these nicks off (on the next turn of the
+        loop).  Everyone else in a channel with them gets their QUITs in a
+        netsplit batch, or one by one without the batch capability
+        """
+        with self.lock:
+            self.calls.append(lambda: self._netsplit(set(nicks), servers))
+            
+    def lines(self, command=None, connection=None):
+        """What clients have sent, optionally only one command or one
+        connection's worth
+        """
+        with self.lock:
+            received = list(self.received)
+        return [line for number, line in received
+                if (command is None or line.split(" ", 1)[0] == command) and
+                   (connection is None or number == connection)]
+        
+    def _listen(self, port):
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, port))
+        listener.listen(64)
+        return listener
+        
+    def _accept(self):
+        sock, _ = self.listener.accept()
+        if self.tls is not None:
+            ## Shaking hands blocks the loop, which only ever has a test's
+            ## few clients to serve
+            sock.settimeout(2)
+            try:
+                sock = self.tls.wrap_socket(sock, server_side=True)
+            except (socket.error, ssl.SSLError):
+                sock.close()
+                return
+        self.connections += 1
+        self.clients[sock] = Client(sock, self.connections)
+        
+    def _timeout(self):
+        timeout = .05
+        for feed in self.feeds.values():
+            due = feed.next_due()
+            if due is None:
+                return 0
+            timeout = min(timeout, max(0, due - time.time()))
+        return timeout
+        
+    def _pump(self):
+        """Sends each feed whatever it has due"""
+        now = time.time()
+        for sock, feed in list(self.feeds.items()):
+            batch = []
+            for _ in range(feed.due(now)):
+                line = next(feed.lines, None)
+                if line is None:
+                    del self.feeds[sock]
+                    break
+                batch.append(line)
+            if batch:
+                feed.sent += len(batch)
+                data = "\r\n".join(batch) + "\r\n"
+                if "{time}" in data:
+                    data = data.replace("{time}", repr(time.time()))
+                self._send(sock, data, raw=True)
+        
+    def _read(self, sock):
+        try:
+            data = sock.recv(65536)
+            ## TLS may have decrypted more than was asked for, which select
+            ## can't see
+            pending = getattr(sock, "pending", None)
+            while data and pending is not None and pending():
+                data += sock.recv(pending())
+        except socket.error:
+            data = b""
+        if not data:
+            self._close(sock)
+            return
+        client = self.clients[sock]
+        lines = (client.buffer + data).split(b"\n")
+        client.buffer = lines.pop()
+        for line in lines:
+            line = line.rstrip(b"\r").decode("utf-8", "replace").strip()
+            if line:
+                with self.lock:
+                    self.received.append((client.number, line))
+                if sock not in self.clients:
+                    return
+                self._handle(client, line)
+            
+    def _handle(self, client, line):
+        if self.silent:
+            return
+        command, _, rest = line.partition(" ")
+        command = command.upper()
+        params, _, text = rest.partition(" :")
+        params = params.split()
+        if command == "NICK" and params:
+            client.nick = params[0]
+        elif command == "USER" and params:
+            client.user = params[0]
+        elif command == "CAP" and self.caps and params:
+            self._cap(client, params, text)
+        elif command == "CHATHISTORY" and len(params) > 3 and \
+             "draft/chathistory" in client.caps:
+            self._chathistory(client, *params[:4])
+        elif command == "PING":
+            self._send(client.sock, ":{0} PONG {0} {1}".format(self.name_, 
+                                                                rest))
+        elif command == "JOIN" and params:
+            for chan_name in params[0].split(","):
+                self._join(client, chan_name)
+        elif command == "PART" and params:
+            for chan_name in params[0].split(","):
+                self._part(client, chan_name, text)
+        elif command == "NAMES" and params:
+            for chan_name in params[0].split(","):
+                self._names(client, chan_name)
+        elif command in ("PRIVMSG", "NOTICE") and params:
+            self._relay(client, command, params[0], text)
+        elif command == "BENCH" and params:
+            self._bench(client, *params)
+        elif command == "QUIT":
+            self._close(client.sock)
+            return
+        if (command in ("NICK", "USER", "CAP") and client.nick and 
+            client.user and not client.negotiating and 
+            not client.registered):
+            client.registered = True
+            self._send(client.sock, ":{} 001 {} :Welcome to the fake network "
+                                    "{}".format(self.name_, client.nick,
+                                                client.prefix))
+            self._send(client.sock, ":{} 005 {} CHATHISTORY=50 :are "
+                                    "supported by this server".format(
+                                        self.name_, client.nick))
+            if self.replay_lines is not None:
+                self.feeds[client.sock] = Feed(self.replay_lines, 
+                                               self.replay_rate)
+            
+    def _cap(self, client, params, text):
+        subcommand = params[0].upper()
+        nick = client.nick or "*"
+        if subcommand == "LS":
+            client.negotiating = not client.registered
+            if params[1:2] == ["302"]:
+                for i in range(0, len(self.caps), CAPS_PER_LINE):
+                    more = "* " if i + CAPS_PER_LINE < len(self.caps) else ""
+                    self._send(client.sock, ":{} CAP {} LS {}:{}".format(
+                        self.name_, nick, more, 
+                        " ".join(self.caps[i:i + CAPS_PER_LINE])))
+            else:
+                self._send(client.sock, ":{} CAP {} LS :{}".format(
+                    self.name_, nick, " ".join(self.caps)))
+        elif subcommand == "REQ":
+            wanted = (text or " ".join(params[1:])).split()
+            if all(cap.lstrip("-") in self.caps for cap in wanted):
+                for cap in wanted:
+                    if cap.startswith("-"):
+                        client.caps.discard(cap[1:])
+                    else:
+                        client.caps.add(cap)
+                reply = "ACK"
+            else:
+                reply = "NAK"
+            self._send(client.sock, ":{} CAP {} {} :{}".format(
+                self.name_, nick, reply, " ".join(wanted)))
+        elif subcommand == "END":
+            client.negotiating = False
+            
+    def _chathistory(self, client, subcommand, target, since, limit):
+        """Answers CHATHISTORY AFTER <target> timestamp=<time> <limit>,
+        CHATHISTORY AFTER <target> msgid=<msgid> <limit> and
+        CHATHISTORY LATEST <target> * <limit>
+        """
+        said = self.history.get(target.lower(), [])
+        if subcommand.upper() == "AFTER" and since.startswith("timestamp="):
+            said = [stamped for stamped in said 
+                    if stamped[0] > since[len("timestamp="):]][:int(limit)]
+        elif subcommand.upper() == "AFTER" and since.startswith("msgid="):
+            msgids = [msgid for stamp, msgid, line in said]
+            if since[len("msgid="):] in msgids:
+                start = msgids.index(since[len("msgid="):]) + 1
+                said = said[start:start + int(limit)]
+            else:
+                said = []
+        elif subcommand.upper() == "LATEST":
+            said = said[-int(limit):]
+        else:
+            said = []
+        self._batch(client, "chathistory " + target, said)
+        
+    def _batch(self, client, kind, stamped):
+        """Sends (time, msgid, line) triples as one batch of kind, or line
+        by line if the client can't take batches
+        """
+        if "batch" not in client.caps:
+            for stamp, msgid, line in stamped:
+                self._send_to(client, line, stamp, msgid=msgid)
+            return
+        self.batches += 1
+        reference = "b{}".format(self.batches)
+        self._send(client.sock, ":{} BATCH +{} {}".format(self.name_, 
+                                                           reference, kind))
+        for stamp, msgid, line in stamped:
+            self._send_to(client, line, stamp, reference, msgid)
+        self._send(client.sock, ":{} BATCH -{}".format(self.name_, 
+                                                        reference))
+        
+    def _netsplit(self, nicks, servers):
+        split = [client for client in self.clients.values() 
+                 if client.nick in nicks]
+        now = server_time(self.clock())
+        quits = [(now, None, ":{} QUIT :{}".format(client.prefix, servers))
+                 for client in split]
+        witnesses = set()
+        for client in split:
+            for chan_name in client.channels:
+                witnesses.update(self.channels.get(chan_name, ()))
+        for client in split:
+            self._close(client.sock)
+        for client in witnesses.difference(split):
+            self._batch(client, "netsplit " + servers, quits)
+            
+    def _send_to(self, client, line, stamp=None, batch=None, msgid=None):
+        """Sends a line to a client with whichever of the time, msgid and
+        batch tags it has asked for
+        """
+        tags = []
+        if batch is not None:
+            tags.append("batch=" + batch)
+        if stamp is not None and "server-time" in client.caps:
+            tags.append("time=" + stamp)
+        if msgid is not None and "message-tags" in client.caps:
+            tags.append("msgid=" + msgid)
+        if tags:
+            line = "@{} {}".format(";".join(tags), line)
+        self._send(client.sock, line)
+            
+    def _join(self, client, chan_name):
+        members = self.channels.setdefault(chan_name.lower(), set())
+        members.add(client)
+        client.channels.add(chan_name.lower())
+        self._to_channel(chan_name, ":{} JOIN {}".format(client.prefix, 
+                                                        chan_name))
+        self._names(client, chan_name)
+        
+    def _part(self, client, chan_name, text):
+        members = self.channels.get(chan_name.lower(), set())
+        if client not in members:
+            return
+        self._to_channel(chan_name, ":{} PART {} :{}".format(
+            client.prefix, chan_name, text))
+        members.discard(client)
+        client.channels.discard(chan_name.lower())
+        if not members:
+            del self.channels[chan_name.lower()]
+            
+    def _names(self, client, chan_name):
+        members = self.channels.get(chan_name.lower(), ())
+        names = " ".join(member.nick for member in members)
+        self._send(client.sock, ":{} 353 {} = {} :{}".format(
+            self.name_, client.nick, chan_name, names))
+        self._send(client.sock, ":{} 366 {} {} :End of /NAMES list.".format(
+            self.name_, client.nick, chan_name))
+        
+    def _relay(self, client, command, target, text):
+        line = ":{} {} {} :{}".format(client.prefix, command, target, text)
+        stamp = server_time(self.clock())
+        self.msgids += 1
+        msgid = "m{}".format(self.msgids)
+        if target.lower() in self.channels:
+            self.history.setdefault(target.lower(), []).append(
+                (stamp, msgid, line))
+            self._to_channel(target, line, skip=client, stamp=stamp, 
+                             msgid=msgid)
+        else:
+            for other in list(self.clients.values()):
+                if other.nick and other.nick.lower() == target.lower():
+                    self._send_to(other, line, stamp, msgid=msgid)
+                    
+    def _bench(self, client, count, rate=0):
+        self.feeds[client.sock] = Feed(
+            (":loadgen!bench@127.0.0.1 PRIVMSG #bench :{} {{time}}".format(i)
+             for i in range(int(count))),
+            float(rate))
+        
+    def _to_channel(self, chan_name, line, skip=None, stamp=None, 
+                    msgid=None):
+        for member in list(self.channels.get(chan_name.lower(), ())):
+            if member is not skip:
+                self._send_to(member, line, stamp, msgid=msgid)
+            
+    def _send(self, sock, line, raw=False):
+        if not raw:
+            line += "\r\n"
+        try:
+            sock.sendall(line.encode("utf-8"))
+        except socket.error:
+            self._close(sock)
+            
+    def _close(self, sock):
+        client = self.clients.pop(sock, None)
+        self.feeds.pop(sock, None)
+        if client is not None:
+            for chan_name in client.channels:
+                members = self.channels.get(chan_name)
+                if members is not None:
+                    members.discard(client)
+                    if not members:
+                        del self.channels[chan_name]
+        with closing(sock):
+            pass
+            
+            
+def tls_context(certfile=CERTFILE):
+    """A server-side context presenting certfile's certificate (by default
+    the self-signed one for localhost beside this file)
+    """
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile)
+    return context
+    
+    
+def main():
+    parser = argparse.ArgumentParser(description="Loopback-only fake ircd")
+    parser.add_argument("--host", default="127.0.0.1", choices=LOOPBACK)
+    parser.add_argument("--port", type=int, default=6667)
+    parser.add_argument("--replay", metavar="FILE",
+                        help="raw lines to send every client that registers")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="lines a second to replay at (0 is flat out)")
+    parser.add_argument("--caps", nargs="*", default=(), choices=CAPS,
+                        help="IRCv3 capabilities to offer")
+    parser.add_argument("--tls", nargs="?", const=CERTFILE, metavar="PEM",
+                        help="speak TLS with this key and certificate "
+                             "(default: the one for localhost beside this "
+                             "file)")
+    args = parser.parse_args()
+    
+    replay = None
+    if args.replay:
+        with open(args.replay) as f:
+            replay = [line.rstrip("\r\n") for line in f if line.strip()]
+    ircd = FakeIRCd(args.host, args.port, replay=replay, rate=args.rate,
+                    caps=args.caps, 
+                    tls=tls_context(args.tls) if args.tls else None)
+    ircd.start()
+    print("Listening on {}:{}".format(args.host, ircd.port))
+    try:
+        while ircd.is_alive():
+            ircd.join(1)
+    except KeyboardInterrupt:
+        ircd.stop()
+        
+        
+if __name__ == "__main__":
+    main()
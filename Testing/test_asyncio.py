@@ -0,0 +1,207 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import sys
+import unittest
+
+if sys.version_info < (3, 5):
+    raise unittest.SkipTest("IRC_asyncio needs Python 3.5 or later")
+
+import asyncio
+
+import IRC_asyncio as IRC
+from IRC_tls import TLS
+from Testing.fake_ircd import CERTFILE, tls_context
+
+
+class Echo(asyncio.Protocol):
+    """Just echos the message back to whoever sent it"""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        if b"Done" in data:
+            self.transport.close()
+        else:
+            self.transport.write(data)
+
+
+class test_asyncio(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.run_(self.loop.create_server(Echo, '127.0.0.1', 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.IRC_ = IRC.IRC_member("Nickname")
+        self.tls_servers = []
+
+    def tearDown(self):
+        self.run_(self.IRC_.close())
+        for server in [self.server] + self.tls_servers:
+            server.close()
+            self.run_(server.wait_closed())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def replies(self, count):
+        """Waits until at least count replies have come back"""
+        while len(self.IRC_.replies.get('localhost', [])) < count:
+            self.IRC_.replied.clear()
+            self.run_(asyncio.wait_for(self.IRC_.replied.wait(), 5))
+        return self.IRC_.replies['localhost'][:]
+
+    def test_join_server(self):
+        self.assertEqual(self.run_(self.IRC_.join_server('localhost',
+                                                         self.port)),
+                         0)
+        self.assertEqual(self.replies(2),
+                         ['NICK Nickname',
+                          'USER Nickname 0 * :Nickname'])
+
+    def test_join_server2(self):
+        self.run_(self.IRC_.join_server('localhost', self.port,
+                                        nick="Nick", ident="Ident",
+                                        realname="Realname"))
+        self.assertEqual(self.IRC_.serv_to_data['localhost'],
+                         {'nick': 'Nick', 'ident': 'Ident',
+                          'realname': 'Realname'})
+        self.assertEqual(self.replies(1)[0], 'NICK Nick')
+
+    def test_join_server_refused(self):
+        port = self.port
+        self.server.close()
+        self.run_(self.server.wait_closed())
+        self.assertEqual(self.run_(self.IRC_.join_server('localhost', port)),
+                         2)
+
+    def tls_server(self):
+        server = self.run_(self.loop.create_server(Echo, '127.0.0.1', 0,
+                                                   ssl=tls_context()))
+        self.tls_servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    def test_join_server_tls(self):
+        self.assertEqual(self.run_(self.IRC_.join_server(
+            'localhost', self.tls_server(), tls=TLS(cafile=CERTFILE))), 0)
+        self.assertEqual(self.replies(2),
+                         ['NICK Nickname',
+                          'USER Nickname 0 * :Nickname'])
+
+    def test_join_server_untrusted(self):
+        self.assertEqual(self.run_(self.IRC_.join_server(
+            'localhost', self.tls_server(), tls=TLS())), 2)
+        self.assertEqual(self.IRC_.servers, {})
+
+    def test_leave_server(self):
+        self.run_(self.IRC_.join_server('localhost', self.port))
+        self.assertEqual(self.run_(self.IRC_.leave_server('localhost')), 0)
+        self.assertEqual(self.IRC_.servers, {})
+
+    def test_server_disconnects(self):
+        self.run_(self.IRC_.join_server('localhost', self.port))
+        self.run_(self.IRC_.join_channel('localhost', '#tchannel'))
+        reader = self.IRC_.readers['localhost']
+        self.run_(self.IRC_.send_server_message('localhost', 'Done'))
+        self.run_(asyncio.wait_for(reader, 5))
+        self.assertEqual(self.IRC_.servers, {})
+        self.assertEqual(self.IRC_.readers, {})
+        self.assertEqual(self.IRC_.serv_to_chan, {})
+
+    def test_join_and_leave_channel(self):
+        self.run_(self.IRC_.join_server('localhost', self.port))
+        self.assertEqual(self.run_(self.IRC_.join_channel('localhost',
+                                                          '#tchannel')),
+                         0)
+        self.assertEqual(self.run_(self.IRC_.leave_channel('localhost',
+                                                           '#tchannel')),
+                         0)
+        self.assertEqual(self.IRC_.serv_to_chan['localhost'], [])
+
+    def test_send_channel_message(self):
+        self.run_(self.IRC_.join_server('localhost', self.port))
+        self.assertEqual(self.run_(self.IRC_.send_channel_message(
+            'localhost', '#tchannel', 'anything')), 2)
+        self.run_(self.IRC_.join_channel('localhost', '#tchannel'))
+        self.assertEqual(self.run_(self.IRC_.send_channel_message(
+            'localhost', '#tchannel', 'anything')), 0)
+        self.assertEqual(self.replies(4)[-1], 'PRIVMSG #tchannel :anything')
+
+    def test_send_privmsg(self):
+        self.assertEqual(self.run_(self.IRC_.send_privmsg(
+            'localhost', 'some_user', 'anything')), 1)
+
+    def test_ping_is_answered(self):
+        self.run_(self.IRC_.join_server('localhost', self.port))
+        self.run_(self.IRC_.send_server_message('localhost',
+                                                'PING :hello world'))
+        self.assertEqual(self.replies(3)[-1], 'PONG :hello world')
+
+    def test_bare_ping_is_answered(self):
+        self.run_(self.IRC_.join_server('localhost', self.port))
+        self.run_(self.IRC_.send_server_message('localhost', 'PING'))
+        self.assertEqual(self.replies(3)[-1], 'PONG :')
+
+    def test_messages(self):
+        stream = self.IRC_.messages(command='PRIVMSG', channel='#a')
+        self.run_(self.IRC_.join_server('localhost', self.port))
+        for line in ['PRIVMSG #b :no', 'PRIVMSG #a :yes', 'NOTICE #a :no']:
+            self.run_(self.IRC_.send_server_message('localhost', line))
+        hostname, message = self.run_(asyncio.wait_for(stream.__anext__(), 
+                                                       5))
+        self.assertEqual((hostname, message.params), 
+                         ('localhost', ['#a', 'yes']))
+        stream.close()
+        self.assertRaises(StopAsyncIteration, self.run_, stream.__anext__())
+        self.assertNotIn('localhost', self.IRC_.replies)
+
+    def test_member_made_before_the_loop(self):
+        early = asyncio.new_event_loop()
+        asyncio.set_event_loop(early)
+        member = IRC.IRC_member("Early")
+        asyncio.set_event_loop(self.loop)
+        early.close()
+        try:
+            self.run_(member.join_server('localhost', self.port))
+            self.assertEqual(self.run_(member.receive_all_messages()), 0)
+            self.assertIn('localhost', member.cursors)
+        finally:
+            self.run_(member.close())
+
+    def test_many_servers(self):
+        hosts = ['localhost', '127.0.0.1']
+        results = self.run_(asyncio.gather(
+            *[self.IRC_.join_server(host, self.port) for host in hosts]))
+        self.assertEqual(results, [0, 0])
+        self.assertEqual(sorted(self.IRC_.servers), sorted(hosts))
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_asyncio)
+    unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
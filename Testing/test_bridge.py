@@ -0,0 +1,144 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import sys
+import time
+import unittest
+
+from testfixtures import LogCapture
+
+from IRC_bridge import Bridge, EventQueue
+import IRC_sockselect as IRC
+from Testing.fake_ircd import FakeIRCd
+
+
+class test_EventQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.queue = EventQueue(maxsize=2, clock=lambda: self.now)
+        
+    def test_full_queue_drops_messages_only(self):
+        for i in range(3):
+            self.queue.put(("message", "a", None, i))
+        self.assertTrue(self.queue.put(("join", "a", "#b", "c")))
+        self.assertEqual(len(self.queue), 3)
+        self.assertEqual(self.queue.dropped, 1)
+        
+    def test_drain_stops_at_budget(self):
+        self.queue.put(("join", "a", "#b", "c"))
+        self.queue.put(("join", "a", "#b", "d"))
+        seen = []
+        
+        def handler(event):
+            seen.append(event[3])
+            self.now += .01
+        self.assertEqual(self.queue.drain(handler, .005), 1)
+        self.assertEqual(self.queue.drain(handler, .005), 1)
+        self.assertEqual(seen, ["c", "d"])
+        self.assertEqual(self.queue.drain(handler, .005), 0)
+        
+        
+class test_Bridge(unittest.TestCase):
+
+    def setUp(self):
+        self.log_capture = LogCapture()
+        self.ircd = FakeIRCd()
+        self.ircd.start()
+        self.hostname = "127.0.0.1"
+        self.member = IRC.IRC_member("Nickname")
+        self.bridge = Bridge(self.member, timeout=.01)
+        self.bridge.start()
+        self.events = []
+        
+    def tearDown(self):
+        self.bridge.close()
+        self.ircd.stop()
+        self.log_capture.uninstall()
+        
+    def wait_for(self, kind, timeout=5):
+        deadline = time.time() + timeout
+        while True:
+            self.bridge.drain(self.events.append)
+            for event in self.events:
+                if event[0] == kind:
+                    return event
+            self.assertLess(time.time(), deadline, "timed out")
+            time.sleep(.01)
+            
+    def test_events(self):
+        self.bridge.call(self.member.join_server, self.hostname, 
+                         self.ircd.port)
+        self.assertEqual(self.wait_for("connected")[1], self.hostname)
+        self.bridge.call(self.member.join_channel, self.hostname, "#chan")
+        self.assertEqual(self.wait_for("join")[2:], ("#chan", "Nickname"))
+        self.assertEqual(self.wait_for("names")[2:], ("#chan", ["Nickname"]))
+        
+        other = IRC.IRC_member("Other")
+        other.join_server(self.hostname, self.ircd.port)
+        try:
+            other.join_channel(self.hostname, "#chan")
+            other.send_channel_message(self.hostname, "#chan", "hi there")
+            other.poll(.1)
+            deadline = time.time() + 5
+            while not [event for event in self.events 
+                       if event[0] == "message" and event[2] == "#chan"]:
+                self.assertLess(time.time(), deadline, "timed out")
+                self.bridge.drain(self.events.append)
+                time.sleep(.01)
+        finally:
+            other.leave_server(self.hostname)
+        messages = [event[3] for event in self.events
+                    if event[0] == "message" and event[2] == "#chan"]
+        self.assertEqual(messages[0].params, ["#chan", "hi there"])
+        self.assertIn(("join", self.hostname, "#chan", "Other"), self.events)
+        self.assertEqual(self.member.replies, {})
+        
+        self.bridge.call(self.member.leave_server, self.hostname)
+        self.assertEqual(self.wait_for("closed")[1], self.hostname)
+        
+    def test_call_errors_are_logged(self):
+        self.bridge.call(self.member.join_channel, "nowhere")
+        self.bridge.call(self.member.join_server, self.hostname, 
+                         self.ircd.port)
+        self.wait_for("connected")
+        self.assertIn("IRC_bridge ERROR", str(self.log_capture))
+        
+    def test_poll_errors_are_reported(self):
+        poll = self.member.poll
+        def fail(timeout):
+            self.member.poll = poll
+            raise ValueError("bad line")
+        self.member.poll = fail
+        self.assertEqual(str(self.wait_for("error")[3]), "bad line")
+        self.bridge.call(self.member.join_server, self.hostname, 
+                         self.ircd.port)
+        self.wait_for("connected")
+        
+        
+if __name__ == '__main__':
+    for case in (test_EventQueue, test_Bridge):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -0,0 +1,167 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import itertools
+import sys
+import unittest
+
+from testfixtures import LogCapture
+
+from IRC_cap import Capabilities
+from IRC_sendqueue import SendQueue, TokenBucket
+import IRC_sockselect as IRC
+from Testing.fake_ircd import CAPS, FakeIRCd
+from Testing.polling import run_until
+
+
+class test_Capabilities(unittest.TestCase):
+
+    def setUp(self):
+        self.log_capture = LogCapture()
+        self.ircd = FakeIRCd(caps=CAPS)
+        self.ircd.start()
+        self.hostname = "127.0.0.1"
+        self.IRC_ = IRC.IRC_member("Nickname")
+        self.caps = Capabilities(self.IRC_)
+        self.others = []
+        
+    def tearDown(self):
+        for member in [self.IRC_] + self.others:
+            member.leave_server(self.hostname)
+        self.ircd.stop()
+        self.log_capture.uninstall()
+        
+    def connect(self, member):
+        ## CAP takes two more lines out of the burst flood control allows
+        member.send_queues[self.hostname] = SendQueue(TokenBucket(.01))
+        self.assertEqual(member.join_server(self.hostname, self.ircd.port), 0)
+        run_until([self.IRC_] + self.others,
+                  lambda: self.hostname in member.serv_to_isupport)
+        
+    def join(self, member, chan_name="#chan"):
+        member.join_channel(self.hostname, chan_name)
+        run_until([self.IRC_] + self.others,
+                  lambda: chan_name in member.serv_to_chan[self.hostname])
+        
+    def said(self):
+        return [line for line in self.IRC_.replies.get(self.hostname, [])
+                if " PRIVMSG " in line]
+        
+    def test_negotiation(self):
+        self.connect(self.IRC_)
+        self.assertEqual(self.ircd.lines(), 
+                         ["CAP LS 302", "NICK Nickname", 
+                          "USER Nickname 0 * :Nickname",
+                          "CAP REQ :batch draft/chathistory message-tags "
+                          "server-time",
+                          "CAP END"])
+        self.assertEqual(self.caps.enabled[self.hostname], set(CAPS))
+        self.assertEqual(sorted(self.caps.offered[self.hostname]), 
+                         sorted(CAPS))
+        self.assertEqual(self.caps.negotiating, {})
+        
+    def test_server_without_cap(self):
+        self.ircd.caps = ()
+        self.connect(self.IRC_)
+        self.assertNotIn("CAP END", self.ircd.lines())
+        self.assertEqual(self.caps.enabled[self.hostname], set())
+        self.assertEqual(self.caps.history(self.hostname, "#chan"), 1)
+        
+    def catch_up(self):
+        """Says "first", misses "second" and "third" while out of #chan,
+        and catches up on joining again
+        """
+        other = IRC.IRC_member("Other")
+        self.others.append(other)
+        for member in (self.IRC_, other):
+            self.connect(member)
+            self.join(member)
+        other.send_channel_message(self.hostname, "#chan", "first")
+        run_until([self.IRC_] + self.others, lambda: self.said())
+        self.assertIn("#chan", self.caps.last_time[self.hostname])
+        
+        self.IRC_.leave_channel(self.hostname, "#chan")
+        ## The ircd reads its clients in no particular order, so the PART
+        ## has to be in before anything is said
+        run_until([self.IRC_] + self.others, lambda: self.ircd.lines("PART"))
+        other.send_channel_message(self.hostname, "#chan", "second")
+        other.send_channel_message(self.hostname, "#chan", "third")
+        run_until([self.IRC_] + self.others,
+                  lambda: "PRIVMSG #chan :third" in self.ircd.lines())
+        self.join(self.IRC_)
+        run_until([self.IRC_] + self.others, lambda: self.ircd.batches)
+        run_until([self.IRC_] + self.others, 
+                  lambda: self.said()[-1].endswith(":third"))
+        self.assertEqual([line.rsplit(":", 1)[1] for line in self.said()],
+                         ["first", "second", "third"])
+        self.assertTrue(self.said()[1].startswith("@batch="))
+        return self.ircd.lines("CHATHISTORY")
+        
+    def test_catch_up_after_last_seen(self):
+        times = itertools.count(1400000000)
+        self.ircd.clock = lambda: next(times)
+        self.assertEqual(self.catch_up(), 
+                         ["CHATHISTORY AFTER #chan msgid=m1 50"])
+        
+    def test_catch_up_in_the_same_millisecond(self):
+        self.ircd.clock = lambda: 1400000000.25
+        self.assertEqual(self.catch_up(), 
+                         ["CHATHISTORY AFTER #chan msgid=m1 50"])
+        
+    def test_catch_up_by_timestamp(self):
+        ## Without message-tags, nothing comes with a msgid
+        self.ircd.caps = ("batch", "draft/chathistory", "server-time")
+        self.ircd.clock = lambda: 1400000000.25
+        self.assertEqual(self.catch_up(), 
+                         ["CHATHISTORY AFTER #chan "
+                          "timestamp=2014-05-13T16:53:20.249Z 50"])
+        
+    def test_netsplit_batch(self):
+        for nick in ("Split1", "Split2", "Stays"):
+            member = IRC.IRC_member(nick)
+            self.others.append(member)
+        for member in [self.IRC_] + self.others:
+            self.connect(member)
+            self.join(member)
+        state = self.IRC_.serv_to_state[self.hostname]
+        run_until([self.IRC_] + self.others,
+                  lambda: len(state.channel("#chan").members) == 4)
+        
+        self.ircd.netsplit(["Split1", "Split2"])
+        run_until([self.IRC_] + self.others,
+                  lambda: len(state.channel("#chan").members) == 2)
+        self.assertEqual(sorted(state.channel("#chan").members), 
+                         ["nickname", "stays"])
+        self.assertFalse(state.has_user("split1"))
+        quits = [line for line in self.IRC_.replies[self.hostname]
+                 if " QUIT " in line]
+        self.assertEqual(len(quits), 2)
+        self.assertEqual(self.IRC_.batches, {})
+        self.others = self.others[2:]
+        
+        
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_Capabilities)
+    unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -0,0 +1,102 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import socket
+import sys
+import time
+import unittest
+
+from Testing.fake_ircd import FakeIRCd
+
+
+class test_FakeIRCd(unittest.TestCase):
+
+    def setUp(self):
+        self.ircd = FakeIRCd(replay=[":a!b@c PRIVMSG #x :{time}"] * 3)
+        self.ircd.start()
+        self.socks = []
+        
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+        self.ircd.stop()
+        
+    def connect(self, nick):
+        sock = socket.create_connection(("127.0.0.1", self.ircd.port), 5)
+        self.socks.append(sock)
+        sock.sendall("NICK {0}\r\nUSER {0} {0} 0 :{0}\r\n".format(
+            nick).encode("utf-8"))
+        self.read_until(sock, " 001 ")
+        return sock
+        
+    def read_until(self, sock, text):
+        data = b""
+        while text.encode("utf-8") not in data:
+            chunk = sock.recv(4096)
+            self.assertTrue(chunk)
+            data += chunk
+        return data.decode("utf-8")
+        
+    def test_loopback_only(self):
+        self.assertRaises(ValueError, FakeIRCd, "0.0.0.0")
+        
+    def test_replay(self):
+        sock = socket.create_connection(("127.0.0.1", self.ircd.port), 5)
+        self.socks.append(sock)
+        sock.sendall(b"NICK a\r\nUSER a a 0 :a\r\n")
+        data = self.read_until(sock, " 001 ")
+        while data.count("PRIVMSG") < 3:
+            data += self.read_until(sock, "\n")
+        stamp = float(data.strip().splitlines()[-1].rsplit(":", 1)[1])
+        self.assertAlmostEqual(stamp, time.time(), delta=5)
+        
+    def test_names_and_relay(self):
+        first = self.connect("first")
+        second = self.connect("second")
+        first.sendall(b"JOIN #chan\r\n")
+        self.read_until(first, " 366 first #chan ")
+        second.sendall(b"JOIN #chan\r\n")
+        self.assertIn(":second!second@127.0.0.1 JOIN #chan", 
+                      self.read_until(first, "JOIN"))
+        names = self.read_until(second, " 366 ")
+        self.assertIn(" 353 second = #chan :", names)
+        self.assertEqual(
+            sorted(names.split(" 353 second = #chan :")[1].split("\r\n")[0]
+                   .split()), ["first", "second"])
+        
+        second.sendall(b"PRIVMSG #chan :hello\r\nPRIVMSG first :psst\r\n")
+        self.assertIn(":second!second@127.0.0.1 PRIVMSG first :psst",
+                      self.read_until(first, "psst"))
+        
+    def test_bench(self):
+        sock = self.connect("a")
+        sock.sendall(b"BENCH 50\r\n")
+        data = self.read_until(sock, ":49 ")
+        self.assertEqual(data.count("PRIVMSG #bench"), 50)
+        
+        
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_FakeIRCd)
+    unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -0,0 +1,84 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+from contextlib import closing
+import socket
+import sys
+import unittest
+
+from IRC_framing import LineFramer
+
+
+class test_LineFramer(unittest.TestCase):
+
+    def setUp(self):
+        self.framer = LineFramer(size=16)
+
+    def test_complete_lines(self):
+        self.framer.feed(b"PING :a\r\nJOIN #b\r\n")
+        self.assertEqual(list(self.framer.lines()), [b"PING :a", b"JOIN #b"])
+        self.assertEqual(len(self.framer), 0)
+
+    def test_partial_line_carried_over(self):
+        self.framer.feed(b"PRIVMSG #chan :hel")
+        self.assertEqual(list(self.framer.lines()), [])
+        self.framer.feed(b"lo\r\nNICK a")
+        self.assertEqual(list(self.framer.lines()),
+                         [b"PRIVMSG #chan :hello"])
+        self.framer.feed(b"\r\n")
+        self.assertEqual(list(self.framer.lines()), [b"NICK a"])
+
+    def test_split_line_ending(self):
+        self.framer.feed(b"QUIT\r")
+        self.assertEqual(list(self.framer.lines()), [])
+        self.framer.feed(b"\n")
+        self.assertEqual(list(self.framer.lines()), [b"QUIT"])
+
+    def test_bare_newline(self):
+        self.framer.feed(b"a\nb\n")
+        self.assertEqual(list(self.framer.lines()), [b"a", b"b"])
+
+    def test_line_longer_than_buffer(self):
+        line = b"PRIVMSG #chan :" + b"x" * 100
+        for i in range(0, len(line), 7):
+            self.framer.feed(line[i:i + 7])
+            self.assertEqual(list(self.framer.lines()), [])
+        self.framer.feed(b"\r\n")
+        self.assertEqual(list(self.framer.lines()), [line])
+
+    def test_recv_into(self):
+        left, right = socket.socketpair()
+        with closing(left), closing(right):
+            right.sendall(b"NICK a\r\nUSER")
+            self.assertEqual(self.framer.recv_into(left, 64), 12)
+            self.assertEqual(list(self.framer.lines()), [b"NICK a"])
+            right.close()
+            self.assertEqual(self.framer.recv_into(left, 64), 0)
+            self.assertEqual(len(self.framer), 4)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_LineFramer)
+    unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
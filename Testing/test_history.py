@@ -0,0 +1,134 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from IRC_history import Archive, ChannelLog
+from IRC_message import Dispatcher, parse
+
+
+class test_ChannelLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "server", "%23chan")
+        self.log = ChannelLog(self.path, index_every=64)
+        for i in range(100):
+            self.log.append("line {}".format(i), 1000.0 + i)
+            
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.directory)
+        
+    def test_read_all(self):
+        lines = list(self.log.read())
+        self.assertEqual(len(lines), 100)
+        self.assertEqual(lines[0], (1000.0, b"line 0"))
+        
+    def test_read_range(self):
+        self.assertEqual([line for _, line in self.log.read(1050, 1052)],
+                         [b"line 50", b"line 51", b"line 52"])
+        self.assertEqual(list(self.log.read(2000)), [])
+        
+    def test_index_is_sparse(self):
+        self.log.flush()
+        entries = os.path.getsize(self.path + ".idx") // ChannelLog.INDEX.size
+        self.assertTrue(1 < entries < 100)
+        
+    def test_late_lines_keep_their_time(self):
+        self.log.append("late", 1050.5)
+        self.log.append("line 100", 1100)
+        self.assertEqual(list(self.log.read(1050, 1051)),
+                         [(1050.0, b"line 50"), (1051.0, b"line 51"), 
+                          (1050.5, b"late")])
+        self.assertEqual([line for _, line in self.log.read(1099)],
+                         [b"line 99", b"line 100"])
+        self.log.close()
+        self.log = ChannelLog(self.path, index_every=64)
+        self.log.append("late again", 1000.5)
+        self.assertEqual([line for _, line in self.log.read(1000, 1000.5)],
+                         [b"line 0", b"late again"])
+        
+    def test_record(self):
+        offset = self.log.append("line 100", 1100)
+        self.assertEqual(self.log.record(0), (1000.0, b"line 0"))
+        self.assertEqual(self.log.record(offset), (1100.0, b"line 100"))
+        view = self.log.view
+        self.log.record(0)
+        self.assertTrue(self.log.view is view)
+        
+    def test_reopen(self):
+        self.log.close()
+        self.log = ChannelLog(self.path, index_every=64)
+        self.log.append("line 100", 1100)
+        self.assertEqual(len(list(self.log.read())), 101)
+        
+    def test_recovers_from_torn_write(self):
+        self.log.close()
+        with open(self.path, "ab") as f:
+            f.write(ChannelLog.HEADER.pack(1100, 50) + b"cut off")
+        self.log = ChannelLog(self.path, index_every=64)
+        self.assertEqual(len(list(self.log.read())), 100)
+        self.log.append("line 100", 1100)
+        self.assertEqual(list(self.log.read(1100)), [(1100.0, b"line 100")])
+        
+        
+class test_Archive(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.archive = Archive(self.directory)
+        
+    def tearDown(self):
+        self.archive.close()
+        shutil.rmtree(self.directory)
+        
+    def test_attach(self):
+        class Member(object):
+            dispatcher = Dispatcher()
+        Archive.attach(self.archive, Member)
+        for line in [":a!u@h PRIVMSG #Chan :hello",
+                     ":a!u@h PRIVMSG Me :psst",
+                     ":srv 001 Me :Welcome"]:
+            Member.dispatcher.dispatch("server", parse(line))
+        self.assertEqual([line for _, line in 
+                          self.archive.read("server", "#chan")],
+                         [b":a!u@h PRIVMSG #Chan hello"])
+        self.assertEqual([line for _, line in self.archive.read("server", 
+                                                                "A")],
+                         [b":a!u@h PRIVMSG Me psst"])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, 
+                                                        "server"))),
+                         ["%23chan", "%23chan.idx", "a", "a.idx"])
+
+
+if __name__ == '__main__':
+    for case in (test_ChannelLog, test_Archive):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
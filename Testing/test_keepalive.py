@@ -0,0 +1,76 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import sys
+import unittest
+
+from testfixtures import LogCapture
+
+import IRC_sockselect as IRC
+from IRC_keepalive import Keepalive
+from Testing.fake_ircd import FakeIRCd
+from Testing.polling import run_until
+
+
+class test_Keepalive(unittest.TestCase):
+
+    def setUp(self):
+        self.log_capture = LogCapture()
+        self.ircd = FakeIRCd()
+        self.ircd.start()
+        self.IRC_ = IRC.IRC_member("Nickname")
+        self.hostname = "127.0.0.1"
+        self.keepalive = Keepalive(self.IRC_, interval=.1, threshold=.3)
+        self.assertEqual(self.IRC_.join_server(self.hostname, self.ircd.port), 
+                         0)
+        
+    def tearDown(self):
+        self.IRC_.leave_server(self.hostname)
+        self.ircd.stop()
+        self.log_capture.uninstall()
+        
+    def test_measures_lag(self):
+        run_until(self.IRC_, 
+                  lambda: self.keepalive.stats(self.hostname)["pings"] >= 3)
+        stats = self.keepalive.stats(self.hostname)
+        self.assertLess(stats["max"], .3)
+        self.assertLessEqual(stats["p50"], stats["p99"])
+        self.assertTrue(all(line.startswith("PING :lag-") 
+                            for line in self.ircd.lines("PING")))
+        self.assertNotIn("PONG", " ".join(self.IRC_.replies.get(
+            self.hostname, [])))
+        
+    def test_slow_server_is_dropped(self):
+        run_until(self.IRC_,
+                  lambda: self.keepalive.stats(self.hostname)["pings"])
+        self.ircd.silent = True
+        run_until(self.IRC_, lambda: self.hostname not in self.IRC_.servers)
+        self.assertEqual(self.keepalive.timers, {})
+        self.assertEqual(len(self.IRC_.scheduler), 0)
+        
+        
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_Keepalive)
+    unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -0,0 +1,85 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import IRC_logging
+
+
+class test_logging(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = logging.getLogger("test_logging")
+        self.log.propagate = False
+        
+    def tearDown(self):
+        IRC_logging.shutdown()
+        shutil.rmtree(self.directory)
+        
+    def read(self, filename):
+        with open(filename) as f:
+            return f.read()
+            
+    def test_configure_writes_through_queue(self):
+        filename = os.path.join(self.directory, "Logs", "test.log")
+        IRC_logging.configure(filename, logger="test_logging")
+        self.log.info("joined %s", "#a")
+        self.log.debug("not %s", "written")
+        IRC_logging.shutdown()
+        self.assertEqual(self.read(filename), 
+                         "INFO:test_logging:joined #a\n")
+        self.assertFalse(any(isinstance(handler, IRC_logging.QueueHandler)
+                             for handler in self.log.handlers))
+        
+    def test_args_merged_before_queueing(self):
+        filename = os.path.join(self.directory, "test.log")
+        IRC_logging.configure(filename, logger="test_logging")
+        args = ["before"]
+        self.log.warning("%s", args)
+        args[0] = "after"
+        IRC_logging.shutdown()
+        self.assertIn("before", self.read(filename))
+        
+    def test_default_filename(self):
+        self.assertTrue(IRC_logging.default_filename().startswith(
+            IRC_logging.LOG_DIR + os.sep))
+            
+    def test_import_configures_nothing(self):
+        import IRC_sockselect
+        self.assertTrue(any(isinstance(handler, logging.NullHandler)
+                            for handler in IRC_sockselect.log.handlers))
+        self.assertFalse(any(isinstance(handler, logging.FileHandler)
+                             for handler in logging.getLogger().handlers))
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_logging)
+    unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
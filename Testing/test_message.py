@@ -0,0 +1,253 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import sys
+import unittest
+
+import IRC_message as IRC
+
+
+class test_parse(unittest.TestCase):
+
+    def test_command_only(self):
+        self.assertEqual(IRC.parse("QUIT"), IRC.Message("QUIT"))
+
+    def test_prefix_and_trailing(self):
+        message = IRC.parse(":nick!ident@host PRIVMSG #chan :hello there")
+        self.assertEqual(message.prefix, "nick!ident@host")
+        self.assertEqual(message.nick, "nick")
+        self.assertEqual(message.command, "PRIVMSG")
+        self.assertEqual(message.params, ["#chan", "hello there"])
+
+    def test_numeric(self):
+        message = IRC.parse(":irc.server 001 Nickname :Welcome to IRC")
+        self.assertEqual(message.command, IRC.RPL_WELCOME)
+        self.assertEqual(message.nick, "irc.server")
+        self.assertEqual(message.params, ["Nickname", "Welcome to IRC"])
+
+    def test_empty_trailing(self):
+        self.assertEqual(IRC.parse("TOPIC #chan :").params, ["#chan", ""])
+
+    def test_extra_spaces(self):
+        self.assertEqual(IRC.parse("NICK   Nickname  ").params, ["Nickname"])
+
+    def test_lowercase_command(self):
+        self.assertEqual(IRC.parse("ping :x").command, "PING")
+
+    def test_blank(self):
+        self.assertIsNone(IRC.parse(""))
+        self.assertIsNone(IRC.parse("   "))
+
+    def test_tags(self):
+        message = IRC.parse("@time=2014-01-01T00:00:00Z;msgid=a\\sb\\:c;flag "
+                            ":nick PRIVMSG #chan :hi")
+        self.assertEqual(message.tags, {"time": "2014-01-01T00:00:00Z",
+                                        "msgid": "a b;c",
+                                        "flag": ""})
+        self.assertEqual(message.params, ["#chan", "hi"])
+
+    def test_server_time(self):
+        message = IRC.parse("@time=2014-01-01T00:00:01.250Z :nick QUIT")
+        self.assertEqual(message.time, 1388534401.25)
+        self.assertEqual(IRC.format_time(message.time), 
+                         "2014-01-01T00:00:01.250Z")
+        self.assertIsNone(IRC.parse(":nick QUIT").time)
+        self.assertIsNone(IRC.parse_time("yesterday"))
+
+    def test_tag_escapes(self):
+        self.assertEqual(IRC.unescape_tag("a\\\\b\\r\\n\\x\\"), "a\\b\r\nx")
+
+    def test_str_round_trip(self):
+        for line in ["PRIVMSG #chan :hello there",
+                     ":nick!i@h JOIN #chan",
+                     "@a=b :nick MODE #chan +o other",
+                     "TOPIC #chan :"]:
+            self.assertEqual(str(IRC.parse(line)), line)
+
+
+class test_decoding(unittest.TestCase):
+
+    def test_bytes_and_text_parse_alike(self):
+        line = u":nick!i@h PRIVMSG #chan :caf\u00e9"
+        self.assertEqual(IRC.parse(line.encode("utf-8")), IRC.parse(line))
+
+    def test_memoryview(self):
+        self.assertEqual(IRC.decode(memoryview(b"PING :x")), "PING :x")
+        self.assertEqual(IRC.parse(memoryview(b"PING :x")).params, ["x"])
+
+    @unittest.skipIf(bytes is str, "Python 2's str is bytes")
+    def test_fields_decoded_when_read(self):
+        message = IRC.parse(b":nick!i@h PRIVMSG #chan :caf\xc3\xa9")
+        self.assertEqual(message.command, "PRIVMSG")
+        self.assertEqual(message._params, [b"#chan", b"caf\xc3\xa9"])
+        self.assertEqual(message._prefix, b"nick!i@h")
+        self.assertEqual(message.params, ["#chan", u"caf\u00e9"])
+        self.assertIs(message.params, message._params)
+        self.assertEqual(message._prefix, b"nick!i@h")
+
+    @unittest.skipIf(bytes is str, "Python 2's str is bytes")
+    def test_fallbacks(self):
+        self.assertEqual(IRC.decode(b"caf\xc3\xa9"), u"caf\u00e9")
+        self.assertEqual(IRC.decode(b"caf\xe9 \x93hi\x94"), 
+                         u"caf\u00e9 \u201chi\u201d")
+        self.assertEqual(IRC.decode(b"\x81"), u"\x81")
+
+    def test_templates(self):
+        self.assertEqual(IRC.PRIVMSG.format("#chan", u"caf\u00e9"),
+                         b"PRIVMSG #chan :caf\xc3\xa9\r\n")
+        self.assertEqual(IRC.LINE.format(b"JOIN #chan"), b"JOIN #chan \r\n")
+        self.assertEqual(IRC.Template("PING :{}{}\r\n").format("x", 5),
+                         b"PING :x5\r\n")
+
+
+class test_format_lines(unittest.TestCase):
+
+    def test_short(self):
+        self.assertEqual(IRC.format_lines("PRIVMSG", ["#a"], "hi"),
+                         [b"PRIVMSG #a :hi\r\n"])
+
+    def test_split_at_limit(self):
+        prefix = len(":nick!~ident@host.example ")
+        lines = IRC.format_lines("PRIVMSG", ["#a"], "x" * 1200, prefix)
+        self.assertEqual(len(lines), 3)
+        for line in lines:
+            self.assertLessEqual(prefix + len(line), IRC.MAX_LINE)
+        self.assertEqual(prefix + len(lines[0]), IRC.MAX_LINE)
+        self.assertEqual(b"".join(line[len(b"PRIVMSG #a :"):-2] 
+                                  for line in lines), b"x" * 1200)
+
+    def test_split_at_space(self):
+        text = " ".join(["word"] * 200)
+        lines = IRC.format_lines("PRIVMSG", ["#a"], text)
+        for line in lines:
+            self.assertFalse(line.endswith(b" \r\n"))
+            self.assertTrue(line.endswith(b"word\r\n"))
+        self.assertEqual(b" ".join(line[len(b"PRIVMSG #a :"):-2]
+                                   for line in lines), text.encode("utf-8"))
+
+    def test_utf8_boundaries(self):
+        text = u"\u00e9" * 600
+        for line in IRC.format_lines("PRIVMSG", ["#a"], text, 50):
+            line[len(b"PRIVMSG #a :"):-2].decode("utf-8")
+
+    def test_newlines_are_separate_messages(self):
+        self.assertEqual(IRC.format_lines("PRIVMSG", ["#a"], "one\ntwo"),
+                         [b"PRIVMSG #a :one\r\n", b"PRIVMSG #a :two\r\n"])
+
+    def test_targmax(self):
+        lines = IRC.format_lines("PRIVMSG", ["#a", "#b", "#c"], "hi", 
+                                 targmax=2)
+        self.assertEqual(lines, [b"PRIVMSG #a,#b :hi\r\n", 
+                                 b"PRIVMSG #c :hi\r\n"])
+        lines = IRC.format_lines("PRIVMSG", ["#a", "#b", "#c"], "hi", 
+                                 targmax=None)
+        self.assertEqual(lines, [b"PRIVMSG #a,#b,#c :hi\r\n"])
+
+    def test_targets_leave_room_for_text(self):
+        targets = ["#" + "c" * 49 + str(i) for i in range(20)]
+        lines = IRC.format_lines("PRIVMSG", targets, "hi", 80, targmax=None)
+        self.assertGreater(len(lines), 1)
+        for line in lines:
+            self.assertLessEqual(80 + len(line) + IRC.MIN_TEXT, IRC.MAX_LINE)
+
+    def test_isupport(self):
+        isupport = IRC.parse_isupport(["me", "TARGMAX=PRIVMSG:4,JOIN:", 
+                                       "-EXCEPTS", "CHANTYPES=#", 
+                                       "are supported by this server"])
+        self.assertEqual(isupport, {"TARGMAX": "PRIVMSG:4,JOIN:", 
+                                    "EXCEPTS": None, "CHANTYPES": "#"})
+        self.assertEqual(IRC.max_targets(isupport, "PRIVMSG"), 4)
+        self.assertEqual(IRC.max_targets(isupport, "JOIN"), None)
+        self.assertEqual(IRC.max_targets(isupport, "NOTICE"), 1)
+        self.assertEqual(IRC.max_targets({"MAXTARGETS": "3"}, "PRIVMSG"), 3)
+        self.assertEqual(IRC.max_targets({}, "PRIVMSG"), 1)
+        self.assertEqual(IRC.max_targets({}, "JOIN", None), None)
+
+    def test_list_lines(self):
+        self.assertEqual(IRC.format_list_lines("JOIN", ["#a", "#b", "#c"],
+                                               {"#c": "key"}),
+                         [b"JOIN #c,#a,#b key\r\n"])
+        self.assertEqual(IRC.format_list_lines("PART", ["#a", "#b", "#c"],
+                                               targmax=2),
+                         [b"PART #a,#b\r\n", b"PART #c\r\n"])
+
+    def test_list_lines_fit(self):
+        names = ["#channel{}".format(i) for i in range(300)]
+        lines = IRC.format_list_lines("JOIN", names)
+        self.assertEqual(len(lines), 7)
+        for line in lines:
+            self.assertLessEqual(len(line), IRC.MAX_LINE)
+        self.assertEqual(b",".join(line[5:-2] for line in lines),
+                         ",".join(names).encode("utf-8"))
+
+
+class test_Dispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.seen = []
+        self.dispatcher = IRC.Dispatcher({"PING": self.consume,
+                                          "001": [self.observe, self.observe]})
+
+    def consume(self, hostname, message):
+        self.seen.append((hostname, message.command))
+        return True
+
+    def observe(self, hostname, message):
+        self.seen.append((hostname, message.command))
+
+    def test_consumed(self):
+        self.assertTrue(self.dispatcher.dispatch("host", IRC.Message("PING")))
+        self.assertEqual(self.seen, [("host", "PING")])
+
+    def test_observed(self):
+        self.assertFalse(self.dispatcher.dispatch("host", IRC.Message("001")))
+        self.assertEqual(self.seen, [("host", "001")] * 2)
+
+    def test_unrouted(self):
+        self.assertFalse(self.dispatcher.dispatch("host", IRC.Message("JOIN")))
+        self.assertEqual(self.seen, [])
+
+    def test_handler_errors(self):
+        def fail(hostname, message):
+            return message.params[-1]
+        self.dispatcher.register("PING", fail)
+        self.dispatcher.register("PING", self.observe)
+        self.assertTrue(self.dispatcher.dispatch("host", IRC.Message("PING")))
+        self.assertEqual(self.seen, [("host", "PING")] * 2)
+
+    def test_register_and_unregister(self):
+        self.dispatcher.register("join", self.consume)
+        self.assertTrue(self.dispatcher.dispatch("host", IRC.Message("JOIN")))
+        self.dispatcher.unregister("JOIN", self.consume)
+        self.assertNotIn("JOIN", self.dispatcher.table)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite(
+        [unittest.TestLoader().loadTestsFromTestCase(test_parse),
+         unittest.TestLoader().loadTestsFromTestCase(test_decoding),
+         unittest.TestLoader().loadTestsFromTestCase(test_format_lines),
+         unittest.TestLoader().loadTestsFromTestCase(test_Dispatcher)])
+    unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -0,0 +1,133 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import socket
+import sys
+import threading
+import time
+import unittest
+
+import IRC_sockselect as IRC
+from IRC_metrics import Histogram, Metrics, SamplingProfiler
+from IRC_sendqueue import SendQueue
+
+
+class test_Histogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = Histogram(bounds=(1, 2, 4, 8))
+        for value in [.5] * 50 + [3] * 49 + [100]:
+            histogram.add(value)
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.percentile(.5), 1)
+        self.assertEqual(histogram.percentile(.99), 4)
+        self.assertEqual(histogram.percentile(1), 100)
+        self.assertEqual((histogram.min, histogram.max), (.5, 100))
+        self.assertEqual(histogram.buckets()[-1], (float("inf"), 1))
+        
+    def test_empty(self):
+        self.assertEqual(Histogram().percentile(.5), None)
+        self.assertEqual(Histogram().mean, None)
+        
+        
+class test_Metrics(unittest.TestCase):
+
+    def setUp(self):
+        self.IRC_ = IRC.IRC_member("Nickname")
+        self.metrics = Metrics(sample_every=1)
+        self.metrics.attach(self.IRC_)
+        ours, self.theirs = socket.socketpair()
+        self.IRC_.servers["server"] = ours
+        self.IRC_.serv_to_chan["server"] = set()
+        self.IRC_._watch("server", ours)
+        
+    def tearDown(self):
+        self.metrics.profile(False)
+        self.IRC_._unwatch("server")
+        self.IRC_.servers.pop("server").close()
+        self.theirs.close()
+        
+    def test_counts_reads(self):
+        self.theirs.sendall(b"PING :a\r\n:x!u@h PRIVMSG #c :hi\r\nNOT")
+        self.IRC_.poll(1)
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["bytes_in_total"], 
+                         {"server": 35})
+        self.assertEqual(snapshot["counters"]["lines_in_total"], 
+                         {"server": 2})
+        self.assertEqual(snapshot["counters"]["lines_out_total"], 
+                         {"server": 1})
+        self.assertEqual(snapshot["gauges"]["send_queue_lines"], 
+                         {"server": 0})
+        histograms = snapshot["histograms"]
+        self.assertEqual(histograms["parse_seconds"]["server"]["count"], 2)
+        self.assertEqual(histograms["dispatch_seconds"]["server"]["count"], 
+                         2)
+        self.assertEqual(histograms["poll_wait_seconds"][None]["count"], 1)
+        self.assertEqual(histograms["poll_work_seconds"][None]["count"], 1)
+        
+    def test_out_counts_outlive_the_queue(self):
+        self.theirs.sendall(b"PING :a\r\n")
+        self.IRC_.poll(1)
+        ## As a reconnect would leave it
+        self.IRC_.send_queues["server"] = SendQueue()
+        self.assertEqual(self.metrics.snapshot()["counters"]["bytes_out_total"],
+                         {"server": len(b"PONG :a\r\n")})
+        
+    def test_sample_every_checked(self):
+        self.assertRaises(ValueError, Metrics, sample_every=0)
+        self.assertRaises(ValueError, SamplingProfiler, interval=0)
+        
+    def test_prometheus(self):
+        self.theirs.sendall(b"NOTICE * :hi\r\n")
+        self.IRC_.poll(1)
+        text = self.metrics.prometheus()
+        self.assertIn("# TYPE pyirc_bytes_in_total counter\n"
+                      'pyirc_bytes_in_total{server="server"} 14\n', text)
+        self.assertIn('pyirc_parse_seconds_bucket{server="server",le="+Inf"} '
+                      '1\n', text)
+        self.assertIn("pyirc_poll_wait_seconds_count 1\n", text)
+        
+    def test_profiler(self):
+        profiler = self.metrics.profile(interval=.001)
+        self.assertIs(self.metrics.profile(), profiler)
+        deadline = time.time() + 5
+        while not profiler.samples and time.time() < deadline:
+            sum(range(10000))
+        self.metrics.profile(False)
+        self.assertFalse(profiler.is_alive())
+        self.assertTrue(any("test_profiler" in line 
+                            for line in profiler.folded()))
+        
+    def test_lock_wait(self):
+        self.metrics.acquire(threading.Lock(), "server")
+        self.assertEqual(self.metrics.snapshot()["histograms"][
+                             "lock_wait_seconds"]["server"]["count"], 1)
+        
+        
+if __name__ == '__main__':
+    for case in (test_Histogram, test_Metrics):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -0,0 +1,175 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+from contextlib import closing
+import errno
+import socket
+import sys
+import time
+import unittest
+
+from IRC_resolver import Resolver, interleave
+
+
+class Clock(object):
+    
+    def __init__(self):
+        self.now = 1000.0
+        
+    def __call__(self):
+        return self.now
+        
+        
+def entry(family, address):
+    return family, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", address
+    
+    
+class test_Resolver(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.clock = Clock()
+        self.resolver = Resolver(ttl=60, negative_ttl=5, 
+                                 getaddrinfo=self.getaddrinfo, 
+                                 clock=self.clock)
+        self.answers = {}
+        
+    def tearDown(self):
+        self.resolver.close()
+        
+    def getaddrinfo(self, hostname, port, family, type_):
+        self.calls.append(hostname)
+        answer = self.answers.get(hostname)
+        if answer is None:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        if callable(answer):
+            return answer(port)
+        return answer
+        
+    def test_cached_until_ttl(self):
+        self.answers["irc"] = [entry(socket.AF_INET, ("127.0.0.1", 6667))]
+        self.resolver.resolve("irc", 6667)
+        self.resolver.resolve("irc", 6667)
+        self.assertEqual(self.calls, ["irc"])
+        self.clock.now += 61
+        self.resolver.resolve("irc", 6667)
+        self.assertEqual(self.calls, ["irc", "irc"])
+        
+    def test_failures_cached(self):
+        self.assertRaises(socket.gaierror, self.resolver.resolve, "nope", 1)
+        self.assertRaises(socket.gaierror, self.resolver.resolve, "nope", 1)
+        self.assertEqual(self.calls, ["nope"])
+        self.clock.now += 6
+        self.assertRaises(socket.gaierror, self.resolver.resolve, "nope", 1)
+        self.assertEqual(len(self.calls), 2)
+        
+    def test_forget(self):
+        self.answers["irc"] = []
+        self.resolver.resolve("irc", 1)
+        self.resolver.forget("irc")
+        self.resolver.resolve("irc", 1)
+        self.assertEqual(len(self.calls), 2)
+        
+    def test_resolve_async(self):
+        self.answers["irc"] = [entry(socket.AF_INET, ("127.0.0.1", 1))]
+        result = self.resolver.resolve_async("irc", 1)
+        self.assertEqual(result.get(5), self.answers["irc"])
+        
+    def test_interleave(self):
+        v4 = [entry(socket.AF_INET, ("10.0.0.{}".format(i), 1)) 
+              for i in range(3)]
+        v6 = [entry(socket.AF_INET6, ("::{}".format(i), 1, 0, 0)) 
+              for i in range(2)]
+        self.assertEqual(interleave(v4 + v6), 
+                         [v6[0], v4[0], v6[1], v4[1], v4[2]])
+        
+    def test_connect_falls_through_dead_address(self):
+        with closing(socket.socket()) as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen(1)
+            port = server.getsockname()[1]
+            with closing(socket.socket()) as dead:
+                ## Bound but not listening, so connecting is refused
+                dead.bind(("127.0.0.1", 0))
+                self.answers["irc"] = [
+                    entry(socket.AF_INET, dead.getsockname()),
+                    entry(socket.AF_INET, ("127.0.0.1", port))]
+                self.resolver.clock = time.time
+                with closing(self.resolver.connect("irc", port, 
+                                                   timeout=5)) as sock:
+                    self.assertEqual(sock.getpeername()[1], port)
+                    
+    def test_connect_refused(self):
+        with closing(socket.socket()) as dead:
+            dead.bind(("127.0.0.1", 0))
+            self.answers["irc"] = [entry(socket.AF_INET, dead.getsockname())]
+            self.resolver.clock = time.time
+            with self.assertRaises(socket.error) as raised:
+                self.resolver.connect("irc", 1, 5)
+        ## Refused straight away or once select hears of it, it is still
+        ## refused rather than "No addresses"
+        self.assertEqual(raised.exception.errno, errno.ECONNREFUSED)
+        self.assertNotIn("No addresses", str(raised.exception))
+        
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "needs unix sockets")
+    def test_connect_keeps_immediate_error(self):
+        ## A unix socket connect fails inside connect_ex itself
+        self.answers["irc"] = [(socket.AF_UNIX, socket.SOCK_STREAM, 0, "", 
+                                "/nonexistent/irc.sock")]
+        self.resolver.clock = time.time
+        with self.assertRaises(socket.error) as raised:
+            self.resolver.connect("irc", 1, 5)
+        self.assertEqual(raised.exception.errno, errno.ENOENT)
+        
+    def test_connect_async(self):
+        self.resolver.clock = time.time
+        result = self.resolver.connect_async("nope", 1)
+        self.assertRaises(socket.gaierror, result.get, 5)
+        
+    def test_connect_many_in_parallel(self):
+        with closing(socket.socket()) as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen(10)
+            port = server.getsockname()[1]
+            
+            def slow(port_):
+                time.sleep(.3)
+                return [entry(socket.AF_INET, ("127.0.0.1", port))]
+            for i in range(5):
+                self.answers["irc{}".format(i)] = slow
+            self.resolver.clock = time.time
+            
+            start = time.time()
+            results = self.resolver.connect_many(
+                [("irc{}".format(i), port) for i in range(5)] + [("nope", 1)])
+            self.assertLess(time.time() - start, 1.2)
+            self.assertIsInstance(results["nope", 1], socket.gaierror)
+            for i in range(5):
+                results["irc{}".format(i), port].close()
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_Resolver)
+    unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -0,0 +1,76 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import sys
+import unittest
+
+from IRC_scheduler import Scheduler
+
+
+class test_Scheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.scheduler = Scheduler(clock=lambda: self.now)
+        self.ran = []
+        
+    def test_runs_in_order(self):
+        self.scheduler.call_later(2, self.ran.append, "b")
+        self.scheduler.call_at(101, self.ran.append, "a")
+        self.scheduler.call_later(2, self.ran.append, "c")
+        self.assertEqual(self.scheduler.ready_in(), 1)
+        self.assertEqual(self.scheduler.run_due(), 0)
+        self.now = 102
+        self.assertEqual(self.scheduler.run_due(), 3)
+        self.assertEqual(self.ran, ["a", "b", "c"])
+        self.assertEqual(self.scheduler.ready_in(), None)
+        
+    def test_cancel(self):
+        timer = self.scheduler.call_later(1, self.ran.append, "a")
+        self.scheduler.call_later(5, self.ran.append, "b")
+        timer.cancel()
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.scheduler.ready_in(), 5)
+        self.now = 200
+        self.scheduler.run_due()
+        self.assertEqual(self.ran, ["b"])
+        
+    def test_failing_timer_doesnt_stop_the_rest(self):
+        self.scheduler.call_later(0, lambda: 1 / 0)
+        self.scheduler.call_later(0, self.ran.append, "a")
+        self.assertEqual(self.scheduler.run_due(), 2)
+        self.assertEqual(self.ran, ["a"])
+        
+    def test_timers_added_while_running_wait(self):
+        self.scheduler.call_later(0, lambda: self.scheduler.call_later(
+            1, self.ran.append, "later"))
+        self.scheduler.run_due()
+        self.assertEqual(self.ran, [])
+        self.assertEqual(self.scheduler.ready_in(), 1)
+        
+        
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_Scheduler)
+    unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
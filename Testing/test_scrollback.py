@@ -0,0 +1,61 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import sys
+import unittest
+
+from IRC_scrollback import Scrollback
+
+
+class test_Scrollback(unittest.TestCase):
+
+    def setUp(self):
+        self.scrollback = Scrollback(maxlen=3)
+
+    def test_since(self):
+        self.scrollback.extend(["a", "b"])
+        self.assertEqual(self.scrollback.since(0), (["a", "b"], 2))
+        self.scrollback.append("c")
+        self.assertEqual(self.scrollback.since(2), (["c"], 3))
+        self.assertEqual(self.scrollback.since(3), ([], 3))
+
+    def test_old_lines_fall_off(self):
+        self.scrollback.extend(["a", "b", "c", "d", "e"])
+        self.assertEqual(len(self.scrollback), 3)
+        self.assertEqual(self.scrollback.first_seq, 2)
+        self.assertEqual(self.scrollback.since(0), (["c", "d", "e"], 5))
+        self.assertEqual(self.scrollback.since(4), (["e"], 5))
+
+    def test_sequence(self):
+        self.scrollback.extend(["a", "b", "c", "d"])
+        self.assertEqual(list(self.scrollback), ["b", "c", "d"])
+        self.assertEqual(self.scrollback[-1], "d")
+        self.assertEqual(self.scrollback[1:], ["c", "d"])
+        self.assertIn("c", self.scrollback)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_Scrollback)
+    unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -0,0 +1,163 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import shutil
+import sys
+import tempfile
+import unittest
+
+from IRC_history import Archive
+from IRC_message import Dispatcher, parse
+from IRC_search import (PostingList, SearchIndex, decode_varints, 
+                        encode_varint, intersect)
+
+
+class test_postings(unittest.TestCase):
+
+    def test_varint(self):
+        data = bytearray()
+        numbers = [0, 1, 127, 128, 300, 2 ** 40]
+        for number in numbers:
+            encode_varint(number, data)
+        self.assertEqual(list(decode_varints(data)), numbers)
+        self.assertEqual(len(data), 1 + 1 + 1 + 2 + 2 + 6)
+        
+    def test_posting_list(self):
+        posting = PostingList()
+        for message_id in [0, 3, 3, 4, 1000]:
+            posting.append(message_id)
+        self.assertEqual(list(posting), [0, 3, 4, 1000])
+        self.assertEqual(len(posting), 4)
+        self.assertEqual(len(posting.data), 5)
+        
+    def test_intersect(self):
+        self.assertEqual(list(intersect([[1, 2, 5, 9], [2, 3, 5, 8, 9], 
+                                         [0, 2, 9]])),
+                         [2, 9])
+        self.assertEqual(list(intersect([[1, 2], []])), [])
+        
+        
+class test_SearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SearchIndex()
+        for i, (nick, chan, text) in enumerate([
+                ("alice", "#ops", "the server is down"),
+                ("bob", "#ops", "Which server?"),
+                ("Alice", "#dev", "server fixed"),
+                ("carol", "#OPS", "thanks alice")]):
+            self.index.add_text("net", chan, nick, text, timestamp=100 + i)
+            
+    def test_words(self):
+        self.assertEqual(list(self.index.ids("server")), [0, 1, 2])
+        self.assertEqual(list(self.index.ids(["server", "down"])), [0])
+        self.assertEqual(list(self.index.ids("nothing")), [])
+        
+    def test_nick_and_channel(self):
+        self.assertEqual(list(self.index.ids(nick="ALICE")), [0, 2])
+        self.assertEqual(list(self.index.ids(channel=("net", "#ops"))), 
+                         [0, 1, 3])
+        self.assertEqual(list(self.index.ids("server", nick="alice",
+                                             channel=("net", "#Ops"))), 
+                         [0])
+        
+    def test_time_window(self):
+        self.assertEqual(list(self.index.ids(start=101, end=102)), [1, 2])
+        self.assertEqual(list(self.index.ids("server", start=101.5)), [2])
+        
+    def test_late_lines_keep_their_time(self):
+        ## Caught up on after the fact, as from CHATHISTORY
+        self.index.add_text("net", "#ops", "dave", "server was slow", 
+                            timestamp=101.5)
+        self.index.add_text("net", "#ops", "erin", "back", timestamp=104)
+        self.assertEqual(self.index.times[4], 101.5)
+        self.assertEqual(list(self.index.ids(start=101.2, end=101.8)), [4])
+        self.assertEqual(list(self.index.ids("server", start=101, end=102)),
+                         [1, 2, 4])
+        self.assertEqual(list(self.index.ids(start=103)), [3, 5])
+        self.assertEqual(list(self.index.ids(end=100.5)), [0])
+        
+    def test_encoded_words(self):
+        self.index.add_text("net", "#ops", "dave", b"caf\xc3\xa9 au lait", 
+                            timestamp=104)
+        self.assertEqual(list(self.index.ids(b"CAF\xc3\xa9")), [4])
+        self.assertEqual(list(self.index.ids([b"caf\xc3\xa9", "lait"])), 
+                         [4])
+        
+    def test_lazy(self):
+        results = self.index.ids("server")
+        self.assertEqual(next(results), 0)
+        
+        
+class test_archive_search(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.archive = Archive(self.directory)
+        self.index = SearchIndex(self.archive)
+        
+    def tearDown(self):
+        self.archive.close()
+        shutil.rmtree(self.directory)
+        
+    def test_indexed_as_archived(self):
+        class Member(object):
+            dispatcher = Dispatcher()
+        self.archive.attach(Member)
+        for line in [":a!u@h PRIVMSG #chan :hello world",
+                     ":b!u@h PRIVMSG #chan :goodbye world",
+                     ":b!u@h JOIN #other"]:
+            Member.dispatcher.dispatch("net", parse(line))
+        results = list(self.index.search("world", nick="b"))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][1:], 
+                         ("net", "#chan", 
+                          b":b!u@h PRIVMSG #chan :goodbye world"))
+        self.assertEqual(len(self.index), 3)
+        
+    def test_build_from(self):
+        self.archive.append("net", "#chan", 
+                            ":a!u@h PRIVMSG #chan :hello world", 100)
+        self.archive.append("net", "#other", 
+                            ":b!u@h PRIVMSG #other :goodbye world", 101)
+        self.archive.append("net", "#chan", ":b!u@h PRIVMSG #chan :again", 
+                            102)
+        self.archive.close()
+        
+        self.archive = Archive(self.directory)
+        self.index = SearchIndex.build_from(self.archive)
+        self.assertTrue(self.archive.index is self.index)
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(list(self.index.ids(nick="b")), [1, 2])
+        self.assertEqual(list(self.index.search("world", 
+                                                channel=("net", "#other"))),
+                         [(101.0, "net", "#other", 
+                           b":b!u@h PRIVMSG #other :goodbye world")])
+
+
+if __name__ == '__main__':
+    for case in (test_postings, test_SearchIndex, test_archive_search):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
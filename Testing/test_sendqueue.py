@@ -0,0 +1,169 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import socket
+import sys
+import unittest
+
+from IRC_sendqueue import SendQueue, TokenBucket
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSocket(object):
+    """Records what is sent, accepting at most limit bytes per send"""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.sent = []
+
+    def send(self, data):
+        data = data[:self.limit] if self.limit else data
+        self.sent.append(data)
+        return len(data)
+
+
+class test_TokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.bucket = TokenBucket()
+
+    def test_burst_of_five(self):
+        allowed = 0
+        while self.bucket.allows(0):
+            self.bucket.consume(10, 0)
+            allowed += 1
+        self.assertEqual(allowed, 5)
+        self.assertEqual(self.bucket.ready_in(0), 0)
+        self.assertFalse(self.bucket.allows(0))
+        self.assertTrue(self.bucket.allows(.5))
+
+    def test_byte_penalty(self):
+        bucket = TokenBucket(byte_penalty=.01)
+        bucket.consume(100, 0)
+        self.assertEqual(bucket.timer, 3.0)
+
+    def test_idle_bucket_refills(self):
+        for _ in range(5):
+            self.bucket.consume(10, 0)
+        self.assertTrue(self.bucket.allows(10))
+        self.bucket.consume(10, 100)
+        self.assertEqual(self.bucket.timer, 102)
+
+
+class test_SendQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.queue = SendQueue(clock=self.clock)
+        self.sock = FakeSocket()
+
+    def test_batches_one_send(self):
+        for i in range(3):
+            self.queue.put("PRIVMSG #a :{}\r\n".format(i))
+        self.assertEqual(self.queue.flush(self.sock), 0)
+        self.assertEqual(self.sock.sent, [b"PRIVMSG #a :0\r\nPRIVMSG #a :1\r\n"
+                                          b"PRIVMSG #a :2\r\n"])
+
+    def test_flood_control(self):
+        for i in range(7):
+            self.queue.put("PRIVMSG #a :{}\r\n".format(i))
+        self.queue.flush(self.sock)
+        self.assertEqual(self.sock.sent[0].count(b"\r\n"), 5)
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(self.queue.ready_in(), 0)
+        
+        self.clock.now += 2
+        self.queue.flush(self.sock)
+        self.assertEqual(self.sock.sent[1], b"PRIVMSG #a :5\r\n")
+        self.assertEqual(self.queue.stats()["max_delay"], 2)
+
+    def test_pong_jumps_the_queue(self):
+        for i in range(7):
+            self.queue.put("PRIVMSG #a :{}\r\n".format(i))
+        self.queue.flush(self.sock)
+        self.queue.put("PONG :server\r\n")
+        self.clock.now += 2
+        self.queue.flush(self.sock)
+        self.assertEqual(self.sock.sent[1], b"PONG :server\r\n")
+
+    def test_partial_send(self):
+        self.sock.limit = 4
+        self.queue.put("NICK Nickname\r\n")
+        self.assertEqual(self.queue.flush(self.sock), 11)
+        self.assertEqual(self.queue.ready_in(), 0)
+        self.sock.limit = None
+        self.assertEqual(self.queue.flush(self.sock), 0)
+        self.assertEqual(b"".join(self.sock.sent), b"NICK Nickname\r\n")
+
+    def test_timeout_keeps_data(self):
+        def timeout(data):
+            raise socket.timeout()
+        self.sock.send = timeout
+        self.queue.put("NICK Nickname\r\n")
+        self.assertEqual(self.queue.flush(self.sock), 15)
+
+    def test_force(self):
+        for i in range(7):
+            self.queue.put("PRIVMSG #a :{}\r\n".format(i))
+        self.queue.flush(self.sock, force=True)
+        self.assertEqual(len(self.queue), 0)
+
+    def test_blank_line(self):
+        self.queue.put(b" \r\n")
+        self.assertEqual(len(self.queue.normal), 1)
+        self.queue.flush(self.sock)
+        self.assertEqual(self.sock.sent, [b" \r\n"])
+
+    def test_text_is_encoded(self):
+        self.queue.put(u"PRIVMSG #a :caf\u00e9\r\n")
+        self.queue.put(b"PONG :server\r\n")
+        self.queue.flush(self.sock)
+        self.assertEqual(self.sock.sent, 
+                         [b"PONG :server\r\nPRIVMSG #a :caf\xc3\xa9\r\n"])
+
+    def test_stats(self):
+        self.queue.put("PRIVMSG #a :hi\r\n")
+        self.assertEqual(self.queue.stats()["queued_bytes"], 16)
+        self.clock.now += 1.5
+        self.queue.flush(self.sock)
+        stats = self.queue.stats()
+        self.assertEqual((stats["queued_bytes"], stats["sent_lines"], 
+                          stats["sent_bytes"], stats["last_delay"]),
+                         (0, 1, 16, 1.5))
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite(
+        [unittest.TestLoader().loadTestsFromTestCase(test_TokenBucket),
+         unittest.TestLoader().loadTestsFromTestCase(test_SendQueue)])
+    unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -0,0 +1,147 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import multiprocessing
+import socket
+import sys
+import unittest
+
+from IRC_shard import HashRing, IRC_member, ShardWorker
+from Testing.fake_ircd import FakeIRCd
+from Testing.polling import run_until
+
+
+class test_HashRing(unittest.TestCase):
+
+    def setUp(self):
+        self.keys = ["irc{}.example.net".format(i) for i in range(1000)]
+        
+    def test_spread(self):
+        ring = HashRing(range(4))
+        counts = [0] * 4
+        for key in self.keys:
+            counts[ring.node(key)] += 1
+        self.assertTrue(all(count > 150 for count in counts), counts)
+        
+    def test_adding_a_node_moves_few_keys(self):
+        ring = HashRing(range(4))
+        before = dict((key, ring.node(key)) for key in self.keys)
+        ring.add(4)
+        moved = [key for key in self.keys if ring.node(key) != before[key]]
+        self.assertTrue(all(ring.node(key) == 4 for key in moved))
+        self.assertLess(len(moved), 350)
+        
+        ring.remove(4)
+        self.assertEqual(dict((key, ring.node(key)) for key in self.keys), 
+                         before)
+        
+    def test_empty(self):
+        self.assertRaises(LookupError, HashRing().node, "a")
+        
+        
+class test_ShardWorker(unittest.TestCase):
+
+    def test_holds_batches(self):
+        ours, theirs = multiprocessing.Pipe()
+        worker = ShardWorker(theirs, "Nickname")
+        try:
+            worker._store_replies("net", worker._handle_lines("net", [
+                b":srv BATCH +1 netsplit a b",
+                b"@batch=1 :x!u@h QUIT :a b"]))
+            self.assertEqual(worker.outbox, [])
+            worker._store_replies("net", worker._handle_lines("net", [
+                b":srv BATCH -1"]))
+            self.assertEqual(worker.outbox, 
+                             [("net", b"@batch=1 :x!u@h QUIT :a b",
+                               ("QUIT", [b"a b"], b"x!u@h", {"batch": "1"},
+                                b"batch=1"))])
+        finally:
+            worker.selector.close()
+            ours.close()
+            theirs.close()
+        
+        
+class test_IRC_member(unittest.TestCase):
+
+    def setUp(self):
+        self.ircd = FakeIRCd()
+        self.ircd.start()
+        self.IRC_ = IRC_member("Nickname", shards=2)
+        ## Names that all reach the fake ircd; two that land on different
+        ## workers are used
+        names = ["127.0.0.1", "localhost", "127.1", "127.0.1", "2130706433"]
+        other = [name for name in names 
+                 if self.IRC_.shard(name) != self.IRC_.shard(names[0])]
+        self.hostnames = [names[0], other[0]]
+        
+    def tearDown(self):
+        self.IRC_.close()
+        self.ircd.stop()
+        
+    def test_join_and_dispatch(self):
+        self.assertEqual(self.IRC_.join_servers(self.hostnames, 
+                                                self.ircd.port),
+                         dict.fromkeys(self.hostnames, 0))
+        run_until(self.IRC_, lambda: len(self.IRC_.replies) == 2)
+        self.assertIn("001", self.IRC_.replies[self.hostnames[1]][0])
+        
+        messages = []
+        self.IRC_.dispatcher.register(
+            "PRIVMSG", lambda hostname, message: messages.append(
+                (hostname, message.nick, message.params)) or True)
+        for hostname in self.hostnames:
+            self.assertEqual(
+                self.IRC_.join_channels(hostname, ["#a"], timeout=2), 
+                {"#a": 0})
+            
+        other = socket.create_connection(("127.0.0.1", self.ircd.port), 5)
+        try:
+            other.sendall(b"NICK other\r\nUSER o o 0 :o\r\n"
+                          b"PRIVMSG #a :hello\r\n")
+            run_until(self.IRC_, lambda: len(messages) == 2)
+        finally:
+            other.close()
+        self.assertEqual(sorted(messages), 
+                         sorted((hostname, "other", ["#a", "hello"])
+                                for hostname in self.hostnames))
+        
+    def test_lost_server(self):
+        self.assertEqual(self.IRC_.join_server(self.hostnames[0], 
+                                               self.ircd.port), 0)
+        run_until(self.IRC_, lambda: self.IRC_.replies)
+        self.ircd.drop_clients()
+        run_until(self.IRC_, lambda: not self.IRC_.servers)
+        self.assertEqual(self.IRC_.send_server_message(self.hostnames[0], 
+                                                       "PING x"), 1)
+        
+    def test_unknown_server(self):
+        self.assertEqual(self.IRC_.send_server_message("nowhere", "PING x"), 
+                         1)
+        
+        
+if __name__ == '__main__':
+    for case in (test_HashRing, test_ShardWorker, test_IRC_member):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -22,8 +22,6 @@ THE SOFTWARE.
 You should have received a copy of the MIT License along with this program.
 If not, see <http://opensource.org/licenses/MIT>
 """
-from nose.plugins.skip import SkipTest
-raise SkipTest
 try:
     import cStringIO as IO
 except ImportError:
@@ -33,11 +31,13 @@ finally:
     import asyncore
     import socket
     import sys
+    import threading
     import unittest
     
     from testfixtures import LogCapture
     
-    # import IRC_sockasyncore as IRC
+    import IRC_sockasyncore as IRC
+    from Testing.polling import run_until
     
     
 @contextmanager
@@ -59,34 +59,177 @@ class SocketHandler(asyncore.dispatcher_with_send):
     """Just echos the message back to whoever sent it"""
     
     def handle_read(self):
-        while True:
-            data = self.recv(8192)
-            if data:
-                self.send(data)
-            else:
-                break
+        data = self.recv(8192)
+        if data:
+            self.send(data)
 
 
 class ServerSocket(asyncore.dispatcher):
     
-    def __init__(self, hostname='localhost', port=10000):
-        super(ServerSocket, self).__init__(self)
+    def __init__(self, hostname='localhost', port=10001):
+        self.map = {}
+        asyncore.dispatcher.__init__(self, map=self.map)
         self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
         self.address = hostname, port
         self.set_reuse_addr()
         self.bind(self.address)
         self.listen(5)
+        self.event = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        
+    def run(self):
+        while not self.event.isSet():
+            asyncore.loop(.01, count=1, map=self.map)
+        asyncore.close_all(self.map)
+        
+    def stop(self):
+        self.event.set()
+        self.thread.join()
         
     def handle_accept(self):
-        socket_, _ = self.accept()
-        SocketHandler(socket_)
+        pair = self.accept()
+        if pair is not None:
+            SocketHandler(pair[0], map=self.map)
+
 
                 
 class test_sockasyncore(unittest.TestCase):
 
-    pass
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ServerSocket()
+        cls.server.thread.start()
+        cls.log_capture = LogCapture()
+        
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.log_capture.uninstall()
+        
+    def setUp(self):
+        self.IRC_ = IRC.IRC_member("Nickname")
+        
+    def tearDown(self):
+        for server in list(self.IRC_.servers):
+            self.IRC_.leave_server(server)
+        run_until(self.IRC_, lambda: not self.IRC_.map)
+        
+    def replies(self, count):
+        run_until(self.IRC_, 
+                  lambda: len(self.IRC_.replies.get('localhost', [])) >= count)
+        return self.IRC_.replies.get('localhost', [])[:]
+        
+    def test_join_server(self):
+        self.assertEqual(self.IRC_.join_server('localhost', 10001), 0)
+        self.assertEqual(self.replies(2),
+                         ['NICK Nickname',
+                          'USER Nickname 0 * :Nickname'])
+        
+    def test_join_server2(self):
+        self.IRC_.join_server('localhost', 10001, nick="Nick",
+                              ident="Ident", realname="Realname")
+        self.assertEqual(self.IRC_.serv_to_data['localhost'],
+                         {'nick': 'Nick', 'ident': 'Ident',
+                          'realname': 'Realname'})
+        self.assertEqual(self.replies(1)[0], 'NICK Nick')
+        
+    def test_leave_server(self):
+        self.IRC_.join_server('localhost', 10001)
+        self.assertEqual(self.IRC_.leave_server('localhost'), 0)
+        run_until(self.IRC_, lambda: not self.IRC_.map)
+        
+    def test_join_and_leave_channel(self):
+        self.IRC_.join_server('localhost', 10001)
+        self.assertEqual(self.IRC_.join_channel('localhost', '#tchannel'), 0)
+        self.assertEqual(self.IRC_.leave_channel('localhost', '#tchannel'), 0)
+        self.assertEqual(self.replies(4)[2:], ['JOIN #tchannel',
+                                               'PART #tchannel'])
+        
+    def test_send_channel_message(self):
+        self.IRC_.join_server('localhost', 10001)
+        self.IRC_.join_channel('localhost', '#tchannel')
+        self.assertEqual(self.IRC_.send_channel_message('localhost',
+                                                       '#tchannel',
+                                                       'anything'),
+                         0)
+        self.assertEqual(self.replies(4)[-1], 'PRIVMSG #tchannel :anything')
+        
+    def test_ping_is_answered(self):
+        self.IRC_.join_server('localhost', 10001)
+        self.IRC_.send_server_message('localhost', 'PING :hello world')
+        self.assertEqual(self.replies(3)[-1], 'PONG :hello world')
+        
+    def test_receive_all_messages(self):
+        self.IRC_.join_server('localhost', 10001)
+        with capture() as out:
+            run_until(self.IRC_, lambda: self.IRC_.replies)
+            self.assertEqual(self.IRC_.receive_all_messages(0), 0)
+        self.assertIn('NICK Nickname', out[0])
+        
+    def test_flood_stays_under_high_water(self):
+        self.IRC_.join_server('localhost', 10001)
+        self.replies(2)
+        connection = self.IRC_.servers['localhost']
+        lines = 20000
+        line = 'PRIVMSG #tchannel :{}'.format('x' * 80)
+        
+        sent = peak = 0
+        while sent < lines:
+            if self.IRC_.send_server_message('localhost', line) == 0:
+                sent += 1
+            else:
+                self.IRC_.poll(.01)
+            peak = max(peak, connection.write_size)
+        replies = lambda: self.IRC_.replies['localhost']
+        run_until(self.IRC_, lambda: replies().next_seq >= lines + 2, 30)
+        
+        ## Only the most recent lines are kept
+        self.assertEqual(replies()[:], [line] * self.IRC_.scrollback)
+        self.assertLess(peak, connection.high_water + len(line) + 3)
                         
                         
 class test_ServerConnection(unittest.TestCase):
     
-    pass
+    def setUp(self):
+        self.map = {}
+        self.lines = []
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('localhost', 0))
+        self.listener.listen(1)
+        self.connection = IRC.ServerConnection(
+            'localhost', self.listener.getsockname()[1], 
+            on_line=self.lines.append, high_water=100, low_water=50, 
+            map=self.map)
+        self.peer, _ = self.listener.accept()
+        
+    def tearDown(self):
+        self.connection.close()
+        self.peer.close()
+        self.listener.close()
+        
+    def test_partial_lines(self):
+        self.peer.sendall(b"PING :a\r\nJOIN")
+        asyncore.loop(1, count=1, map=self.map)
+        self.peer.sendall(b" #b\r\n")
+        asyncore.loop(1, count=1, map=self.map)
+        self.assertEqual(self.lines, [b"PING :a", b"JOIN #b"])
+        
+    def test_high_and_low_water(self):
+        self.assertTrue(self.connection.push(b"x" * 60))
+        self.assertTrue(self.connection.push(b"x" * 60))
+        self.assertTrue(self.connection.paused)
+        self.assertFalse(self.connection.push(b"x"))
+        self.assertTrue(self.connection.push(b"QUIT\r\n", force=True))
+        
+        while self.connection.write_buffer:
+            asyncore.loop(1, count=1, map=self.map)
+        self.assertFalse(self.connection.paused)
+        self.assertEqual(self.connection.write_size, 0)
+        
+    def test_partial_send(self):
+        self.connection.push(b"abc")
+        self.connection.push(b"defg")
+        self.connection.send = lambda data: 5
+        self.connection.handle_write()
+        self.assertEqual(list(self.connection.write_buffer), [b"fg"])
+        self.assertEqual(self.connection.write_size, 2)
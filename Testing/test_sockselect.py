@@ -39,6 +39,7 @@ finally:
     from testfixtures import LogCapture
     
     import IRC_sockselect as IRC
+    from Testing.polling import run_until
     
     
 @contextmanager
@@ -69,7 +70,7 @@ def client_thread(client_socket, client_event):
                 client_socket.close()
                 client_event.set()
             else:
-                if 'Done' in message:
+                if not message or 'Done' in message:
                     client_socket.close()
                     client_event.set()
                 else:
@@ -86,6 +87,7 @@ class ServerSocket(threading.Thread):
         self.timeout = timeout
         self.now = time.time()
         self.event = threading.Event()
+        self.ready = threading.Event()
         # Maps from a thread ID to a tuple of form 
         # (socket, threading.Event, threading.Thread)
         self.clients = {}
@@ -93,8 +95,10 @@ class ServerSocket(threading.Thread):
     def run(self):
         with closing(socket.socket(socket.AF_INET,
                                     socket.SOCK_STREAM)) as self.server:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server.bind((self.hostname, self.port))
             self.server.listen(5)
+            self.ready.set()
             while not self.event.isSet():
                 connection, _ = self.server.accept()
                 if connection:
@@ -102,6 +106,7 @@ class ServerSocket(threading.Thread):
                     client = threading.Thread(target=client_thread, 
                                               args=(connection,
                                                     event))
+                    client.daemon = True
                     client.start()
                     self.clients[client.ident] = connection, event, client
                     
@@ -109,6 +114,15 @@ class ServerSocket(threading.Thread):
                     if event_.isSet():
                         client_.join()
                         del self.clients[id_]
+                        
+    def stop(self):
+        self.event.set()
+        ## Wakes up the blocking accept so run can see the event
+        try:
+            socket.create_connection((self.hostname, self.port)).close()
+        except socket.error:
+            pass
+        self.join()
                 
 class test_sockselect(unittest.TestCase):
 
@@ -116,12 +130,12 @@ class test_sockselect(unittest.TestCase):
     def setUpClass(cls):
         cls.server = ServerSocket()
         cls.server.start()
+        cls.server.ready.wait(5)
         cls.log_capture = LogCapture()
         
     @classmethod
     def tearDownClass(cls):
-        cls.server.event.set()
-        cls.server.join()
+        cls.server.stop()
         cls.log_capture.uninstall()
         
     def setUp(self):
@@ -155,17 +169,72 @@ class test_sockselect(unittest.TestCase):
             ['Nick', 'Ident', 'Realname']
            )
 
+    def test_join_servers(self):
+        results = self.IRC_.join_servers(['localhost', 
+                                          ('127.0.0.1', 10000),
+                                          'nonexistent.invalid'],
+                                         port=10000)
+        self.assertEqual(results, {'localhost': 0, '127.0.0.1': 0, 
+                                   'nonexistent.invalid': 1})
+        self.assertEqual(sorted(self.IRC_.servers), 
+                         ['127.0.0.1', 'localhost'])
+
+    def test_join_server_without_waiting(self):
+        self.assertEqual(self.IRC_.join_server('localhost', 10000, 
+                                               wait=False), 
+                         0)
+        self.assertIn('localhost', self.IRC_.connecting)
+        self.assertEqual(self.IRC_.send_server_message('localhost', 
+                                                      'queued'), 
+                         0)
+        run_until(self.IRC_, 
+                  lambda: len(self.IRC_.replies.get('localhost', [])) == 3)
+        self.assertEqual(self.IRC_.replies['localhost'][:],
+                         ['NICK Nickname', 'USER Nickname 0 * :Nickname',
+                          'queued'])
+        
+    def test_join_server_fails_later(self):
+        self.assertEqual(self.IRC_.join_server('nonexistent.invalid', 
+                                               wait=False), 
+                         0)
+        run_until(self.IRC_, lambda: not self.IRC_.connecting)
+        self.assertNotIn('nonexistent.invalid', self.IRC_.serv_to_chan)
+        self.assertNotIn('nonexistent.invalid', self.IRC_.send_queues)
+        self.assertEqual(self.IRC_.join_server('nonexistent.invalid'), 1)
+        
+    def test_leave_server_while_connecting(self):
+        self.IRC_.join_server('localhost', 10000, wait=False)
+        self.assertEqual(self.IRC_.leave_server('localhost'), 0)
+        self.assertEqual(self.IRC_.connecting, {})
+        run_until(self.IRC_, lambda: not self.IRC_.abandoned)
+        self.assertEqual(self.IRC_.servers, {})
+        
     def test_leave_server(self): 
         self.IRC_.join_server('localhost', 10000)
         self.assertEqual(self.IRC_.leave_server('localhost'),
                          0)        
    
+    def test_leave_server_unwatches(self):
+        self.IRC_.join_server('localhost', 10000)
+        self.IRC_.leave_server('localhost')
+        self.assertEqual(len(self.IRC_.selector.get_map()), 0)
+   
     def test_join_channel(self): 
         self.IRC_.join_server('localhost', 10000)
         self.assertEqual(self.IRC_.join_channel('localhost', 
                                                '#temp-channel'),
                          0)
 
+    def test_refused_join_channel(self): 
+        self.IRC_.join_server('localhost', 10000)
+        self.IRC_.join_channel('localhost', '#full')
+        self.IRC_.join_channel('localhost', '#open')
+        self.IRC_._handle_lines('localhost', [
+            b":srv 471 Nickname #full :Cannot join channel (+l)",
+            b":Nickname!u@h JOIN #open"])
+        self.assertEqual(self.IRC_.serv_to_chan['localhost'], set(['#open']))
+        self.assertEqual(self.IRC_.pending_joins['localhost'], {})
+
     def test_leave_channel(self): 
         self.IRC_.join_server('localhost', 10000)
         self.IRC_.join_channel('localhost', '#tchannel')
@@ -176,6 +245,10 @@ class test_sockselect(unittest.TestCase):
         self.assertEqual(self.IRC_.send_server_message('localhost',
                                                       'anything'),
                          0)
+        
+    def test_send_blank_server_message(self): 
+        self.IRC_.join_server('localhost', 10000)
+        self.assertEqual(self.IRC_.send_server_message('localhost', ''), 0)
  
     def test_send_channel_message(self): 
         self.IRC_.join_server('localhost', 10000)
@@ -192,32 +265,159 @@ class test_sockselect(unittest.TestCase):
                                                'anything'),
                          0)
     
+    def test_send_priv_message_unknown_user(self):
+        self.IRC_.join_server('localhost', 10000)
+        with LogCapture() as log_capture:
+            self.assertEqual(self.IRC_.send_privmsg('localhost', 'NickServ', 
+                                                   'hi'),
+                             0)
+            self.assertEqual(self.IRC_.send_privmsg('localhost', u'nob\xf6dy', 
+                                                   'hi', force=True),
+                             0)
+        self.assertEqual(len(log_capture.records), 1)
+        self.assertIn("NickServ, who shares no channel", str(log_capture))
+        
+    def test_tracks_channel_members(self):
+        self.IRC_.join_server('localhost', 10000)
+        ## Only as many lines as flood control lets through at once
+        for line in [':Nickname!u@h JOIN #a',
+                     ':srv 353 Nickname = #a :Nickname @Op +Voice',
+                     ':Voice!u@h NICK V[oice]']:
+            self.IRC_.send_server_message('localhost', line)
+        self.IRC_.receive_message(('localhost',))
+        state = self.IRC_.serv_to_state['localhost']
+        self.assertTrue(state.has_user('v{OICE}'))
+        self.assertFalse(state.has_user('Voice'))
+        self.assertEqual([channel.name for channel in 
+                          state.shared_channels('V[oice]')], ['#a'])
+        self.assertEqual(state.channel('#A').members, 
+                         {'nickname': '', 'op': '@', 'v{oice}': '+'})
+    
+    def test_subscribe(self):
+        got = []
+        self.IRC_.subscribe(lambda hostname, message: got.append(
+            (hostname, message.params[-1].rstrip())), channel='#A',
+            command='privmsg')
+        self.IRC_.join_server('localhost', 10000)
+        for line in [':x!u@h PRIVMSG #a :hi', ':x!u@h PRIVMSG #b :no', 
+                     'whatever']:
+            self.IRC_.send_server_message('localhost', line)
+        self.IRC_.receive_message(('localhost',))
+        self.assertEqual(got, [('localhost', 'hi')])
+        self.assertEqual(self.IRC_.replies['localhost'][:], 
+                         [':x!u@h PRIVMSG #a :hi'])
+    
     def test_receive_all_messages(self): 
-        self.IRC_.replies['localhost'] = []
         self.IRC_.join_server('localhost', 10000)
         map(self.IRC_.send_server_message,
             ['localhost']*3,
             ['whatever', 'something else', 'last thing'])
-        with capture():
+        with capture() as out:
             self.assertEqual(self.IRC_.receive_all_messages(), 0)
+        self.assertIn(' NICK Nickname', out[0])
+        self.IRC_.send_server_message('localhost', 'only this')
+        with capture() as out:
+            self.IRC_.receive_all_messages()
+        self.assertNotIn('NICK', out[0])
+        self.assertIn(' only this', out[0])
     
     def test_receive_message(self): 
-        self.IRC_.replies['localhost'] = []
         self.IRC_.join_server('localhost', 10000)
         map(self.IRC_.send_server_message,
             ['localhost']*3,
             ['whatever', 'something else', 'last thing'])
         self.IRC_.receive_message(('localhost',))
-        self.assertEqual(self.IRC_.replies['localhost'],
+        self.assertEqual(self.IRC_.replies['localhost'][:],
                          [
                           'NICK Nickname',
-                          'USER Nickname Nickname bla: Nickname',
+                          'USER Nickname 0 * :Nickname',
                           'whatever',
                           'something else',
                           'last thing'
                          ]
                         )
 
+    def test_poll(self):
+        self.IRC_.join_server('localhost', 10000)
+        self.assertEqual(self.IRC_.poll(1), ['localhost'])
+        self.assertIn('NICK Nickname', self.IRC_.replies['localhost'])
+        
+    def test_ping_is_answered(self):
+        self.IRC_.join_server('localhost', 10000)
+        self.IRC_.send_server_message('localhost', 'PING :hello world')
+        self.IRC_.receive_message(('localhost',))
+        self.assertIn('PONG :hello world', self.IRC_.replies['localhost'])
+        self.assertNotIn('PING :hello world', self.IRC_.replies['localhost'])
+        
+    def test_bare_ping_is_answered(self):
+        self.IRC_.join_server('localhost', 10000)
+        self.IRC_.send_server_message('localhost', 'PING')
+        self.IRC_.receive_message(('localhost',))
+        self.assertIn('PONG :', self.IRC_.replies['localhost'])
+        
+    def test_flood_control(self):
+        self.IRC_.join_server('localhost', 10000)
+        for i in range(5):
+            self.IRC_.send_server_message('localhost', str(i))
+        stats = self.IRC_.send_stats('localhost')
+        self.assertEqual(stats['sent_lines'] + stats['queued_lines'], 7)
+        self.assertGreater(stats['queued_lines'], 0)
+        
+    def test_send_long_channel_message(self):
+        self.IRC_.join_server('localhost', 10000)
+        self.IRC_.send_queues['localhost'].bucket.window = 1000
+        self.IRC_.serv_to_isupport['localhost'] = {'TARGMAX': 'PRIVMSG:2'}
+        for chan in ['#a', '#b', '#c']:
+            self.IRC_.join_channel('localhost', chan)
+        self.assertEqual(self.IRC_.send_channel_message('localhost',
+                                                       ['#a', '#b', '#c'],
+                                                       'x' * 600),
+                         0)
+        self.IRC_.receive_message(('localhost',))
+        privmsgs = [line for line in self.IRC_.replies['localhost']
+                    if line.startswith('PRIVMSG')]
+        self.assertEqual([line.split()[1] for line in privmsgs],
+                         ['#a,#b', '#a,#b', '#c', '#c'])
+        self.assertEqual(''.join(line.split(':', 1)[1] 
+                                 for line in privmsgs[:2]), 'x' * 600)
+        
+    def test_learns_prefix(self):
+        self.IRC_.join_server('localhost', 10000)
+        self.IRC_.send_server_message('localhost', 
+                                      ':Nickname!~Nickname@some.host JOIN #a')
+        self.IRC_.receive_message(('localhost',))
+        self.assertEqual(self.IRC_.serv_to_prefix['localhost'], 
+                         'Nickname!~Nickname@some.host')
+        self.assertEqual(self.IRC_._prefix_length('localhost'), 30)
+        
+    def test_join_channels(self):
+        self.IRC_.join_server('localhost', 10000)
+        self.IRC_.send_server_message('localhost', 
+                                      ':Nickname!u@h JOIN #A')
+        self.IRC_.send_server_message('localhost', 
+                                      ':server 474 Nickname #b :Banned')
+        results = self.IRC_.join_channels('localhost', 
+                                          ['#a', '#b', '#c', 'bad'], 
+                                          timeout=.5)
+        self.assertEqual(results, {'#a': 0, '#b': '474', '#c': None, 
+                                   'bad': 2})
+        self.assertEqual(self.IRC_.serv_to_chan['localhost'], set(['#a']))
+        self.assertEqual(self.IRC_.pending_joins['localhost'], {})
+        
+    def test_leave_channels(self):
+        self.IRC_.join_server('localhost', 10000)
+        self.IRC_.join_channel('localhost', '#a')
+        self.IRC_.join_channel('localhost', '#b')
+        self.assertEqual(self.IRC_.leave_channels('localhost', 
+                                                  ['#a', '#b', '#x']), 
+                         0)
+        self.assertEqual(self.IRC_.serv_to_chan['localhost'], set())
+        self.IRC_.receive_message(('localhost',))
+        self.assertEqual(self.IRC_.replies['localhost'][-1], 'PART #a,#b')
+        
+    def test_poll_timeout(self):
+        self.assertEqual(self.IRC_.poll(0), [])
+
 if __name__ == '__main__':
     suite = unittest.TestLoader().loadTestsFromTestCase(test_sockselect)
     unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
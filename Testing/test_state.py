@@ -0,0 +1,136 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import sys
+import unittest
+
+from IRC_state import ServerState, casefold, parse_prefix, split_prefix
+
+
+class test_helpers(unittest.TestCase):
+
+    def test_casefold(self):
+        self.assertEqual(casefold("Nick[]\\~"), "nick{}|^")
+        self.assertEqual(casefold("Nick[]\\~", "strict-rfc1459"), "nick{}|~")
+        self.assertEqual(casefold("Nick[]\\~", "ascii"), "nick[]\\~")
+        
+    def test_casefold_unicode(self):
+        self.assertEqual(casefold(u"Nick[]\\~\xc9"), u"nick{}|^\xc9")
+        self.assertEqual(casefold(u"Nick[]", "ascii"), u"nick[]")
+        
+    def test_parse_prefix(self):
+        self.assertEqual(parse_prefix("(qaohv)~&@%+"), "~&@%+")
+        self.assertEqual(parse_prefix(""), "")
+        
+    def test_split_prefix(self):
+        self.assertEqual(split_prefix("nick!ident@host"), 
+                         ("nick", "ident", "host"))
+        self.assertEqual(split_prefix("nick"), ("nick", None, None))
+        
+        
+class test_ServerState(unittest.TestCase):
+
+    def setUp(self):
+        self.state = ServerState("Me")
+        self.state.joined("Me!me@here", "#Chan")
+        self.state.names("#chan", "@Me +Alice bob!b@there")
+        
+    def test_unicode_names(self):
+        self.assertTrue(self.state.has_user(u"ALICE"))
+        self.assertFalse(self.state.has_user(u"\xc9ve"))
+        
+    def test_names(self):
+        self.assertEqual(self.state.channel("#CHAN").members, 
+                         {"me": "@", "alice": "+", "bob": ""})
+        self.assertEqual(self.state.user("BOB").host, "there")
+        
+    def test_others_join_and_part(self):
+        self.state.joined("Carol!c@h", "#chan")
+        self.assertTrue(self.state.has_user("carol"))
+        self.state.parted("CAROL", "#chan")
+        self.assertFalse(self.state.has_user("carol"))
+        
+    def test_join_elsewhere_ignored(self):
+        self.state.joined("Carol!c@h", "#other")
+        self.assertFalse(self.state.has_user("carol"))
+        
+    def test_shared_channels(self):
+        self.state.joined("Me!me@here", "#two")
+        self.state.joined("Alice!a@h", "#two")
+        self.assertEqual(sorted(channel.name for channel in 
+                                self.state.shared_channels("alice")),
+                         ["#Chan", "#two"])
+        self.assertEqual(self.state.shared_channels("nobody"), frozenset())
+        
+    def test_we_part(self):
+        self.state.parted("me", "#chan")
+        self.assertEqual(self.state.channels, {})
+        self.assertFalse(self.state.has_user("alice"))
+        
+    def test_quit(self):
+        self.state.quit("Alice")
+        self.assertFalse(self.state.has_user("alice"))
+        self.assertNotIn("alice", self.state.channel("#chan").members)
+        
+    def test_quit_many(self):
+        self.state.joined("Me!me@here", "#two")
+        self.state.joined("Alice!a@h", "#two")
+        self.assertEqual(self.state.quit_many(["alice", "BOB", "nobody"]), 2)
+        self.assertEqual(self.state.channel("#chan").members, {"me": "@"})
+        self.assertEqual(self.state.channel("#two").members, {"me": ""})
+        self.assertEqual(list(self.state.users), ["me"])
+        
+    def test_nick_change(self):
+        self.state.nick_changed("Alice", "Alice2")
+        self.assertEqual(self.state.user("alice2").nick, "Alice2")
+        self.assertEqual(self.state.channel("#chan").members["alice2"], "+")
+        self.state.nick_changed("Me", "Me2")
+        self.assertEqual(self.state.me, "me2")
+        
+    def test_set_casemapping(self):
+        self.state.names("#chan", "A[1]")
+        self.assertTrue(self.state.has_user("a{1}"))
+        self.state.set_casemapping("ascii")
+        self.assertFalse(self.state.has_user("a{1}"))
+        self.assertTrue(self.state.has_user("A[1]"))
+        self.assertIn("a[1]", self.state.channel("#chan").members)
+        
+    def test_prefixes(self):
+        self.state.set_prefixes("(qov)~@+")
+        self.state.names("#chan", "~Owner")
+        self.assertEqual(self.state.channel("#chan").members["owner"], "~")
+        
+    def test_keys_are_shared(self):
+        self.state.joined("Me!me@here", "#two")
+        self.state.names("#two", "Alice")
+        keys = [key for channel in self.state.channels.values() 
+                for key in channel.members if key == "alice"]
+        self.assertIs(keys[0], keys[1])
+
+
+if __name__ == '__main__':
+    for case in (test_helpers, test_ServerState):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -0,0 +1,86 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import sys
+import unittest
+
+from IRC_subscribe import Subscriptions, peek
+
+
+class test_peek(unittest.TestCase):
+
+    def test_prefix_and_target(self):
+        self.assertEqual(peek(":Nick!u@h PRIVMSG #chan :hello there"),
+                         ("Nick", "PRIVMSG", "#chan"))
+        
+    def test_tags_and_no_prefix(self):
+        self.assertEqual(peek("@time=x ping :token"), 
+                         (None, "PING", "token"))
+        self.assertEqual(peek(":irc.server 001 Me :Welcome"),
+                         ("irc.server", "001", "Me"))
+        
+    def test_bytes(self):
+        self.assertEqual(peek(b":Nick!u@h PRIVMSG #chan :hello there"),
+                         ("Nick", "PRIVMSG", "#chan"))
+        
+        
+class test_Subscriptions(unittest.TestCase):
+
+    def setUp(self):
+        self.subscriptions = Subscriptions()
+        self.privmsg = self.subscriptions.add(len, command="privmsg", 
+                                              channel="#Chan[1]")
+        self.nick = self.subscriptions.add(len, server="a", nick="Bob")
+        
+    def match(self, line, hostname="a", handled=()):
+        return self.subscriptions.match(hostname, line, handled)
+        
+    def test_match(self):
+        self.assertEqual(self.match(":x PRIVMSG #chan{1} :hi"), 
+                         (self.privmsg,))
+        self.assertEqual(self.match(":BOB!u@h PRIVMSG #chan[1] :hi"), 
+                         (self.privmsg, self.nick))
+        self.assertEqual(self.match(":bob!u@h JOIN #other", "b"), None)
+        self.assertEqual(self.match(":x NOTICE #chan[1] :hi"), None)
+        
+    def test_handled_lines_are_kept(self):
+        self.assertEqual(self.match("PING :x", handled={"PING": ()}), ())
+        
+    def test_remove(self):
+        self.subscriptions.remove(self.privmsg)
+        self.assertEqual(len(self.subscriptions), 1)
+        self.assertEqual(self.match(":x PRIVMSG #chan[1] :hi"), None)
+        
+    def test_deliver(self):
+        seen = []
+        sub = self.subscriptions.add(lambda *args: seen.append(args))
+        self.assertFalse(self.subscriptions.deliver((sub,), "a", "message"))
+        self.assertEqual(seen, [("a", "message")])
+        
+        
+if __name__ == '__main__':
+    for case in (test_peek, test_Subscriptions):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
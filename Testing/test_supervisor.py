@@ -0,0 +1,153 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+import sys
+import time
+import unittest
+
+from testfixtures import LogCapture
+
+import IRC_sockselect as IRC
+from IRC_supervisor import Backoff, Supervisor
+from Testing.fake_ircd import FakeIRCd
+from Testing.polling import run_until
+
+
+class test_Backoff(unittest.TestCase):
+
+    def test_grows_to_cap(self):
+        backoff = Backoff(base=1, cap=10, random=lambda: 1.0)
+        self.assertEqual([backoff.delay(n) for n in range(6)], 
+                         [1, 2, 4, 8, 10, 10])
+        
+    def test_jitter(self):
+        backoff = Backoff(base=1, cap=10, random=lambda: .5)
+        self.assertEqual(backoff.delay(2), 2)
+        self.assertEqual(backoff.delay(10 ** 6), 5)
+        
+        
+class test_Supervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.log_capture = LogCapture()
+        self.ircd = FakeIRCd()
+        self.ircd.start()
+        self.IRC_ = IRC.IRC_member("Nickname")
+        self.supervisor = Supervisor(self.IRC_, 
+                                     Backoff(base=.05, cap=.2),
+                                     ping_interval=.3, ping_timeout=.3)
+        self.hostname = "127.0.0.1"
+        self.assertEqual(self.IRC_.join_server(self.hostname, self.ircd.port), 
+                         0)
+        run_until(self.IRC_, lambda: self.hostname in self.IRC_.serv_to_prefix)
+        
+    def tearDown(self):
+        self.IRC_.leave_server(self.hostname)
+        self.ircd.stop()
+        self.log_capture.uninstall()
+        
+    def test_rejoins_after_drop(self):
+        self.assertEqual(self.IRC_.join_channels(self.hostname, ['#a', '#b'], 
+                                                 timeout=2), 
+                         {'#a': 0, '#b': 0})
+        self.ircd.drop_clients()
+        run_until(self.IRC_, lambda: len(self.ircd.lines("JOIN", 2)) == 1)
+        self.assertEqual(sorted(self.ircd.lines("JOIN", 2)[0][5:].split(",")),
+                         ['#a', '#b'])
+        self.assertEqual([line.split()[0] for line in self.ircd.lines(
+                              connection=2)][:2], ['NICK', 'USER'])
+        run_until(self.IRC_, lambda: len(self.IRC_.serv_to_chan.get(
+                                   self.hostname, ())) == 2)
+        
+        stats = self.supervisor.stats(self.hostname)
+        self.assertEqual(stats["state"], Supervisor.UP)
+        self.assertEqual(stats["disconnects"], 1)
+        self.assertEqual(stats["recoveries"], 1)
+        self.assertLess(stats["last_recovery"], 2)
+        
+    def test_backs_off_while_refused(self):
+        self.ircd.refuse()
+        time.sleep(.1)
+        self.ircd.drop_clients()
+        run_until(self.IRC_, lambda: self.supervisor.stats(
+                           self.hostname)["attempts"] >= 3)
+        self.assertNotIn(self.hostname, self.IRC_.servers)
+        self.assertEqual(self.supervisor.stats(self.hostname)["state"], 
+                         Supervisor.DOWN)
+        
+        self.ircd.accept()
+        run_until(self.IRC_, lambda: self.supervisor.stats(
+                           self.hostname)["state"] == Supervisor.UP)
+        self.assertEqual(self.supervisor.stats(self.hostname)["recoveries"], 1)
+        
+    def test_reconnect_doesnt_hold_up_poll(self):
+        real = self.IRC_.resolver.getaddrinfo
+        def slow(*args):
+            time.sleep(.5)
+            return real(*args)
+        self.IRC_.resolver.getaddrinfo = slow
+        self.IRC_.resolver.forget()
+        self.supervisor.ping_timeout = 5
+        self.ircd.drop_clients()
+        run_until(self.IRC_, lambda: self.supervisor.stats(
+            self.hostname)["state"] != Supervisor.UP)
+        
+        longest, deadline = 0, time.time() + 5
+        while self.supervisor.stats(self.hostname)["state"] != Supervisor.UP:
+            self.assertLess(time.time(), deadline)
+            started = time.time()
+            self.IRC_.poll(.01)
+            longest = max(longest, time.time() - started)
+        self.assertEqual(self.supervisor.stats(self.hostname)["recoveries"], 1)
+        self.assertLess(longest, .25)
+        
+    def test_keepalive_ping(self):
+        run_until(self.IRC_, lambda: self.supervisor.keepalive.stats(
+                           self.hostname)["pings"])
+        self.assertTrue(self.ircd.lines("PING"))
+        self.assertEqual(self.supervisor.stats(self.hostname)["disconnects"], 
+                         0)
+        
+    def test_silent_server_is_dropped(self):
+        self.ircd.silent = True
+        run_until(self.IRC_, lambda: self.supervisor.stats(
+                           self.hostname)["disconnects"] == 1)
+        self.ircd.silent = False
+        run_until(self.IRC_, lambda: self.supervisor.stats(
+                           self.hostname)["state"] == Supervisor.UP)
+        
+    def test_leave_server_stops_reconnecting(self):
+        self.ircd.drop_clients()
+        run_until(self.IRC_, lambda: self.hostname in self.supervisor.links)
+        self.IRC_.leave_server(self.hostname)
+        self.IRC_.poll(.3)
+        self.assertNotIn(self.hostname, self.IRC_.servers)
+        self.assertEqual(self.supervisor.links, {})
+
+
+if __name__ == '__main__':
+    for case in (test_Backoff, test_Supervisor):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)
@@ -0,0 +1,198 @@
+"""
+Copyright (c) 2014 Dan Obermiller
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+You should have received a copy of the MIT License along with this program.
+If not, see <http://opensource.org/licenses/MIT>
+"""
+
+
+from contextlib import closing
+import socket
+import sys
+import unittest
+
+from testfixtures import LogCapture
+
+from IRC_sendqueue import SendQueue, TokenBucket
+import IRC_sockasyncore
+import IRC_sockselect as IRC
+from IRC_tls import RESUMPTION, SessionCache, TLS
+from Testing.fake_ircd import CERTFILE, FakeIRCd, tls_context
+from Testing.polling import run_until
+
+
+class test_SessionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = SessionCache(maxsize=2)
+
+    def test_least_recently_used_dropped(self):
+        self.cache.put(("a", 6697), "session a")
+        self.cache.put(("b", 6697), "session b")
+        self.assertEqual(self.cache.get(("a", 6697)), "session a")
+        self.cache.put(("c", 6697), "session c")
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get(("b", 6697)))
+        self.assertEqual(self.cache.get(("a", 6697)), "session a")
+
+    def test_put_replaces(self):
+        self.cache.put(("a", 6697), "old")
+        self.cache.put(("a", 6697), "new")
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get(("a", 6697)), "new")
+
+    def test_forget(self):
+        self.cache.put(("a", 6697), "session a")
+        self.cache.forget(("a", 6697))
+        self.cache.forget(("b", 6697))
+        self.assertIsNone(self.cache.get(("a", 6697)))
+
+
+class test_sockselect_TLS(unittest.TestCase):
+
+    def setUp(self):
+        self.log_capture = LogCapture()
+        self.ircd = FakeIRCd(tls=tls_context())
+        self.ircd.start()
+        self.hostname = "localhost"
+        self.tls = TLS(cafile=CERTFILE)
+        self.IRC_ = IRC.IRC_member("Nickname", tls=self.tls)
+
+    def tearDown(self):
+        self.IRC_.leave_server(self.hostname)
+        self.ircd.stop()
+        self.log_capture.uninstall()
+        IRC.HANDSHAKE_TIMEOUT = 10
+
+    def connect(self):
+        self.IRC_.send_queues[self.hostname] = SendQueue(TokenBucket(.01))
+        self.assertEqual(self.IRC_.join_server(self.hostname, self.ircd.port),
+                         0)
+        run_until(self.IRC_,
+                  lambda: self.hostname in self.IRC_.serv_to_isupport)
+
+    def test_registers_over_tls(self):
+        self.connect()
+        self.assertEqual(self.ircd.lines(),
+                         ["NICK Nickname", "USER Nickname 0 * :Nickname"])
+        self.assertEqual(self.tls.handshakes, 1)
+        self.assertNotIn(self.hostname, self.IRC_.handshakes)
+
+        self.IRC_.join_channel(self.hostname, "#chan")
+        run_until(self.IRC_,
+                  lambda: "#chan" in self.IRC_.serv_to_chan[self.hostname])
+        self.IRC_.send_channel_message(self.hostname, "#chan", "hello")
+        run_until(self.IRC_, lambda: self.ircd.lines("PRIVMSG"))
+        self.assertEqual(self.ircd.lines("PRIVMSG"), ["PRIVMSG #chan :hello"])
+
+    def test_plaintext_per_server(self):
+        plain = FakeIRCd()
+        plain.start()
+        try:
+            self.assertEqual(self.IRC_.join_server("127.0.0.1", plain.port,
+                                                   tls=None), 0)
+            run_until(self.IRC_,
+                      lambda: "127.0.0.1" in self.IRC_.serv_to_isupport)
+            self.assertEqual(self.tls.handshakes, 0)
+            self.IRC_.leave_server("127.0.0.1")
+        finally:
+            plain.stop()
+
+    @unittest.skipUnless(RESUMPTION, "ssl can't resume sessions")
+    def test_reconnect_resumes(self):
+        self.connect()
+        self.IRC_.leave_server(self.hostname)
+        self.assertEqual(len(self.tls.sessions), 1)
+        self.connect()
+        self.assertEqual(self.tls.handshakes, 2)
+        self.assertEqual(self.tls.resumed, 1)
+
+    def test_untrusted_certificate(self):
+        self.IRC_.tls = TLS(context=TLS().context)
+        ## The server can answer before join_server has stopped shaking hands
+        self.assertIn(self.IRC_.join_server(self.hostname, self.ircd.port),
+                      (0, 2))
+        run_until(self.IRC_, lambda: self.hostname not in self.IRC_.servers)
+        self.assertIn("TLS handshake with localhost failed",
+                      str(self.log_capture))
+
+    def test_stalled_handshake_dropped(self):
+        IRC.HANDSHAKE_TIMEOUT = .2
+        listener = socket.socket()
+        with closing(listener):
+            listener.bind((self.hostname, 0))
+            listener.listen(1)
+            self.assertEqual(self.IRC_.join_server(
+                self.hostname, listener.getsockname()[1]), 0)
+            self.assertIn(self.hostname, self.IRC_.handshakes)
+            run_until(self.IRC_,
+                      lambda: self.hostname not in self.IRC_.servers)
+        self.assertIn("no TLS handshake in 0.2s", str(self.log_capture))
+
+
+
+class test_sockasyncore_TLS(unittest.TestCase):
+
+    def setUp(self):
+        self.ircd = FakeIRCd(tls=tls_context())
+        self.ircd.start()
+        self.tls = TLS(cafile=CERTFILE)
+        self.IRC_ = IRC_sockasyncore.IRC_member("Nickname", tls=self.tls)
+
+    def tearDown(self):
+        for server in list(self.IRC_.servers):
+            self.IRC_.leave_server(server)
+        run_until(self.IRC_, lambda: not self.IRC_.map)
+        self.ircd.stop()
+
+    def test_registers_over_tls(self):
+        self.assertEqual(self.IRC_.join_server("localhost", self.ircd.port), 0)
+        run_until(self.IRC_, lambda: len(self.ircd.lines()) >= 2)
+        self.assertEqual(self.ircd.lines(),
+                         ["NICK Nickname", "USER Nickname 0 * :Nickname"])
+        self.assertEqual(self.tls.handshakes, 1)
+        run_until(self.IRC_, lambda: any(" 001 " in line for line in
+                                   self.IRC_.replies.get("localhost", [])))
+
+    def test_welcome_saves_session(self):
+        saved = []
+        self.tls.save = lambda sock, hostname, port: saved.append(
+            (hostname, port))
+        self.assertEqual(self.IRC_.join_server("localhost", self.ircd.port), 0)
+        run_until(self.IRC_, lambda: "localhost" in self.IRC_.replies)
+        ## Once when the handshake is done, and again on RPL_WELCOME
+        self.assertEqual(saved, [("localhost", self.ircd.port)] * 2)
+
+    def test_untrusted_certificate(self):
+        with LogCapture() as log_capture:
+            self.assertEqual(self.IRC_.join_server(
+                "localhost", self.ircd.port, tls=TLS(context=TLS().context)),
+                0)
+            run_until(self.IRC_, lambda: self.IRC_.servers["localhost"].closed)
+        self.assertIn("TLS handshake with localhost failed", str(log_capture))
+        self.assertEqual(self.ircd.lines(), [])
+
+
+if __name__ == '__main__':
+    for case in (test_SessionCache, test_sockselect_TLS, 
+                 test_sockasyncore_TLS):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(sys.stdout, verbosity=1).run(suite)